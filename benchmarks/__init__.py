@@ -0,0 +1,8 @@
+"""Load generation for the LMS API.
+
+``seed_lms`` builds a synthetic dataset with bulk inserts and
+``run_workload`` replays a scripted mix of API traffic against it, in
+process through the Django test client or over HTTP against a running
+server, and reports the throughput and latency percentiles per endpoint
+as JSON.
+"""
@@ -0,0 +1,77 @@
+import json
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+from django.test import Client, override_settings
+
+from courses.fragments import local_cache
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure the CPU time per request of the list endpoints rendered by the "
+        "serializers and from the JSON fragment cache, with the response cache off."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=50, help="Requests per endpoint and mode.")
+        parser.add_argument("--page-size", type=int, default=100)
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("--requests must be positive.")
+        # the course with the most students, for the lessons and students pages
+        course = (
+            Course.objects.annotate(students=Count("enrollments"))
+            .order_by("-students", "pk")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if course is None:
+            raise CommandError("No course to benchmark, seed some first.")
+        page = f"page_size={options['page_size']}"
+        paths = [
+            f"/api/courses/?{page}",
+            f"/api/courses/?{page}&include=lessons",
+            f"/api/courses/{course}/lessons/?{page}",
+            f"/api/courses/{course}/enrolled-students/?{page}",
+        ]
+        results = {}
+        for mode, enabled in [("serializers", False), ("fragments", True)]:
+            local_cache.clear()
+            with override_settings(
+                ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+                LMS_RESPONSE_CACHE={**settings.LMS_RESPONSE_CACHE, "ENABLED": False},
+                LMS_FRAGMENT_CACHE={**settings.LMS_FRAGMENT_CACHE, "ENABLED": enabled},
+            ):
+                client = Client()
+                for path in paths:
+                    # warms up the fragment cache
+                    self.fetch(client, path)
+                    start = time.process_time()
+                    for _ in range(options["requests"]):
+                        self.fetch(client, path)
+                    elapsed = time.process_time() - start
+                    results.setdefault(path, {})[mode] = round(
+                        elapsed / options["requests"] * 1000, 3
+                    )
+        for by_mode in results.values():
+            by_mode["speedup"] = round(by_mode["serializers"] / max(by_mode["fragments"], 1e-6), 2)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for path, by_mode in results.items():
+            self.stdout.write(
+                f"{path}\n  serializers {by_mode['serializers']} ms CPU  "
+                f"fragments {by_mode['fragments']} ms CPU  ({by_mode['speedup']}x)"
+            )
+
+    def fetch(self, client, path):
+        response = client.get(path)
+        if response.status_code >= 400:
+            raise CommandError(f"{path} returned {response.status_code}.")
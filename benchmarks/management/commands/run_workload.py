@@ -0,0 +1,57 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+
+from benchmarks.workload import SCENARIOS, HttpTarget, TestClientTarget, run_workload
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a scripted mix of API traffic (term-start, exam-week or mixed) and "
+        "report the throughput and p50/p95/p99 latency per endpoint as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", choices=list(SCENARIOS), default="mixed")
+        parser.add_argument("--requests", type=int, default=1000)
+        parser.add_argument("--concurrency", type=int, default=8)
+        parser.add_argument(
+            "--url",
+            help="Base URL of a running server, e.g. http://127.0.0.1:8000 "
+            "(default: in process through the test client).",
+        )
+        parser.add_argument("--seed", type=int, help="Random seed of the request plan.")
+        parser.add_argument(
+            "--output", "-o", help="File to write the JSON report to (default: standard output)."
+        )
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        target = HttpTarget(options["url"]) if options["url"] else TestClientTarget()
+        # the test client sends its requests to the host "testserver"
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            try:
+                report = run_workload(
+                    options["scenario"],
+                    target,
+                    requests=options["requests"],
+                    concurrency=options["concurrency"],
+                    random_seed=options["seed"],
+                )
+            except ValueError as error:
+                raise CommandError(str(error))
+
+        output = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w") as file:
+                file.write(output + "\n")
+            self.stdout.write(
+                f"{report['total']['requests']} requests, "
+                f"{report['total']['requests_per_second']} req/s, "
+                f"report written to {options['output']}."
+            )
+        else:
+            self.stdout.write(output)
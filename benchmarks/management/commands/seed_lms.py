@@ -0,0 +1,61 @@
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.seed import seed
+
+
+class Command(BaseCommand):
+    help = "Fill the database with a synthetic dataset for benchmarks, using bulk inserts."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--teachers", type=int, default=10)
+        parser.add_argument("--courses", type=int, default=100)
+        parser.add_argument("--lessons", type=int, default=20, help="Lessons per course.")
+        parser.add_argument("--students", type=int, default=10000)
+        parser.add_argument(
+            "--enrollments", type=int, default=3,
+            help="Average number of courses a student enrolls in.",
+        )
+        parser.add_argument(
+            "--progress", type=float, default=0.3,
+            help="Average fraction of the course lessons an enrolled student completed.",
+        )
+        parser.add_argument(
+            "--prefix", default="bench",
+            help="Prefix of the created usernames and course titles.",
+        )
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--seed", type=int, help="Random seed, for reproducible datasets.")
+
+    def handle(self, *args, **options):
+        if options["courses"] and options["teachers"] < 1:
+            raise CommandError("Courses need at least one teacher.")
+        if not 0 <= options["progress"] <= 1:
+            raise CommandError("--progress must be between 0 and 1.")
+        if User.objects.filter(username__startswith=f"{options['prefix']}-").exists():
+            raise CommandError(
+                f"The database was already seeded with the prefix {options['prefix']!r}, "
+                "pass another --prefix."
+            )
+
+        start = time.perf_counter()
+        counts = seed(
+            options["teachers"],
+            options["courses"],
+            options["lessons"],
+            options["students"],
+            options["enrollments"],
+            progress=options["progress"],
+            prefix=options["prefix"],
+            batch_size=options["batch_size"],
+            random_seed=options["seed"],
+            log=self.stderr.write if options["verbosity"] > 1 else None,
+        )
+        rows = sum(counts.values())
+        self.stdout.write(
+            f"Created {rows} rows in {time.perf_counter() - start:.1f}s: "
+            + ", ".join(f"{count} {name}" for name, count in counts.items())
+            + "."
+        )
@@ -0,0 +1,179 @@
+"""Synthetic LMS datasets built with bulk inserts.
+
+Students are created a chunk at a time together with their enrollments
+and progress, so memory use does not grow with the number of students.
+Course popularity follows a Zipf-like distribution and every enrollment
+completes a prefix of the course lessons, on average ``progress`` of them.
+The ``lesson_count`` and ``completed_lessons`` counters are filled in
+directly since bulk inserts skip the signals maintaining them.
+
+Enrollments and progress, most of the rows, are inserted as plain value
+tuples with ``executemany``: building model instances for ``bulk_create``
+costs several times more than the inserts themselves.
+"""
+
+import random
+import time
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+
+from courses.cache import bump_version
+from courses.helpers import chunked
+from courses.models import Course, Enrollment, Lesson, Student, StudentProgress, Teacher
+
+
+def create(model, objects, batch_size):
+    objects = model.objects.bulk_create(objects, batch_size=batch_size)
+    if objects and objects[0].pk is None:
+        raise RuntimeError(
+            "Seeding needs a database returning the ids of bulk inserted rows "
+            "(SQLite 3.35+, PostgreSQL or MariaDB 10.5+)."
+        )
+    return objects
+
+
+def insert_rows(model, fields, rows, batch_size):
+    """Insert ``rows``, tuples of the values of ``fields``, without model instances."""
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(model._meta.get_field(name).column) for name in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    sql = f"INSERT INTO {quote(model._meta.db_table)} ({columns}) VALUES ({placeholders})"
+    with connection.cursor() as cursor:
+        for chunk in chunked(rows, batch_size):
+            cursor.executemany(sql, chunk)
+
+
+def create_users(names, password, batch_size):
+    return create(User, [User(username=name, password=password) for name in names], batch_size)
+
+
+def completed_count(rng, lesson_count, progress):
+    if progress <= 0 or not lesson_count:
+        return 0
+    if progress >= 1:
+        return lesson_count
+    # beta distribution with mean ``progress``: most students stop early, a few finish
+    return round(rng.betavariate(2 * progress, 2 * (1 - progress)) * lesson_count)
+
+
+def seed(
+    teachers,
+    courses,
+    lessons,
+    students,
+    enrollments,
+    progress=0.3,
+    prefix="bench",
+    batch_size=5000,
+    random_seed=None,
+    log=None,
+):
+    """Create the dataset and return the number of rows created per model.
+
+    ``lessons`` is the number of lessons per course and ``enrollments`` the
+    average number of courses a student enrolls in.
+    """
+    rng = random.Random(random_seed)
+    log = log or (lambda message: None)
+    password = make_password(None)
+    counts = dict.fromkeys(
+        ["teachers", "courses", "lessons", "students", "enrollments", "progress"], 0
+    )
+    start = time.perf_counter()
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+
+    with transaction.atomic():
+        users = create_users(
+            [f"{prefix}-teacher-{i}" for i in range(teachers)], password, batch_size
+        )
+        teacher_objects = create(
+            Teacher, [Teacher(user=user, bio="") for user in users], batch_size
+        )
+        course_objects = create(
+            Course,
+            [
+                Course(
+                    title=f"{prefix} course {i}",
+                    description="",
+                    teacher=rng.choice(teacher_objects),
+                    lesson_count=lessons,
+                )
+                for i in range(courses)
+            ],
+            batch_size,
+        )
+        course_lessons = {course.pk: [] for course in course_objects}
+        courses_per_chunk = max(1, batch_size // max(lessons, 1))
+        for chunk_start in range(0, courses, courses_per_chunk):
+            chunk = course_objects[chunk_start : chunk_start + courses_per_chunk]
+            for lesson in create(
+                Lesson,
+                [
+                    Lesson(title=f"Lesson {i + 1}", course=course, media_type="video")
+                    for course in chunk
+                    for i in range(lessons)
+                ],
+                batch_size,
+            ):
+                course_lessons[lesson.course_id].append(lesson.pk)
+    counts.update(teachers=teachers, courses=courses, lessons=courses * lessons)
+    log(f"Created {teachers} teachers, {courses} courses and {courses * lessons} lessons.")
+
+    course_ids = list(course_lessons)
+    # popular courses first: weight 1 / rank
+    cum_weights = list(accumulate(1 / rank for rank in range(1, courses + 1)))
+    per_student = min(enrollments, courses)
+    for chunk_start in range(0, students, batch_size):
+        size = min(batch_size, students - chunk_start)
+        with transaction.atomic():
+            users = create_users(
+                [f"{prefix}-student-{i}" for i in range(chunk_start, chunk_start + size)],
+                password,
+                batch_size,
+            )
+            student_objects = create(
+                Student, [Student(user=user) for user in users], batch_size
+            )
+            enrollment_rows = []
+            progress_rows = []
+            for student in student_objects:
+                wanted = min(courses, rng.randint(1, 2 * per_student - 1)) if per_student else 0
+                chosen = set()
+                while len(chosen) < wanted:
+                    chosen.update(
+                        rng.choices(course_ids, cum_weights=cum_weights, k=wanted - len(chosen))
+                    )
+                for course_id in chosen:
+                    lesson_ids = course_lessons[course_id]
+                    completed = completed_count(rng, len(lesson_ids), progress)
+                    enrollment_rows.append((student.pk, course_id, now, completed))
+                    progress_rows.extend(
+                        (student.pk, lesson_id, course_id, now)
+                        for lesson_id in lesson_ids[:completed]
+                    )
+            insert_rows(
+                Enrollment,
+                ["student", "course", "enrollment_date", "completed_lessons"],
+                enrollment_rows,
+                batch_size,
+            )
+            insert_rows(
+                StudentProgress,
+                ["student", "lesson", "course", "date_completed"],
+                progress_rows,
+                batch_size,
+            )
+        counts["students"] += size
+        counts["enrollments"] += len(enrollment_rows)
+        counts["progress"] += len(progress_rows)
+        log(
+            f"{counts['students']}/{students} students, {counts['enrollments']} enrollments, "
+            f"{counts['progress']} progress rows ({time.perf_counter() - start:.1f}s)."
+        )
+
+    bump_version("catalog")
+    return counts
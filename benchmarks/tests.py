@@ -0,0 +1,78 @@
+import json
+import tempfile
+from io import StringIO
+from pathlib import Path
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TransactionTestCase
+
+from benchmarks.workload import OPERATIONS
+from courses.helpers import find_stale_progress_counters
+from courses.models import Course, Enrollment, Lesson, Student, StudentProgress
+
+
+class SeedTests(TransactionTestCase):
+
+    def test_seed(self):
+        call_command(
+            "seed_lms", "--teachers", "2", "--courses", "5", "--lessons", "4",
+            "--students", "30", "--enrollments", "2", "--batch-size", "7", "--seed", "1",
+            stdout=StringIO(),
+        )
+        self.assertEqual(Course.objects.count(), 5)
+        self.assertEqual(Lesson.objects.count(), 20)
+        self.assertEqual(Student.objects.count(), 30)
+        self.assertGreater(Enrollment.objects.count(), 0)
+        self.assertGreater(StudentProgress.objects.count(), 0)
+        courses, enrollments = find_stale_progress_counters(
+            Course.objects.values_list("pk", flat=True)
+        )
+        self.assertFalse(courses.exists())
+        self.assertFalse(enrollments.exists())
+
+        with self.assertRaises(CommandError):
+            call_command("seed_lms", "--students", "1", stdout=StringIO())
+
+
+class WorkloadTests(TransactionTestCase):
+
+    def test_workload_report(self):
+        call_command(
+            "seed_lms", "--courses", "3", "--lessons", "5", "--students", "20",
+            "--seed", "1", stdout=StringIO(),
+        )
+        with tempfile.TemporaryDirectory() as directory:
+            output = Path(directory) / "report.json"
+            # concurrent writers fail on the shared-cache in-memory test database
+            call_command(
+                "run_workload", "--scenario", "mixed", "--requests", "60",
+                "--concurrency", "1", "--seed", "1", "--output", str(output),
+                stdout=StringIO(),
+            )
+            report = json.loads(output.read_text())
+        self.assertEqual(report["scenario"], "mixed")
+        self.assertGreaterEqual(report["total"]["requests"], 60)
+        self.assertEqual(report["total"]["errors"], 0)
+        self.assertLessEqual(set(report["endpoints"]), set(OPERATIONS))
+        for endpoint in report["endpoints"].values():
+            self.assertLessEqual(endpoint["p50_ms"], endpoint["p99_ms"])
+
+    def test_empty_database(self):
+        with self.assertRaises(CommandError):
+            call_command("run_workload", "--requests", "1", stdout=StringIO())
+
+
+class RenderingBenchmarkTests(TransactionTestCase):
+
+    def test_benchmark_rendering(self):
+        call_command(
+            "seed_lms", "--courses", "3", "--lessons", "5", "--students", "20",
+            "--seed", "1", stdout=StringIO(),
+        )
+        stdout = StringIO()
+        call_command("benchmark_rendering", "--requests", "2", "--json", stdout=stdout)
+        results = json.loads(stdout.getvalue())
+        self.assertEqual(len(results), 4)
+        for result in results.values():
+            self.assertEqual(set(result), {"serializers", "fragments", "speedup"})
@@ -0,0 +1,294 @@
+"""Scripted API traffic replayed against the test client or a live server.
+
+A scenario is a weighted mix of operations; every operation picks its
+arguments from a sample of the seeded courses, lessons and enrollments and
+issues one request. ``term-start`` is dominated by catalog browsing and
+enrollment spikes, ``exam-week`` by ``save-progress`` bursts and progress
+dashboards.
+"""
+
+import json
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.db import connection, connections
+from django.test import Client
+
+from courses.models import Course, Enrollment, Lesson, Student
+
+SAMPLE_SIZE = 1000
+# consecutive save-progress requests of one student in a burst
+BURST_SIZE = 5
+
+SCENARIOS = {
+    "term-start": {
+        "catalog": 30,
+        "course-detail": 20,
+        "lessons": 20,
+        "enroll": 20,
+        "dashboard": 10,
+    },
+    "exam-week": {
+        "lessons": 10,
+        "save-progress": 45,
+        "students-progress": 20,
+        "dashboard": 25,
+    },
+    "mixed": {
+        "catalog": 15,
+        "course-detail": 10,
+        "lessons": 15,
+        "enroll": 10,
+        "save-progress": 25,
+        "students-progress": 10,
+        "dashboard": 15,
+    },
+}
+
+
+class TestClientTarget:
+    """Serves the requests in process, through the Django test client."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def request(self, method, path, data=None):
+        if not hasattr(self.local, "client"):
+            self.local.client = Client()
+        client = self.local.client
+        if method == "POST":
+            response = client.post(path, data, content_type="application/json")
+        else:
+            response = client.get(path)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        return response.status_code
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpTarget:
+    """Sends the requests to a running server at ``base_url``."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, path, data=None):
+        body = json.dumps(data).encode() if data is not None else None
+        request = urllib.request.Request(
+            self.base_url + path,
+            data=body,
+            method=method,
+            headers={"Content-Type": "application/json"} if body else {},
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as error:
+            return error.code
+
+    def close(self):
+        pass
+
+
+class Dataset:
+    """A random sample of the courses, lessons, students and enrollments."""
+
+    def __init__(self, rng, sample_size=SAMPLE_SIZE):
+        self.courses = sample_ids(rng, Course.objects.all(), sample_size)
+        self.students = sample_ids(rng, Student.objects.all(), sample_size)
+        enrollments = sample_ids(rng, Enrollment.objects.all(), sample_size)
+        self.enrollments = list(
+            Enrollment.objects.filter(pk__in=enrollments).values_list("student_id", "course_id")
+        )
+        courses = {course for _, course in self.enrollments} | set(self.courses)
+        self.lessons = {}
+        for lesson, course in Lesson.objects.filter(course_id__in=courses).values_list(
+            "id", "course_id"
+        ):
+            self.lessons.setdefault(course, []).append(lesson)
+        if not self.courses or not self.students:
+            raise ValueError("No courses or students to run the workload on, seed some first.")
+
+
+def sample_ids(rng, queryset, size):
+    """Up to ``size`` random primary keys of ``queryset`` without loading them all."""
+    bounds = queryset.order_by("pk").values_list("pk", flat=True)
+    first, last = bounds.first(), bounds.last()
+    if first is None:
+        return []
+    starts = sorted(rng.randint(first, last) for _ in range(size))
+    ids = set()
+    for start in starts:
+        pk = bounds.filter(pk__gte=start).first()
+        if pk is not None:
+            ids.add(pk)
+    return sorted(ids)
+
+
+def catalog(rng, data):
+    return [("catalog", "GET", "/api/courses/", None)]
+
+
+def course_detail(rng, data):
+    return [("course-detail", "GET", f"/api/courses/{rng.choice(data.courses)}/", None)]
+
+
+def lessons(rng, data):
+    return [("lessons", "GET", f"/api/courses/{rng.choice(data.courses)}/lessons/", None)]
+
+
+def enroll(rng, data):
+    course = rng.choice(data.courses)
+    return [
+        (
+            "enroll",
+            "POST",
+            f"/api/courses/{course}/enroll/",
+            {"student": rng.choice(data.students)},
+        )
+    ]
+
+
+def save_progress(rng, data):
+    if not data.enrollments:
+        return enroll(rng, data)
+    student, course = rng.choice(data.enrollments)
+    course_lessons = data.lessons.get(course)
+    if not course_lessons:
+        return lessons(rng, data)
+    return [
+        (
+            "save-progress",
+            "POST",
+            f"/api/courses/{course}/lessons/{lesson}/save-progress/",
+            {"student": student},
+        )
+        for lesson in rng.sample(course_lessons, min(BURST_SIZE, len(course_lessons)))
+    ]
+
+
+def students_progress(rng, data):
+    if not data.enrollments:
+        return catalog(rng, data)
+    student, course = rng.choice(data.enrollments)
+    return [
+        (
+            "students-progress",
+            "GET",
+            f"/api/courses/{course}/students-progress/?student={student}",
+            None,
+        )
+    ]
+
+
+def dashboard(rng, data):
+    return [
+        ("dashboard", "GET", f"/api/students/{rng.choice(data.students)}/dashboard/", None)
+    ]
+
+
+OPERATIONS = {
+    "catalog": catalog,
+    "course-detail": course_detail,
+    "lessons": lessons,
+    "enroll": enroll,
+    "save-progress": save_progress,
+    "students-progress": students_progress,
+    "dashboard": dashboard,
+}
+
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, round(percent / 100 * (len(values) - 1)))]
+
+
+def summarize(timings, errors, elapsed):
+    return {
+        "requests": len(timings),
+        "errors": errors,
+        "requests_per_second": round(len(timings) / elapsed, 1) if elapsed else None,
+        "p50_ms": round(percentile(timings, 50) * 1000, 2),
+        "p95_ms": round(percentile(timings, 95) * 1000, 2),
+        "p99_ms": round(percentile(timings, 99) * 1000, 2),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_workload(scenario, target, requests=1000, concurrency=8, random_seed=None):
+    """Replay about ``requests`` requests of ``scenario`` and return the report.
+
+    Requests are issued by ``concurrency`` threads; the report has the
+    throughput and latency percentiles overall and per endpoint.
+    """
+    rng = random.Random(random_seed)
+    data = Dataset(rng)
+    weights = SCENARIOS[scenario]
+    plan = []
+    planned = 0
+    while planned < requests:
+        (operation,) = rng.choices(list(weights), weights=list(weights.values()))
+        # the requests of a burst are sent one after the other by the same worker
+        plan.append(OPERATIONS[operation](rng, data))
+        planned += len(plan[-1])
+
+    started_at = datetime.now(timezone.utc).isoformat()
+    lock = threading.Lock()
+    timings = {}
+    errors = {}
+
+    def worker(batches):
+        try:
+            for batch in batches:
+                for name, method, path, body in batch:
+                    start = time.perf_counter()
+                    status = target.request(method, path, body)
+                    elapsed = time.perf_counter() - start
+                    with lock:
+                        timings.setdefault(name, []).append(elapsed)
+                        errors[name] = errors.get(name, 0) + (status >= 400)
+        finally:
+            target.close()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(worker, [plan[i::concurrency] for i in range(concurrency)]))
+    elapsed = time.perf_counter() - start
+
+    all_timings = [timing for values in timings.values() for timing in values]
+    return {
+        "scenario": scenario,
+        "target": type(target).__name__,
+        "database": connection.vendor,
+        "commit": get_commit(),
+        "started_at": started_at,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 3),
+        "total": summarize(all_timings, sum(errors.values()), elapsed),
+        "endpoints": {
+            name: summarize(values, errors[name], elapsed)
+            for name, values in sorted(timings.items())
+        },
+    }
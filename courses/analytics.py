@@ -0,0 +1,194 @@
+"""Vectorized progress analytics of a course.
+
+The progress of a course is aggregated by the database into one row per
+student and per lesson (see ``load_course_progress``), loaded as integer
+arrays, and the statistics are computed with NumPy instead of row by row.
+Times are converted to epoch seconds by the database so no datetime
+objects are built. Memory use follows the number of students and lessons,
+not the number of progress rows.
+
+NumPy is an optional dependency, ``course_analytics`` raises
+``AnalyticsUnavailable`` when it is not installed.
+"""
+
+from itertools import islice
+
+from django.db.models import BigIntegerField, Count, Func, Max
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .models import StudentProgress
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+LOAD_CHUNK_SIZE = 100_000
+# students per query when discounting the completions of unenrolled students
+STALE_CHUNK_SIZE = 500
+DISTRIBUTION_BINS = 10
+
+
+class AnalyticsUnavailable(APIException):
+    status_code = status.HTTP_501_NOT_IMPLEMENTED
+    default_detail = "Course analytics need NumPy (pip install numpy)."
+
+
+class EpochSeconds(Func):
+    """Seconds since the epoch of a datetime expression, computed by the database."""
+
+    output_field = BigIntegerField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            # doubled twice: by the template and by the sqlite placeholder conversion
+            compiler, connection, template="CAST(strftime('%%%%s', %(expressions)s) AS INTEGER)",
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template="EXTRACT(EPOCH FROM %(expressions)s)::bigint",
+            **extra_context,
+        )
+
+    def as_mysql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection, template="UNIX_TIMESTAMP(%(expressions)s)", **extra_context
+        )
+
+
+def iter_arrays(rows, dtype):
+    """The tuples of ``rows`` as 2-D arrays of at most ``LOAD_CHUNK_SIZE`` rows."""
+    while chunk := list(islice(rows, LOAD_CHUNK_SIZE)):
+        yield np.array(chunk, dtype=dtype)
+
+
+def load_array(rows, columns):
+    arrays = list(iter_arrays(rows, np.int64))
+    return np.concatenate(arrays) if arrays else np.empty((0, columns), np.int64)
+
+
+def load_course_progress(course):
+    """Arrays of the course lessons, enrollments and progress.
+
+    Returns ``(lesson_ids, per_lesson, student_ids, enrolled_at, completed,
+    last_completion)``: the sorted lesson ids with their completion counts,
+    and the sorted ids of the enrolled students with their enrollment time,
+    completion count and last completion time.
+
+    The progress is aggregated by the database per student (on the
+    ``(course, student, lesson)`` index) and per lesson (on the lesson
+    index) rather than shipped row by row. Completions of students no
+    longer enrolled are subtracted from the lesson counts.
+    """
+    lessons = load_array(
+        course.lessons.order_by("id")
+        .annotate(completed=Count("progress"))
+        .values_list("id", "completed")
+        .iterator(chunk_size=LOAD_CHUNK_SIZE),
+        2,
+    )
+    lesson_ids, per_lesson = lessons[:, 0], lessons[:, 1]
+    enrollments = load_array(
+        course.enrollments.order_by("student_id")
+        .annotate(enrolled_at=EpochSeconds("enrollment_date"))
+        .values_list("student_id", "enrolled_at")
+        .iterator(chunk_size=LOAD_CHUNK_SIZE),
+        2,
+    )
+    student_ids, enrolled_at = enrollments[:, 0], enrollments[:, 1]
+    progress = load_array(
+        StudentProgress.objects.filter(course=course)
+        .values("student_id")
+        .order_by("student_id")
+        .annotate(completed=Count("*"), last_completion=EpochSeconds(Max("date_completed")))
+        .values_list("student_id", "completed", "last_completion")
+        .iterator(chunk_size=LOAD_CHUNK_SIZE),
+        3,
+    )
+
+    positions = np.searchsorted(student_ids, progress[:, 0])
+    enrolled = positions < len(student_ids)
+    enrolled[enrolled] = student_ids[positions[enrolled]] == progress[enrolled, 0]
+    completed = np.zeros(len(student_ids), dtype=np.int64)
+    last_completion = np.zeros(len(student_ids), dtype=np.int64)
+    completed[positions[enrolled]] = progress[enrolled, 1]
+    last_completion[positions[enrolled]] = progress[enrolled, 2]
+
+    stale = progress[~enrolled, 0].tolist()
+    for start in range(0, len(stale), STALE_CHUNK_SIZE):
+        rows = (
+            StudentProgress.objects.filter(
+                course=course, student_id__in=stale[start : start + STALE_CHUNK_SIZE]
+            )
+            .values("lesson_id")
+            .order_by()
+            .annotate(completed=Count("*"))
+            .values_list("lesson_id", "completed")
+        )
+        for lesson_id, count in rows:
+            per_lesson[np.searchsorted(lesson_ids, lesson_id)] -= count
+    return lesson_ids, per_lesson, student_ids, enrolled_at, completed, last_completion
+
+
+def summarize(values):
+    if not len(values):
+        return None
+    return {
+        "mean": round(float(values.mean()), 2),
+        "median": round(float(np.median(values)), 2),
+        "p90": round(float(np.percentile(values, 90)), 2),
+    }
+
+
+def course_analytics(course):
+    """Completion distribution, per-lesson funnel and time to complete of a course."""
+    if np is None:
+        raise AnalyticsUnavailable()
+    (
+        lesson_ids,
+        per_lesson,
+        student_ids,
+        enrolled_at,
+        completed,
+        last_completion,
+    ) = load_course_progress(course)
+    students, lessons = len(student_ids), len(lesson_ids)
+
+    percent = completed * 100 / lessons if lessons else np.zeros(students)
+    counts, edges = np.histogram(percent, bins=DISTRIBUTION_BINS, range=(0, 100))
+
+    # lessons in course order (by id), drop-off relative to the previous lesson
+    previous = np.concatenate(([students], per_lesson[:-1]))
+    rate = per_lesson / max(students, 1)
+    drop_off = np.where(previous > 0, 1 - per_lesson / np.maximum(previous, 1), 0)
+
+    # time from enrollment to the last completion of the students who finished
+    finished = completed == lessons if lessons else np.zeros(students, dtype=bool)
+    time_to_complete = (last_completion - enrolled_at)[finished]
+
+    return {
+        "students": students,
+        "lessons": lessons,
+        "completions": int(completed.sum()),
+        "finished": int(finished.sum()),
+        "completion": summarize(percent),
+        "distribution": [
+            {"from": float(low), "to": float(high), "students": int(count)}
+            for low, high, count in zip(edges[:-1], edges[1:], counts)
+        ],
+        "funnel": [
+            {
+                "lesson": int(lesson_id),
+                "completed": int(count),
+                "rate": round(float(lesson_rate), 4),
+                "drop_off": round(float(lesson_drop_off), 4),
+            }
+            for lesson_id, count, lesson_rate, lesson_drop_off in zip(
+                lesson_ids, per_lesson, rate, drop_off
+            )
+        ],
+        "time_to_complete_seconds": summarize(np.maximum(time_to_complete, 0)),
+    }
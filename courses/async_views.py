@@ -0,0 +1,181 @@
+"""Async (ASGI-native) versions of the read-heavy endpoints.
+
+Served under ``/api/async/`` with the same responses as the DRF viewsets,
+but written as plain async views on the async ORM so that under ASGI a slow
+query does not hold a worker thread per request. Independent queries are
+issued together with ``asyncio.gather``.
+
+Django still runs each async ORM query through ``sync_to_async`` on the
+thread that owns the connection, so queries of one request are not
+executed in parallel by the database; what is saved is the thread hop per
+request and the threads blocked while waiting. The response cache of the
+synchronous list endpoints is not used here. Compare both paths with the
+``benchmark_async`` command.
+"""
+
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework.request import Request
+
+from .helpers import get_course_progress_rows, get_course_students_progress
+from .models import Course, Lesson, Student
+from .pagination import KeysetPagination
+from .progress_journal import get_progress_journal
+from .serializers import LessonSerializer, media_path
+
+COURSE_FIELDS = ["id", "title", "description", "teacher_id", "lesson_count"]
+STREAM_CHUNK_SIZE = 2000
+
+
+def course_data(row):
+    row = dict(row)
+    row["teacher"] = row.pop("teacher_id")
+    return row
+
+
+def error(detail, status):
+    return JsonResponse({"detail": detail}, status=status)
+
+
+async def astream_json_list(key, items, chunk_size):
+    """Async version of ``helpers.stream_json_list``."""
+    yield f'{{"{key}": ['.encode()
+    separator = b""
+    chunk = []
+    async for item in items:
+        chunk.append(json.dumps(item))
+        if len(chunk) == chunk_size:
+            yield separator + ",".join(chunk).encode()
+            separator = b","
+            chunk = []
+    if chunk:
+        yield separator + ",".join(chunk).encode()
+    yield b"]}"
+
+
+async def course_list(request):
+    paginator = KeysetPagination()
+    rows = await paginator.apaginate_values(Course.objects.values(*COURSE_FIELDS), request)
+    return JsonResponse(paginator.get_async_paginated_data([course_data(row) for row in rows]))
+
+
+async def course_detail(request, pk):
+    try:
+        row = await Course.objects.values(*COURSE_FIELDS).aget(pk=pk)
+    except Course.DoesNotExist:
+        return error("No Course matches the given query.", 404)
+    return JsonResponse(course_data(row))
+
+
+async def lesson_list(request, course_pk):
+    paginator = KeysetPagination()
+    exists, rows = await asyncio.gather(
+        Course.objects.filter(pk=course_pk).aexists(),
+        paginator.apaginate_values(
+            Lesson.objects.filter(course_id=course_pk).values(*LessonSerializer.Meta.fields),
+            request,
+        ),
+    )
+    if not exists:
+        return JsonResponse(["Course not found."], status=400, safe=False)
+    for row in rows:
+        if row["media"]:
+            row["media"] = request.build_absolute_uri(media_path(course_pk, row["id"]))
+        else:
+            row["media"] = None
+    return JsonResponse(paginator.get_async_paginated_data(rows))
+
+
+async def enrolled_students(request, pk):
+    if not await Course.objects.filter(pk=pk).aexists():
+        return error("Course not found.", 404)
+    fields = ["id", "username", "email", "first_name", "last_name"]
+    student_fields = [
+        "student_id",
+        "student__user__username",
+        "student__user__email",
+        "student__user__first_name",
+        "student__user__last_name",
+    ]
+    enrollments = Course(pk=pk).enrollments.all()
+    paginator = KeysetPagination()
+    if paginator.wants_pagination(Request(request)):
+        # pages of enrollments, as the synchronous endpoint
+        rows = await paginator.apaginate_values(
+            enrollments.values("id", *student_fields), request
+        )
+        students_data = [
+            dict(zip(fields, [row[field] for field in student_fields])) for row in rows
+        ]
+        return JsonResponse(
+            paginator.get_async_paginated_data(students_data, "enrolled_students")
+        )
+    # values() rather than values_list(), whose aiterator() runs the query
+    # outside of sync_to_async
+    rows = (
+        enrollments.order_by("id")
+        .values(*student_fields)
+        .aiterator(chunk_size=STREAM_CHUNK_SIZE)
+    )
+
+    async def students():
+        async for row in rows:
+            yield dict(zip(fields, row.values()))
+
+    return StreamingHttpResponse(
+        astream_json_list("enrolled_students", students(), STREAM_CHUNK_SIZE),
+        content_type="application/json",
+    )
+
+
+async def students_progress(request, pk):
+    student_pk = request.GET.get("student")
+    course = Course(pk=pk)
+
+    async def get_student():
+        if not student_pk:
+            return None
+        return await Student.objects.filter(pk=student_pk).afirst()
+
+    paginator = KeysetPagination()
+    paginate = paginator.wants_pagination(Request(request))
+
+    async def get_rows():
+        rows = get_course_progress_rows(course)
+        if student_pk:
+            rows = rows.filter(student_id=student_pk)
+        if paginate:
+            return await paginator.apaginate_values(rows, request)
+        return [row async for row in rows]
+
+    # the course lesson counter, the student and the enrollment rows are independent
+    lesson_count, student, rows = await asyncio.gather(
+        Course.objects.filter(pk=pk).values_list("lesson_count", flat=True).afirst(),
+        get_student(),
+        get_rows(),
+    )
+    if lesson_count is None:
+        return error("Course not found.", 404)
+    if student_pk and student is None:
+        return error("Student not found.", 404)
+
+    course.lesson_count = lesson_count
+    if settings.LMS_PROGRESS_WRITE_BEHIND:
+        pending = await sync_to_async(get_progress_journal().pending)(
+            student.pk if student else None,
+            course.lessons.values_list("pk", flat=True),
+        )
+        students_data = await sync_to_async(get_course_students_progress)(
+            course, student, pending, rows=rows
+        )
+    else:
+        students_data = get_course_students_progress(course, rows=rows)
+    if paginate:
+        return JsonResponse(
+            paginator.get_async_paginated_data(students_data, "students_progress")
+        )
+    return JsonResponse({"students_progress": students_data})
@@ -0,0 +1,159 @@
+"""Content-addressed storage of lesson media.
+
+Every distinct media content is stored once, as a ``MediaBlob`` under
+``blobs/<2 hex digits>/<sha256><extension>``, and the lessons with that
+content point their ``media`` at the blob file. A blob is referenced by the
+lessons linked to it; ``collect_garbage`` (the ``collect_media_blobs``
+command) deletes the blobs no lesson references anymore.
+"""
+
+import os
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from .ingest import extract_metadata, read_head, sniff_media_type
+from .models import Lesson, MediaBlob
+
+
+def get_storage():
+    return MediaBlob._meta.get_field("file").storage
+
+
+def blob_name(digest, filename):
+    extension = os.path.splitext(filename)[1].lower()
+    return f"blobs/{digest[:2]}/{digest}{extension}"
+
+
+def find_blob(digest, size=None):
+    """The blob with ``digest``, marked as used, or None."""
+    blobs = MediaBlob.objects.filter(digest=digest)
+    if size is not None:
+        blobs = blobs.filter(size=size)
+    blob = blobs.first()
+    if blob is not None:
+        # restarts the grace period of a blob the garbage collection may be about to delete
+        blob.save(update_fields=["used_at"])
+    return blob
+
+
+def store_blob(file, digest, size, filename):
+    """Return the blob with the content of ``file``, storing it if it is new."""
+    blob = find_blob(digest)
+    if blob is not None:
+        return blob
+    storage = get_storage()
+    name = storage.save(blob_name(digest, filename), file)
+    try:
+        with transaction.atomic():
+            return MediaBlob.objects.create(digest=digest, file=name, size=size)
+    except IntegrityError:
+        # stored concurrently by another upload of the same content
+        storage.delete(name)
+        return MediaBlob.objects.get(digest=digest)
+
+
+def link_blob(lesson, blob):
+    """Point the lesson media at ``blob`` (the lesson is not saved)."""
+    lesson.blob = blob
+    lesson.media.name = blob.file.name
+
+
+def attach_media(lesson, file):
+    """Set the lesson media to ``file``, stored once per content when its checksum is known."""
+    if not lesson.media_checksum:
+        # deferred metadata, deduplicated by the extract_media_metadata job
+        lesson.blob = None
+        lesson.media = file
+        return
+    link_blob(lesson, store_blob(file, lesson.media_checksum, lesson.media_size, file.name))
+
+
+def blob_metadata(blob):
+    """The lesson media fields for the content of ``blob``, copied from a lesson using it."""
+    fields = ["media_type", "media_size", "media_checksum", "media_duration", "media_page_count"]
+    metadata = (
+        Lesson.objects.filter(blob=blob).exclude(media_checksum="").values(*fields).first()
+    )
+    if metadata is None:
+        with blob.file.open("rb") as file:
+            media_type = sniff_media_type(read_head(file))
+            metadata = {"media_type": media_type, **extract_metadata(file, media_type)}
+    return metadata
+
+
+def find_blobs_media(digests):
+    """The lesson media fields of the stored blobs with ``digests``, by digest.
+
+    ``find_blob`` and ``blob_metadata`` for many blobs in a few queries: the
+    metadata is copied from the first lesson using each blob and only read
+    from the file of blobs no lesson uses. Unknown digests are left out.
+    """
+    blobs = {blob.pk: blob for blob in MediaBlob.objects.filter(digest__in=digests)}
+    if not blobs:
+        return {}
+    MediaBlob.objects.filter(pk__in=blobs).update(used_at=timezone.now())
+    fields = ["media_type", "media_size", "media_checksum", "media_duration", "media_page_count"]
+    first_lessons = (
+        Lesson.objects.filter(blob__in=blobs)
+        .exclude(media_checksum="")
+        .values("blob")
+        .annotate(first=Min("pk"))
+        .values("first")
+    )
+    metadata = {
+        row.pop("blob"): row
+        for row in Lesson.objects.filter(pk__in=first_lessons).values("blob", *fields)
+    }
+    return {
+        blob.digest: {
+            **(metadata.get(pk) or blob_metadata(blob)),
+            "blob": blob,
+            "media": blob.file.name,
+        }
+        for pk, blob in blobs.items()
+    }
+
+
+def deduplicate_lesson_media(lesson):
+    """Move the media of a lesson stored before blobs existed into its blob.
+
+    Needs the extracted checksum; the old file is deleted unless another
+    lesson still uses it.
+    """
+    if lesson.blob_id is not None or not lesson.media_checksum:
+        return lesson
+    old_name = lesson.media.name
+    with lesson.media.open("rb") as file:
+        blob = store_blob(file, lesson.media_checksum, lesson.media_size, old_name)
+    link_blob(lesson, blob)
+    lesson.save(update_fields=["blob", "media"])
+    if old_name != blob.file.name and not Lesson.objects.filter(media=old_name).exists():
+        get_storage().delete(old_name)
+    return lesson
+
+
+def collect_garbage(grace_period, dry_run=False):
+    """Delete the blobs without lessons unused for longer than ``grace_period``.
+
+    Returns the number of blobs and bytes freed.
+    """
+    cutoff = timezone.now() - grace_period
+    candidates = MediaBlob.objects.annotate(references=Count("lessons")).filter(
+        references=0, used_at__lt=cutoff
+    )
+    count = size = 0
+    storage = get_storage()
+    for blob in candidates.iterator():
+        if not dry_run:
+            # a lesson may have been linked since the candidates were listed
+            deleted, _ = MediaBlob.objects.filter(
+                pk=blob.pk, lessons__isnull=True, used_at__lt=cutoff
+            ).delete()
+            if not deleted:
+                continue
+            storage.delete(blob.file.name)
+        count += 1
+        size += blob.size
+    return count, size
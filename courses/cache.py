@@ -0,0 +1,151 @@
+"""Response cache for the read-mostly catalog endpoints.
+
+Cached responses are grouped in scopes (``catalog`` for the course list,
+``course:<id>`` for a course and its lessons, ``student:<id>`` for a
+student dashboard). Every scope has a version
+number that is part of the cache keys, so bumping it from the model signals
+in ``courses.signals`` invalidates exactly the responses of that scope.
+"""
+
+import hashlib
+import json
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .fragments import Fragment
+from .renderers import render_json
+from .routers import read_database
+
+
+def get_cache():
+    return caches[settings.LMS_RESPONSE_CACHE["ALIAS"]]
+
+
+def get_versions(scopes):
+    cache = get_cache()
+    keys = [f"lms:version:{scope}" for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # start from the clock so a flushed version never repeats
+            cache.add(key, time.time_ns(), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def bump_version(*scopes):
+    cache = get_cache()
+    for scope in scopes:
+        key = f"lms:version:{scope}"
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def get_or_compute(key, compute, timeout=None):
+    """Return the cached value of ``key``, computing it at most once at a time.
+
+    Concurrent misses wait for the request holding the lock instead of all
+    hitting the database (single flight). When the lock is released without
+    a cached value (the holder failed or its response is not cacheable) a
+    waiter takes the lock over; they compute it themselves if no value shows
+    up within ``LOCK_TIMEOUT`` seconds.
+    """
+    config = settings.LMS_RESPONSE_CACHE
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        return value
+
+    lock_key = f"{key}:lock"
+    deadline = time.monotonic() + config["LOCK_TIMEOUT"]
+    while True:
+        if cache.add(lock_key, 1, config["LOCK_TIMEOUT"]):
+            try:
+                value = compute()
+                cache.set(key, value, timeout or config["TIMEOUT"])
+                return value
+            finally:
+                cache.delete(lock_key)
+
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            value = cache.get(key)
+            if value is not None:
+                return value
+            if cache.get(lock_key) is None:
+                break
+        else:
+            return compute()
+
+
+class Uncacheable(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def cached_response(scopes, timeout=None):
+    """Cache the data of a viewset action in the scopes ``scopes(view)``.
+
+    The key covers the scope versions, the host and the full query string.
+    The rendered JSON is cached, hits are not rendered again. Responses carry an ``ETag`` and ``If-None-Match`` hits return 304.
+    ``timeout()`` optionally returns the lifetime of the cached responses,
+    ``LMS_RESPONSE_CACHE["TIMEOUT"]`` by default; when it returns 0 or
+    ``scopes(view)`` returns None the action is not cached. Responses are
+    always computed from the primary database, even for requests routed to a
+    replica.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            lifetime = timeout() if timeout else None
+            if not settings.LMS_RESPONSE_CACHE["ENABLED"] or lifetime == 0:
+                return method(self, request, *args, **kwargs)
+            view_scopes = scopes(self)
+            if view_scopes is None:
+                return method(self, request, *args, **kwargs)
+
+            versions = get_versions(view_scopes)
+            query = sorted(request.query_params.lists())
+            key = hashlib.md5(
+                json.dumps(
+                    [method.__qualname__, view_scopes, versions, request.get_host(),
+                     request.path, query]
+                ).encode()
+            ).hexdigest()
+
+            def compute():
+                # from the primary: the scope versions were bumped when it
+                # committed, a lagging replica would cache the old data under
+                # the new version
+                token = read_database.set(None)
+                try:
+                    response = method(self, request, *args, **kwargs)
+                finally:
+                    read_database.reset(token)
+                if response.status_code != status.HTTP_200_OK:
+                    raise Uncacheable(response)
+                content = render_json(response.data)
+                return {"etag": f'"{hashlib.md5(content).hexdigest()}"', "content": content}
+
+            try:
+                entry = get_or_compute(f"lms:rendered:{key}", compute, lifetime)
+            except Uncacheable as error:
+                return error.response
+            headers = {"ETag": entry["etag"]}
+            if_none_match = request.headers.get("If-None-Match", "")
+            if entry["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+                return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+            # sent as is by FragmentJSONRenderer
+            return Response(Fragment(entry["content"]), headers=headers)
+
+        return wrapper
+
+    return decorator
@@ -0,0 +1,259 @@
+"""Streamed exports of course progress.
+
+Two reports are available: ``summary``, one row per enrollment with the
+completed lesson count and percentage, and ``matrix``, one row per enrolled
+student of a course with a 0/1 column per lesson. Rows are read with
+``QuerySet.iterator()`` (server-side cursors where the database supports
+them) and written in chunks of ``chunk_size`` rows, so memory use depends
+on the chunk size, not on the course size.
+
+Two file formats are written:
+
+* ``csv``
+* ``columnar``, a compact binary format laid out like Parquet: the magic
+  ``LMSC``, one row group per chunk in which every column is stored
+  contiguously (little-endian integer arrays of the narrowest width that
+  fits the row group, float64 and uint8 arrays, and strings as integer end
+  offsets followed by their UTF-8 bytes), then a JSON footer with the
+  schema and the position and integer typecode of every column chunk, the
+  footer length as uint32 and the magic again. ``read_columnar`` reads it
+  back.
+
+Completions queued by the progress write-behind journal and not flushed yet
+are not included.
+"""
+
+import csv
+import io
+import json
+import struct
+import sys
+from array import array
+
+from .models import Enrollment, StudentProgress
+
+MAGIC = b"LMSC"
+# integers are stored in the narrowest of these that fits the row group
+INT_TYPECODES = [("b", -(2**7), 2**7), ("h", -(2**15), 2**15), ("i", -(2**31), 2**31)]
+FILE_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "columnar": ("application/octet-stream", "lmsc"),
+}
+KINDS = ["summary", "matrix"]
+
+SUMMARY_COLUMNS = [
+    ("course_id", "int"),
+    ("student_id", "int"),
+    ("username", "string"),
+    ("completed_lessons", "int"),
+    ("lesson_count", "int"),
+    ("progress", "float64"),
+]
+
+
+def iter_summary_rows(course_ids, chunk_size):
+    """Chunks of ``SUMMARY_COLUMNS`` rows of the enrollments of the courses."""
+    rows = (
+        Enrollment.objects.filter(course_id__in=course_ids)
+        .order_by("course_id", "id")
+        .values_list(
+            "course_id",
+            "student_id",
+            "student__user__username",
+            "completed_lessons",
+            "course__lesson_count",
+        )
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for course_id, student_id, username, completed, lesson_count in rows:
+        progress = round(completed / lesson_count * 100, 2) if lesson_count else 0.0
+        chunk.append((course_id, student_id, username, completed, lesson_count, progress))
+        if len(chunk) == chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def get_matrix_columns(lesson_ids):
+    return [
+        ("student_id", "int"),
+        ("username", "string"),
+        *[(f"lesson_{lesson_id}", "uint8") for lesson_id in lesson_ids],
+    ]
+
+
+def iter_matrix_rows(course, lesson_ids, chunk_size):
+    """Chunks of student x lesson completion rows of a course.
+
+    The completions of each chunk of students are fetched with one query on
+    the ``(course, student, lesson)`` progress index.
+    """
+    positions = {lesson_id: i for i, lesson_id in enumerate(lesson_ids)}
+    students = (
+        course.enrollments.order_by("student_id")
+        .values_list("student_id", "student__user__username")
+        .iterator(chunk_size=chunk_size)
+    )
+    chunk = []
+    for student in students:
+        chunk.append(student)
+        if len(chunk) == chunk_size:
+            yield matrix_chunk(course, chunk, positions)
+            chunk = []
+    if chunk:
+        yield matrix_chunk(course, chunk, positions)
+
+
+def matrix_chunk(course, students, positions):
+    completed = {}
+    progress = StudentProgress.objects.filter(
+        course=course, student_id__in=[student_id for student_id, _ in students]
+    ).values_list("student_id", "lesson_id")
+    for student_id, lesson_id in progress:
+        if lesson_id in positions:
+            completed.setdefault(student_id, bytearray(len(positions)))[
+                positions[lesson_id]
+            ] = 1
+    empty = bytes(len(positions))
+    return [
+        (student_id, username, *completed.get(student_id, empty))
+        for student_id, username in students
+    ]
+
+
+def write_csv(columns, chunks):
+    """Yield the CSV of the row ``chunks``, one encoded block per chunk."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, _ in columns])
+    for chunk in chunks:
+        writer.writerows(chunk)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def to_little_endian(values):
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values.tobytes()
+
+
+def int_typecode(values):
+    low, high = min(values, default=0), max(values, default=0)
+    for typecode, minimum, maximum in INT_TYPECODES:
+        if minimum <= low and high < maximum:
+            return typecode
+    return "q"
+
+
+def encode_column(kind, values):
+    """Return ``(typecode, bytes)`` of a column chunk."""
+    if kind == "uint8":
+        return "B", bytes(values)
+    if kind == "float64":
+        return "d", to_little_endian(array("d", values))
+    if kind == "string":
+        encoded = [value.encode() for value in values]
+        ends = []
+        end = 0
+        for value in encoded:
+            end += len(value)
+            ends.append(end)
+        typecode = int_typecode(ends)
+        return typecode, to_little_endian(array(typecode, ends)) + b"".join(encoded)
+    typecode = int_typecode(values)
+    return typecode, to_little_endian(array(typecode, values))
+
+
+def write_columnar(columns, chunks):
+    """Yield the columnar file of the row ``chunks``, one row group per chunk."""
+    yield MAGIC
+    position = len(MAGIC)
+    row_groups = []
+    for chunk in chunks:
+        column_chunks = []
+        for (_, kind), values in zip(columns, zip(*chunk)):
+            typecode, data = encode_column(kind, values)
+            column_chunks.append([position, len(data), typecode])
+            position += len(data)
+            yield data
+        row_groups.append({"rows": len(chunk), "columns": column_chunks})
+    footer = json.dumps(
+        {
+            "version": 1,
+            "columns": [{"name": name, "type": kind} for name, kind in columns],
+            "row_groups": row_groups,
+        }
+    ).encode()
+    yield footer + struct.pack("<I", len(footer)) + MAGIC
+
+
+def from_little_endian(typecode, data):
+    values = array(typecode, data)
+    if sys.byteorder != "little":
+        values.byteswap()
+    return values
+
+
+def decode_column(kind, typecode, data, rows):
+    if kind == "string":
+        split = rows * array(typecode).itemsize
+        strings = data[split:]
+        start = 0
+        values = []
+        for end in from_little_endian(typecode, data[:split]):
+            values.append(strings[start:end].decode())
+            start = end
+        return values
+    return from_little_endian(typecode, data).tolist()
+
+
+def read_columnar(file):
+    """Read a columnar export from a seekable binary file into ``{column: values}``."""
+    file.seek(-8, io.SEEK_END)
+    length, magic = struct.unpack("<I4s", file.read(8))
+    if magic != MAGIC:
+        raise ValueError("Not a columnar progress export.")
+    file.seek(-8 - length, io.SEEK_END)
+    footer = json.loads(file.read(length))
+    data = {column["name"]: [] for column in footer["columns"]}
+    for group in footer["row_groups"]:
+        for column, (offset, size, typecode) in zip(footer["columns"], group["columns"]):
+            file.seek(offset)
+            data[column["name"]].extend(
+                decode_column(column["type"], typecode, file.read(size), group["rows"])
+            )
+    return data
+
+
+def count_rows(chunks, progress):
+    done = 0
+    for chunk in chunks:
+        yield chunk
+        done += len(chunk)
+        progress(done)
+
+
+def export_progress(kind, file_format, courses, chunk_size=5000, progress=None):
+    """Yield the ``kind`` report of ``courses`` in ``file_format``.
+
+    The matrix report covers a single course. ``progress`` is called with the
+    number of rows written after each chunk.
+    """
+    if kind == "matrix":
+        (course,) = courses
+        lesson_ids = list(course.lessons.order_by("id").values_list("id", flat=True))
+        columns = get_matrix_columns(lesson_ids)
+        chunks = iter_matrix_rows(course, lesson_ids, chunk_size)
+    else:
+        columns = SUMMARY_COLUMNS
+        chunks = iter_summary_rows([course.pk for course in courses], chunk_size)
+    if progress is not None:
+        chunks = count_rows(chunks, progress)
+    writer = write_csv if file_format == "csv" else write_columnar
+    return writer(columns, chunks)
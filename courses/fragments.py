@@ -0,0 +1,121 @@
+"""Cache of the rendered JSON of courses, lessons and students.
+
+List serializers (``FragmentListSerializer``) render every object once per
+version: its JSON bytes are cached under the model, the serializer variant
+(the rendered fields and the host of the URLs), the primary key and the
+``version`` of the row, which every save changes (``VersionedModel``). A
+changed object thus gets a new key and nothing has to be invalidated.
+
+Fragments are looked up in a bounded in-process LRU, then in the shared
+cache (``LMS_FRAGMENT_CACHE``), and only the misses are serialized. The
+``Fragment`` objects put in the response data are spliced as is into the
+response by ``courses.renderers.FragmentJSONRenderer``.
+"""
+
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.renderers import JSONRenderer
+
+
+class Fragment(Mapping):
+    """The rendered JSON of an object, only parsed when read from Python."""
+
+    __slots__ = ["content", "_data"]
+
+    def __init__(self, content):
+        self.content = content
+        self._data = None
+
+    def data(self):
+        if self._data is None:
+            self._data = json.loads(self.content)
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data()[key]
+
+    def __iter__(self):
+        return iter(self.data())
+
+    def __len__(self):
+        return len(self.data())
+
+    def __repr__(self):
+        return f"Fragment({self.content!r})"
+
+
+class LocalCache:
+    """A thread-safe LRU mapping of at most ``size`` keys."""
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                value = self.entries.get(key)
+                if value is not None:
+                    self.entries.move_to_end(key)
+                    found[key] = value
+        return found
+
+    def set_many(self, values):
+        with self.lock:
+            self.entries.update(values)
+            for key in values:
+                self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+local_cache = LocalCache(settings.LMS_FRAGMENT_CACHE["LOCAL_SIZE"])
+
+
+def get_variant(serializer):
+    """Key prefix of the fragments of ``serializer``, a list serializer child."""
+    request = serializer.context.get("request")
+    parts = [
+        serializer.Meta.model._meta.label_lower,
+        type(serializer).__name__,
+        list(serializer.fields),
+        # file fields render absolute URLs
+        request.build_absolute_uri("/") if request else None,
+    ]
+    return hashlib.md5(json.dumps(parts).encode()).hexdigest()
+
+
+def get_fragments(serializer, instances):
+    """``Fragment`` objects of ``instances`` rendered by ``serializer``."""
+    config = settings.LMS_FRAGMENT_CACHE
+    variant = get_variant(serializer)
+    keys = [f"lms:fragment:{variant}:{obj.pk}:{obj.version}" for obj in instances]
+    found = local_cache.get_many(keys)
+    missing = [key for key in keys if key not in found]
+    if missing:
+        shared = caches[config["ALIAS"]].get_many(missing)
+        local_cache.set_many(shared)
+        found.update(shared)
+
+    rendered = {}
+    renderer = JSONRenderer()
+    for key, obj in zip(keys, instances):
+        if key not in found:
+            rendered[key] = renderer.render(serializer.to_representation(obj))
+    if rendered:
+        caches[config["ALIAS"]].set_many(rendered, config["TIMEOUT"])
+        local_cache.set_many(rendered)
+        found.update(rendered)
+    return [Fragment(found[key]) for key in keys]
@@ -1,32 +1,436 @@
-from django.db.models import Count, F
+import json
+from itertools import islice
 
-def get_course_students_progress(course, student=None):
+from django.db import connection, transaction
+from django.db.models import Count, F, Max, OuterRef, Prefetch, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Course, Enrollment, Lesson, Student, StudentProgress, new_version
+from .search import schedule_index
+from .serializers import LessonSerializer
+from .signals import invalidate_responses
+
+# lesson fields copied by clone_course, the media is shared with the original
+LESSON_COPY_FIELDS = [
+    "title",
+    "media",
+    "media_type",
+    "media_size",
+    "media_checksum",
+    "media_duration",
+    "media_page_count",
+    "blob",
+]
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def stream_json_list(key, items, chunk_size=1000):
+    """Yield ``{"<key>": [...]}`` as JSON chunks of ``chunk_size`` items."""
+    yield f'{{"{key}": ['.encode()
+    separator = b""
+    for chunk in chunked(items, chunk_size):
+        yield separator + ",".join(json.dumps(item) for item in chunk).encode()
+        separator = b","
+    yield b"]}"
+
+
+def get_course_progress_rows(course, student=None):
+    enrollments = course.enrollments.all()
+    if student:
+        enrollments = enrollments.filter(student=student)
+    return enrollments.values(
+        "id", "student_id", "student__user__username", "completed_lessons"
+    )
+
+
+def get_course_students_progress(course, student=None, pending=None, rows=None):
+    """Progress of the students enrolled in ``course``.
+
+    ``pending`` is an optional set of ``(student_id, lesson_id)`` completions
+    not written to the database yet (see ``courses.progress_journal``), merged
+    in so students read their own writes. ``rows`` restricts the result to a
+    page of ``get_course_progress_rows``.
+    """
+    lesson_count = course.lesson_count
+    if rows is None:
+        rows = get_course_progress_rows(course, student)
+    unsaved = count_unsaved_progress(course, pending) if pending else {}
     students_data = []
-    lesson_count = course.lessons.count() if course.lessons else 0
-    if not student:
-        enrollments = course.enrollments.annotate(
-            progress_count=Count(
-                "student__progress",
-                filter=F("student__progress__lesson__course_id") == course.id,
+    for row in rows:
+        completed_lessons = row["completed_lessons"] + unsaved.get(row["student_id"], 0)
+        students_data.append(
+            {
+                "student": row["student__user__username"],
+                "progress": (
+                    f"{(completed_lessons / lesson_count) * 100:.2f}%"
+                    if lesson_count > 0
+                    else "0%"
+                ),
+            }
+        )
+
+    return students_data
+
+
+def count_unsaved_progress(course, events):
+    """Per student, how many of ``events`` are new completions in ``course``."""
+    students = {student for student, _ in events}
+    lessons = set(
+        course.lessons.filter(id__in={lesson for _, lesson in events}).values_list(
+            "id", flat=True
+        )
+    )
+    unsaved = {(student, lesson) for student, lesson in events if lesson in lessons}
+    unsaved -= set(
+        StudentProgress.objects.filter(
+            student_id__in=students, lesson_id__in=lessons
+        ).values_list("student_id", "lesson_id")
+    )
+    counts = {}
+    for student, _ in unsaved:
+        counts[student] = counts.get(student, 0) + 1
+    return counts
+
+
+def get_student_dashboard(student, pending=None):
+    """Progress of ``student`` in every course they are enrolled in.
+
+    One query over the enrollments, using the ``completed_lessons`` and
+    ``lesson_count`` counters and the last completion of each course from
+    the ``(course, student, lesson)`` progress index. ``pending`` is merged
+    in like in ``get_course_students_progress``.
+    """
+    last_activity = (
+        StudentProgress.objects.filter(
+            student_id=OuterRef("student_id"), course_id=OuterRef("course_id")
+        )
+        .order_by()
+        .values("student_id")
+        .annotate(last=Max("date_completed"))
+        .values("last")
+    )
+    rows = (
+        student.enrollments.order_by("course_id")
+        .annotate(last_activity=Subquery(last_activity))
+        .values(
+            "course_id",
+            "course__title",
+            "course__lesson_count",
+            "completed_lessons",
+            "enrollment_date",
+            "last_activity",
+        )
+    )
+    unsaved = count_unsaved_student_progress(student, pending) if pending else {}
+    courses = []
+    for row in rows:
+        lesson_count = row["course__lesson_count"]
+        completed_lessons = row["completed_lessons"] + unsaved.get(row["course_id"], 0)
+        courses.append(
+            {
+                "course": row["course_id"],
+                "title": row["course__title"],
+                "lesson_count": lesson_count,
+                "completed_lessons": completed_lessons,
+                "progress": (
+                    f"{(completed_lessons / lesson_count) * 100:.2f}%"
+                    if lesson_count > 0
+                    else "0%"
+                ),
+                "enrollment_date": row["enrollment_date"],
+                "last_activity": row["last_activity"],
+            }
+        )
+    return courses
+
+
+def count_unsaved_student_progress(student, events):
+    """Per course, how many of ``events`` are new completions of ``student``."""
+    lessons = {lesson for event_student, lesson in events if event_student == student.pk}
+    unsaved = lessons - set(
+        StudentProgress.objects.filter(student=student, lesson_id__in=lessons).values_list(
+            "lesson_id", flat=True
+        )
+    )
+    counts = {}
+    for course_id in Lesson.objects.filter(id__in=unsaved).values_list(
+        "course_id", flat=True
+    ):
+        counts[course_id] = counts.get(course_id, 0) + 1
+    return counts
+
+
+def lesson_count_subquery():
+    """Number of lessons of the course referenced by the outer query."""
+    lessons = (
+        Lesson.objects.filter(course_id=OuterRef("pk"))
+        .order_by()
+        .values("course_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(lessons), 0)
+
+
+def enrollment_count_subquery():
+    """Number of students enrolled in the course referenced by the outer query."""
+    enrollments = (
+        Enrollment.objects.filter(course_id=OuterRef("pk"))
+        .order_by()
+        .values("course_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(enrollments), 0)
+
+
+def get_course_queryset(fields=None, include=()):
+    """Courses loading only what ``CourseSerializer(fields=..., include=...)`` renders.
+
+    The teacher is joined, the lessons are prefetched with one query per
+    page and the enrollment count is a subquery, so the number of queries
+    does not depend on the number of courses.
+    """
+    columns = [
+        field.name
+        for field in Course._meta.concrete_fields
+        if fields is None
+        or field.name in fields
+        or field.name in include
+        or field.primary_key
+        # keys the cached JSON of the course
+        or field.name == "version"
+    ]
+    queryset = Course.objects.all()
+    if "teacher" in include:
+        columns += [
+            "teacher__bio",
+            "teacher__user__username",
+            "teacher__user__first_name",
+            "teacher__user__last_name",
+        ]
+        queryset = queryset.select_related("teacher__user")
+    if "lessons" in include:
+        lessons = Lesson.objects.order_by("id").only(
+            "course_id", "version", *LessonSerializer.Meta.fields
+        )
+        queryset = queryset.prefetch_related(Prefetch("lessons", queryset=lessons))
+    if "enrollment_count" in include:
+        queryset = queryset.annotate(enrollment_count=enrollment_count_subquery())
+    return queryset.only(*columns)
+
+
+def completed_lessons_subquery():
+    """Number of lessons completed by the student of the outer enrollment."""
+    progress = (
+        StudentProgress.objects.filter(
+            student_id=OuterRef("student_id"), course_id=OuterRef("course_id")
+        )
+        .order_by()
+        .values("student_id")
+        .annotate(count=Count("pk"))
+        .values("count")
+    )
+    return Coalesce(Subquery(progress), 0)
+
+
+def rebuild_progress_counters(course_ids):
+    """Recompute ``Course.lesson_count`` and ``Enrollment.completed_lessons``."""
+    with transaction.atomic():
+        courses = Course.objects.filter(pk__in=course_ids).update(
+            lesson_count=lesson_count_subquery(), version=F("version") + 1
+        )
+        enrollments = Enrollment.objects.filter(course_id__in=course_ids).update(
+            completed_lessons=completed_lessons_subquery()
+        )
+        invalidate_responses("catalog", *[f"course:{pk}" for pk in course_ids])
+    return courses, enrollments
+
+
+def find_stale_progress_counters(course_ids):
+    """Return the courses and enrollments whose counters drifted."""
+    courses = (
+        Course.objects.filter(pk__in=course_ids)
+        .annotate(expected=lesson_count_subquery())
+        .exclude(lesson_count=F("expected"))
+    )
+    enrollments = (
+        Enrollment.objects.filter(course_id__in=course_ids)
+        .annotate(expected=completed_lessons_subquery())
+        .exclude(completed_lessons=F("expected"))
+    )
+    return courses, enrollments
+
+
+def bulk_enroll_students(course, student_ids, chunk_size=1000):
+    """Enroll many students at once, a few queries per chunk of ids.
+
+    Returns the number of ``created``, ``already_enrolled`` and ``unknown``
+    students; ids repeated in the input are only counted once.
+    """
+    counts = {"created": 0, "already_enrolled": 0, "unknown": 0}
+    seen = set()
+    with transaction.atomic():
+        for chunk in chunked(student_ids, chunk_size):
+            ids = set(chunk) - seen
+            seen |= ids
+            known = set(
+                Student.objects.filter(id__in=ids).values_list("id", flat=True)
+            )
+            enrolled = set(
+                course.enrollments.filter(student_id__in=known).values_list(
+                    "student_id", flat=True
+                )
+            )
+            new = known - enrolled
+            Enrollment.objects.bulk_create(
+                [Enrollment(course=course, student_id=student) for student in new],
+                ignore_conflicts=True,
+            )
+            if new:
+                # students enrolling again keep the lessons they completed
+                course.enrollments.filter(student_id__in=new).update(
+                    completed_lessons=completed_lessons_subquery()
+                )
+            # bulk_create skips the signals invalidating the dashboards
+            invalidate_responses(*[f"student:{student}" for student in new])
+            counts["created"] += len(new)
+            counts["already_enrolled"] += len(enrolled)
+            counts["unknown"] += len(ids) - len(known)
+    return counts
+
+
+def save_progress_batch(events, completed_at=None):
+    """Record many ``(student_id, lesson_id)`` completion events at once.
+
+    Events for students not enrolled in the lesson's course (or unknown
+    students/lessons) are rejected, already recorded ones are skipped.
+    ``completed_at`` optionally maps events to their completion time.
+    """
+    completed_at = completed_at or {}
+    now = timezone.now()
+    events = set(events)
+    students = {student for student, _ in events}
+    lessons = {lesson for _, lesson in events}
+    with transaction.atomic():
+        enrolled = {
+            (student, lesson): course
+            for student, lesson, course in Enrollment.objects.filter(
+                student_id__in=students, course__lessons__in=lessons
+            ).values_list("student_id", "course__lessons", "course_id")
+        }
+        accepted = events & enrolled.keys()
+        existing = accepted & set(
+            StudentProgress.objects.filter(
+                student_id__in=students, lesson_id__in=lessons
+            ).values_list("student_id", "lesson_id")
+        )
+        new = accepted - existing
+        if new:
+            StudentProgress.objects.bulk_create(
+                [
+                    StudentProgress(
+                        student_id=student,
+                        lesson_id=lesson,
+                        course_id=enrolled[(student, lesson)],
+                        date_completed=completed_at.get((student, lesson), now),
+                    )
+                    for student, lesson in new
+                ],
+                ignore_conflicts=True,
             )
+            # bulk_create skips the signals maintaining the counters
+            Enrollment.objects.filter(
+                student_id__in={student for student, _ in new},
+                course_id__in={enrolled[event] for event in new},
+            ).update(completed_lessons=completed_lessons_subquery())
+            invalidate_responses(*{f"student:{student}" for student, _ in new})
+    return {
+        "saved": len(new),
+        "already_saved": len(existing),
+        "rejected": len(events) - len(accepted),
+    }
+
+
+def insert_from_select(model, fields, rows):
+    """Insert the rows of the ``values_list`` queryset ``rows`` into ``fields``.
+
+    One ``INSERT ... SELECT``: the rows never leave the database. Returns
+    the number of rows inserted.
+    """
+    quote = connection.ops.quote_name
+    columns = ", ".join(quote(model._meta.get_field(name).column) for name in fields)
+    select, params = rows.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {quote(model._meta.db_table)} ({columns}) {select}", params
         )
-    else:
-        enrollments = course.enrollments.filter(student=student).annotate(
-            progress_count=Count(
-                "student__progress",
-                filter=F("student__progress__lesson__course_id") == course.id,
+        return cursor.rowcount
+
+
+def clone_course(course, title=None, teacher_id=None, copy_enrollments=False):
+    """Copy ``course`` with its lessons and optionally its enrollments.
+
+    The lessons and enrollments are copied by the database, a query each
+    whatever their number. Copied lessons point at the same media files (and
+    blobs) as the originals; copied enrollments start without progress.
+    Returns the new course.
+    """
+    with transaction.atomic():
+        clone = Course.objects.create(
+            title=title or course.title,
+            description=course.description,
+            teacher_id=teacher_id or course.teacher_id,
+        )
+        lessons = insert_from_select(
+            Lesson,
+            [*LESSON_COPY_FIELDS, "course", "version"],
+            course.lessons.order_by("id")
+            .annotate(clone_id=Value(clone.pk), clone_version=Value(new_version()))
+            .values_list(*LESSON_COPY_FIELDS, "clone_id", "clone_version"),
+        )
+        # the inserts skip the signals maintaining the counters and the caches
+        Course.objects.filter(pk=clone.pk).update(
+            lesson_count=lessons, version=F("version") + 1
+        )
+        clone.lesson_count = lessons
+        if copy_enrollments:
+            insert_from_select(
+                Enrollment,
+                ["student", "course", "enrollment_date", "completed_lessons"],
+                course.enrollments.order_by("id")
+                .annotate(
+                    clone_id=Value(clone.pk),
+                    enrolled_at=Value(timezone.now()),
+                    no_progress=Value(0),
+                )
+                .values_list("student", "clone_id", "enrolled_at", "no_progress"),
             )
+            students = clone.enrollments.values_list("student_id", flat=True)
+            invalidate_responses(*[f"student:{student}" for student in students])
+        invalidate_responses("catalog", f"course:{clone.pk}", "catalog:lessons")
+        # indexed with its lessons once committed
+        schedule_index(clone.pk)
+    return clone
+
+
+def import_lessons(course_id, lessons, batch_size=1000):
+    """Create lessons of a course from dicts of their fields, with bulk inserts."""
+    with transaction.atomic():
+        created = Lesson.objects.bulk_create(
+            [Lesson(course_id=course_id, **fields) for fields in lessons],
+            batch_size=batch_size,
         )
-    students_data = [
-        {
-            "student": enrollment.student.user.username,
-            "progress": (
-                f"{(enrollment.progress_count / lesson_count) * 100:.2f}%"
-                if lesson_count > 0
-                else "0%"
-            ),
-        }
-        for enrollment in enrollments
-    ]
-    
-    return students_data
\ No newline at end of file
+        # bulk_create skips the signals maintaining the counter and the caches
+        Course.objects.filter(pk=course_id).update(
+            lesson_count=F("lesson_count") + len(created), version=F("version") + 1
+        )
+        invalidate_responses("catalog", f"course:{course_id}", "catalog:lessons")
+        schedule_index(course_id)
+    return created
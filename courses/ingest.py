@@ -0,0 +1,163 @@
+"""Classification and metadata of lesson media files.
+
+The media type is sniffed from the magic bytes at the start of the file
+rather than trusted from the client's content type. Size, SHA-256 checksum,
+duration (MP4/M4A and WAV) and page count (PDF) are extracted once, when the
+media is uploaded, and stored on the ``Lesson`` so listing endpoints never
+open media files. With ``LMS_MEDIA_METADATA_INLINE`` off only the type and
+size are set at upload and a background job (or the
+``extract_media_metadata`` command) fills in the rest.
+"""
+
+import hashlib
+import re
+import struct
+
+from django.conf import settings
+
+SNIFF_SIZE = 8 * 1024
+BLOCK_SIZE = 64 * 1024
+
+AUDIO_BRANDS = {b"M4A ", b"M4B ", b"M4P ", b"F4A ", b"F4B "}
+PDF_PAGE_RE = re.compile(rb"/Type\s*/Page\b")
+
+
+def read_head(file, size=SNIFF_SIZE):
+    """The first ``size`` bytes of ``file``, leaving it at the start."""
+    file.seek(0)
+    head = file.read(size)
+    file.seek(0)
+    return head
+
+
+def sniff_media_type(head):
+    """Classify the start of a file as ``video``, ``audio``, ``pdf`` or None."""
+    if b"%PDF-" in head[:1024]:
+        return "pdf"
+    if head[4:8] == b"ftyp":
+        return "audio" if head[8:12] in AUDIO_BRANDS else "video"
+    if head[:4] == b"\x1a\x45\xdf\xa3":
+        # Matroska / WebM
+        return "video"
+    if head[:4] == b"OggS":
+        return "video" if b"\x80theora" in head else "audio"
+    if head[:4] == b"RIFF":
+        return {b"WAVE": "audio", b"AVI ": "video"}.get(head[8:12])
+    if head[:4] == b"fLaC" or head[:3] == b"ID3":
+        return "audio"
+    if len(head) > 1 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0:
+        # MPEG audio or ADTS frame sync
+        return "audio"
+    if head[:4] == b"\x00\x00\x01\xba" or (
+        len(head) > 188 and head[0] == head[188] == 0x47
+    ):
+        # MPEG program / transport stream
+        return "video"
+    return None
+
+
+def iter_boxes(file, start, end):
+    """(type, data start, box end) of the ISO base media boxes in a range."""
+    position = start
+    while position + 8 <= end:
+        file.seek(position)
+        size, kind = struct.unpack(">I4s", file.read(8))
+        header = 8
+        if size == 1:
+            size = struct.unpack(">Q", file.read(8))[0]
+            header = 16
+        elif size == 0:
+            size = end - position
+        if size < header:
+            return
+        yield kind, position + header, position + size
+        position += size
+
+
+def mp4_duration(file, size):
+    for kind, start, end in iter_boxes(file, 0, size):
+        if kind != b"moov":
+            continue
+        for child, data, _ in iter_boxes(file, start, end):
+            if child != b"mvhd":
+                continue
+            file.seek(data)
+            version = file.read(4)[0]
+            if version == 1:
+                timescale, duration = struct.unpack(">16xIQ", file.read(28))
+            else:
+                timescale, duration = struct.unpack(">8xII", file.read(16))
+            return duration / timescale if timescale else None
+    return None
+
+
+def wav_duration(file, size):
+    byte_rate = None
+    position = 12
+    while position + 8 <= size:
+        file.seek(position)
+        kind, length = struct.unpack("<4sI", file.read(8))
+        if kind == b"fmt ":
+            byte_rate = struct.unpack("<8xI", file.read(12))[0]
+        elif kind == b"data":
+            return length / byte_rate if byte_rate else None
+        position += 8 + length + length % 2
+    return None
+
+
+def extract_metadata(file, media_type):
+    """Size, checksum, duration and page count of ``file`` in one streaming pass.
+
+    Parsing only seeks to the few headers it reads; formats without a known
+    layout leave the duration or page count empty.
+    """
+    file.seek(0)
+    digest = hashlib.sha256()
+    size = pages = 0
+    tail = b""
+    while block := file.read(BLOCK_SIZE):
+        digest.update(block)
+        size += len(block)
+        if media_type == "pdf":
+            # overlap the blocks so a marker split between them still counts
+            window = tail + block
+            pages += len(PDF_PAGE_RE.findall(window)) - len(PDF_PAGE_RE.findall(tail))
+            tail = window[-32:]
+
+    head = read_head(file, 12)
+    duration = None
+    try:
+        if head[4:8] == b"ftyp":
+            duration = mp4_duration(file, size)
+        elif head[:4] == b"RIFF" and head[8:12] == b"WAVE":
+            duration = wav_duration(file, size)
+    except (struct.error, IndexError):
+        duration = None
+    file.seek(0)
+    return {
+        "media_size": size,
+        "media_checksum": digest.hexdigest(),
+        "media_duration": duration,
+        "media_page_count": pages or None,
+    }
+
+
+def describe_media(file):
+    """The ``Lesson`` media fields for an uploaded file, or None if unsupported."""
+    media_type = sniff_media_type(read_head(file))
+    if media_type is None:
+        return None
+    if settings.LMS_MEDIA_METADATA_INLINE:
+        return {"media_type": media_type, **extract_metadata(file, media_type)}
+    return {"media_type": media_type, "media_size": file.size}
+
+
+def update_media_metadata(lesson):
+    """Classify and extract the metadata of a stored lesson media file."""
+    with lesson.media.open("rb") as file:
+        media_type = sniff_media_type(read_head(file)) or lesson.media_type
+        metadata = extract_metadata(file, media_type)
+    for field, value in {"media_type": media_type, **metadata}.items():
+        setattr(lesson, field, value)
+    lesson.save(update_fields=["media_type", *metadata])
+    return lesson
@@ -0,0 +1,282 @@
+"""Opt-in per-request instrumentation.
+
+``InstrumentationMiddleware`` records, per view action, the number of SQL
+queries, the time spent in the database, serializing the response data
+(``SerializationTimingMixin``) and rendering it to JSON, and the response
+size. The values are sent back as a ``Server-Timing`` header and
+aggregated into in-process histograms served in the Prometheus text format
+by ``metrics``. Queries slower than ``SLOW_QUERY_MS`` are logged with the
+project frames that issued them.
+
+Configured by ``settings.LMS_INSTRUMENTATION``; when disabled the middleware
+removes itself from the stack.
+"""
+
+import logging
+import random
+import threading
+import time
+import traceback
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.http import HttpResponse
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (1e3, 1e4, 1e5, 1e6, 1e7, 1e8)
+
+METRICS = {
+    "lms_request_duration_seconds": ("Total request time.", DURATION_BUCKETS),
+    "lms_request_db_seconds": ("Time spent running SQL queries.", DURATION_BUCKETS),
+    "lms_request_serialize_seconds": (
+        "Time spent serializing the response data, queries included.",
+        DURATION_BUCKETS,
+    ),
+    "lms_request_render_seconds": ("Time spent rendering the response JSON.", DURATION_BUCKETS),
+    "lms_request_queries": ("Number of SQL queries.", QUERY_BUCKETS),
+    "lms_response_size_bytes": ("Response body size.", SIZE_BUCKETS),
+}
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+
+class Registry:
+    """Histograms per metric name and view label."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.histograms = {}
+
+    def observe(self, view, values):
+        with self.lock:
+            for name, value in values.items():
+                key = (name, view)
+                if key not in self.histograms:
+                    self.histograms[key] = Histogram(METRICS[name][1])
+                self.histograms[key].observe(value)
+
+    def clear(self):
+        with self.lock:
+            self.histograms.clear()
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for name, (description, _) in METRICS.items():
+                series = sorted(
+                    (view, histogram)
+                    for (metric, view), histogram in self.histograms.items()
+                    if metric == name
+                )
+                if not series:
+                    continue
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for view, histogram in series:
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{view="{view}",le="{bound:g}"}} {count}')
+                    lines.append(f'{name}_bucket{{view="{view}",le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum:g}')
+                    lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class SerializationTimer:
+    def __init__(self):
+        self.duration = 0
+        self.running = False
+
+
+serialization_timer = ContextVar("serialization_timer", default=None)
+
+
+@contextmanager
+def measure_serialization():
+    """Add the time of the block to the serialization time of the instrumented request."""
+    timer = serialization_timer.get()
+    # nested serializers are timed by the outermost one
+    if timer is None or timer.running:
+        yield
+        return
+    timer.running = True
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timer.duration += time.perf_counter() - start
+        timer.running = False
+
+
+class SerializationTimingMixin:
+    """Serializers whose ``data`` counts as serialization time."""
+
+    @property
+    def data(self):
+        with measure_serialization():
+            return super().data
+
+
+class QueryRecorder:
+    """``connection.execute_wrapper`` counting and timing SQL queries."""
+
+    def __init__(self, slow_query_seconds):
+        self.slow_query_seconds = slow_query_seconds
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            if elapsed >= self.slow_query_seconds:
+                logger.warning(
+                    "Slow query (%.1f ms): %s\n%s",
+                    elapsed * 1000,
+                    sql,
+                    "".join(traceback.format_list(project_frames())),
+                )
+
+
+def project_frames():
+    """The stack frames of the current call that belong to this project."""
+    base_dir = str(settings.BASE_DIR)
+    return [
+        frame
+        for frame in traceback.extract_stack()[:-3]
+        if frame.filename.startswith(base_dir)
+        and "site-packages" not in frame.filename
+        and not frame.filename.endswith("instrumentation.py")
+    ]
+
+
+def view_label(view_func, request):
+    cls = getattr(view_func, "cls", None)
+    if cls is None:
+        return getattr(view_func, "__name__", "unknown")
+    actions = getattr(view_func, "actions", None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f"{cls.__name__}.{action}"
+
+
+class InstrumentationMiddleware:
+    def __init__(self, get_response):
+        config = settings.LMS_INSTRUMENTATION
+        if not config.get("ENABLED"):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = config.get("SAMPLE_RATE", 1.0)
+        self.slow_query_seconds = config.get("SLOW_QUERY_MS", 100) / 1000
+
+    def __call__(self, request):
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        recorder = QueryRecorder(self.slow_query_seconds)
+        timer = SerializationTimer()
+        token = serialization_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            with self.recording(recorder):
+                response = self.get_response(request)
+        finally:
+            serialization_timer.reset(token)
+        end = time.perf_counter()
+        view = getattr(request, "_instrumented_view", "unresolved")
+        # render() runs between process_template_response and the return
+        render_start = getattr(request, "_instrumented_render_start", end)
+
+        if getattr(response, "file_to_stream", None) is not None:
+            # keep the file object so the server can still use sendfile
+            values = {
+                "lms_request_duration_seconds": end - start,
+                "lms_request_db_seconds": recorder.duration,
+                "lms_request_queries": recorder.count,
+                "lms_response_size_bytes": int(response.get("Content-Length", 0)),
+            }
+            registry.observe(view, values)
+            return response
+
+        if response.streaming:
+            response.streaming_content = self.record_stream(
+                response.streaming_content, recorder, view, start
+            )
+            return response
+
+        values = {
+            "lms_request_duration_seconds": end - start,
+            "lms_request_db_seconds": recorder.duration,
+            "lms_request_serialize_seconds": timer.duration,
+            "lms_request_render_seconds": end - render_start,
+            "lms_request_queries": recorder.count,
+            "lms_response_size_bytes": len(response.content),
+        }
+        registry.observe(view, values)
+        response["Server-Timing"] = (
+            f'db;dur={recorder.duration * 1000:.2f};desc="{recorder.count} queries", '
+            f"serialize;dur={timer.duration * 1000:.2f}, "
+            f"render;dur={(end - render_start) * 1000:.2f}, "
+            f"total;dur={(end - start) * 1000:.2f}"
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._instrumented_view = view_label(view_func, request)
+
+    def process_template_response(self, request, response):
+        request._instrumented_render_start = time.perf_counter()
+        return response
+
+    def recording(self, recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    def record_stream(self, content, recorder, view, start):
+        # streamed bodies run their queries after the view returned
+        size = 0
+        with self.recording(recorder):
+            for chunk in content:
+                size += len(chunk)
+                yield chunk
+        registry.observe(
+            view,
+            {
+                "lms_request_duration_seconds": time.perf_counter() - start,
+                "lms_request_db_seconds": recorder.duration,
+                "lms_request_queries": recorder.count,
+                "lms_response_size_bytes": size,
+            },
+        )
+
+
+def metrics(request):
+    return HttpResponse(
+        registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8"
+    )
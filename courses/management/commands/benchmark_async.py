@@ -0,0 +1,140 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+
+from benchmarks.workload import percentile
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the concurrent-request throughput of the read endpoints served "
+        "by the WSGI handler, by the ASGI handler (sync views) and by the async "
+        "views under ASGI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--course", type=int, help="Course to read (default: the first one).")
+        parser.add_argument(
+            "--requests", type=int, default=200, help="Requests per endpoint and mode."
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=16, help="Requests in flight at once."
+        )
+        parser.add_argument(
+            "--mode", action="append", dest="modes",
+            choices=["wsgi", "asgi-sync", "asgi"],
+            help="Only run the given mode (repeatable).",
+        )
+        parser.add_argument(
+            "--cache", action="store_true",
+            help="Keep the response cache of the sync endpoints (the async ones have none).",
+        )
+        parser.add_argument("--json", action="store_true", help="Print the results as JSON.")
+
+    def handle(self, *args, **options):
+        course = options["course"] or Course.objects.order_by("pk").values_list(
+            "pk", flat=True
+        ).first()
+        if course is None:
+            raise CommandError("No course to benchmark, create one first.")
+        paths = [
+            "courses/",
+            f"courses/{course}/",
+            f"courses/{course}/lessons/",
+            f"courses/{course}/enrolled-students/",
+            f"courses/{course}/students-progress/",
+        ]
+        modes = options["modes"] or ["wsgi", "asgi-sync", "asgi"]
+        results = {}
+        # requests are served in-process by the test clients
+        with override_settings(
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"],
+            LMS_RESPONSE_CACHE={
+                **settings.LMS_RESPONSE_CACHE,
+                "ENABLED": options["cache"] and settings.LMS_RESPONSE_CACHE["ENABLED"],
+            },
+        ):
+            for mode in modes:
+                self.run_mode(mode, paths, options, results)
+
+        if options["json"]:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+        for path, by_mode in results.items():
+            self.stdout.write(path)
+            for mode, result in by_mode.items():
+                self.stdout.write(
+                    f"  {mode:<10} {result['requests_per_second']:>9} req/s  "
+                    f"p50 {result['p50_ms']} ms  p95 {result['p95_ms']} ms"
+                )
+
+    def run_mode(self, mode, paths, options, results):
+        prefix = "/api/async/" if mode == "asgi" else "/api/"
+        for path in paths:
+            url = prefix + path
+            if mode == "wsgi":
+                timings, elapsed = self.run_wsgi(url, options)
+            else:
+                timings, elapsed = asyncio.run(self.run_asgi(url, options))
+            results.setdefault(path, {})[mode] = {
+                "requests_per_second": round(len(timings) / elapsed, 1),
+                "p50_ms": round(percentile(timings, 50) * 1000, 2),
+                "p95_ms": round(percentile(timings, 95) * 1000, 2),
+            }
+
+    def fetch(self, client, url):
+        start = time.perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            b"".join(response.streaming_content)
+        if response.status_code >= 400:
+            raise CommandError(f"{url} returned {response.status_code}.")
+        return time.perf_counter() - start
+
+    def run_wsgi(self, url, options):
+        def worker(count):
+            client = Client()
+            try:
+                return [self.fetch(client, url) for _ in range(count)]
+            finally:
+                connections.close_all()
+
+        concurrency = options["concurrency"]
+        counts = [
+            options["requests"] // concurrency + (i < options["requests"] % concurrency)
+            for i in range(concurrency)
+        ]
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            timings = [timing for batch in pool.map(worker, counts) for timing in batch]
+        return timings, time.perf_counter() - start
+
+    async def run_asgi(self, url, options):
+        client = AsyncClient()
+        semaphore = asyncio.Semaphore(options["concurrency"])
+
+        async def fetch():
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.get(url)
+                if response.streaming and response.is_async:
+                    async for _ in response.streaming_content:
+                        pass
+                elif response.streaming:
+                    # sync views stream from the database on a worker thread
+                    await sync_to_async(b"".join)(response.streaming_content)
+                if response.status_code >= 400:
+                    raise CommandError(f"{url} returned {response.status_code}.")
+                return time.perf_counter() - start
+
+        start = time.perf_counter()
+        timings = await asyncio.gather(*[fetch() for _ in range(options["requests"])])
+        return list(timings), time.perf_counter() - start
@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from courses.uploads import cleanup_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete abandoned chunked lesson uploads and their part files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age-hours", type=float, default=24,
+            help="Delete uploads idle for longer than this.",
+        )
+
+    def handle(self, *args, **options):
+        count = cleanup_uploads(timedelta(hours=options["max_age_hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} abandoned uploads."))
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from courses.blobs import collect_garbage
+
+
+class Command(BaseCommand):
+    help = "Delete the deduplicated media blobs no lesson references anymore."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--grace-hours", type=float, default=24,
+            help="Keep unreferenced blobs used more recently than this.",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true",
+            help="Report the blobs that would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        count, size = collect_garbage(
+            timedelta(hours=options["grace_hours"]), dry_run=options["dry_run"]
+        )
+        verb = "Would delete" if options["dry_run"] else "Deleted"
+        self.stdout.write(
+            self.style.SUCCESS(f"{verb} {count} unreferenced blobs ({size} bytes).")
+        )
@@ -0,0 +1,56 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.exports import FILE_FORMATS, KINDS, export_progress
+from courses.models import Course
+
+
+class Command(BaseCommand):
+    help = "Export the progress summary or student x lesson matrix of courses as CSV or columnar files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course", type=int, action="append", dest="courses",
+            help="Course id to export (repeatable, default: all courses for the summary).",
+        )
+        parser.add_argument("--kind", choices=KINDS, default="summary")
+        parser.add_argument("--file-format", choices=list(FILE_FORMATS), default="csv")
+        parser.add_argument(
+            "--output", "-o", help="File to write (default: standard output)."
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=5000,
+            help="Rows read and written per chunk.",
+        )
+
+    def handle(self, *args, **options):
+        courses = Course.objects.order_by("pk")
+        if options["courses"]:
+            courses = courses.filter(pk__in=options["courses"])
+        courses = list(courses.only("pk"))
+        if options["courses"] and len(courses) != len(set(options["courses"])):
+            raise CommandError("Course not found.")
+        if options["kind"] == "matrix" and len(set(options["courses"] or [])) != 1:
+            raise CommandError("The matrix export needs exactly one --course.")
+
+        start = time.perf_counter()
+        chunks = export_progress(
+            options["kind"], options["file_format"], courses, options["chunk_size"]
+        )
+        size = 0
+        output = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            for chunk in chunks:
+                output.write(chunk)
+                size += len(chunk)
+        finally:
+            if options["output"]:
+                output.close()
+            else:
+                output.flush()
+        self.stderr.write(
+            f"Exported {size} bytes in {time.perf_counter() - start:.2f}s.",
+            style_func=self.style.SUCCESS,
+        )
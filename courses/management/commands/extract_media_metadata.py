@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from courses.blobs import deduplicate_lesson_media
+from courses.ingest import update_media_metadata
+from courses.models import Lesson
+
+
+class Command(BaseCommand):
+    help = (
+        "Classify lesson media, extract its size, checksum, duration and page "
+        "count and move it to the deduplicated media blobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true",
+            help="Also process lessons whose metadata was already extracted.",
+        )
+
+    def handle(self, *args, **options):
+        lessons = Lesson.objects.exclude(media="").order_by("pk")
+        if not options["all"]:
+            lessons = lessons.filter(media_checksum="")
+        count = missing = 0
+        for lesson in lessons.iterator():
+            try:
+                deduplicate_lesson_media(update_media_metadata(lesson))
+            except FileNotFoundError:
+                missing += 1
+                self.stderr.write(f"Media of lesson {lesson.pk} is missing.")
+                continue
+            count += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Extracted metadata of {count} lessons ({missing} missing).")
+        )
@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.progress_journal import get_progress_journal
+
+
+class Command(BaseCommand):
+    help = "Write the journaled (write-behind) progress events to the database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=5000,
+            help="Number of events written per transaction.",
+        )
+        parser.add_argument(
+            "--loop", action="store_true",
+            help="Keep draining the journal until interrupted.",
+        )
+        parser.add_argument(
+            "--interval", type=float, default=1.0,
+            help="Seconds to sleep between drains with --loop.",
+        )
+
+    def handle(self, *args, **options):
+        journal = get_progress_journal()
+        while True:
+            counts = journal.flush(options["batch_size"])
+            if any(counts.values()) or not options["loop"]:
+                self.stdout.write(
+                    f"saved: {counts['saved']}, "
+                    f"already saved: {counts['already_saved']}, "
+                    f"rejected: {counts['rejected']}"
+                )
+            if not options["loop"]:
+                break
+            time.sleep(options["interval"])
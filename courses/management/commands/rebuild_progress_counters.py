@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from courses.helpers import find_stale_progress_counters, rebuild_progress_counters
+from courses.models import Course
+from jobs.queue import enqueue
+
+
+class Command(BaseCommand):
+    help = "Rebuild or verify the denormalized lesson and progress counters."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--course", type=int, action="append", dest="courses",
+            help="Only process the given course id (repeatable).",
+        )
+        parser.add_argument(
+            "--verify", action="store_true",
+            help="Report stale counters without rewriting them.",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=500,
+            help="Number of courses processed per transaction.",
+        )
+        parser.add_argument(
+            "--background", action="store_true",
+            help="Queue a job run by the workers instead of rebuilding now.",
+        )
+
+    def handle(self, *args, **options):
+        if options["background"]:
+            if options["verify"]:
+                raise CommandError("--verify cannot run in the background.")
+            job = enqueue(
+                "courses.rebuild_progress_counters",
+                course_ids=options["courses"],
+                chunk_size=options["chunk_size"],
+            )
+            self.stdout.write(self.style.SUCCESS(f"Queued job {job.pk}."))
+            return
+        course_ids = Course.objects.order_by("pk").values_list("pk", flat=True)
+        if options["courses"]:
+            course_ids = course_ids.filter(pk__in=options["courses"])
+        course_ids = list(course_ids)
+        chunk_size = options["chunk_size"]
+
+        stale_courses = stale_enrollments = 0
+        for start in range(0, len(course_ids), chunk_size):
+            chunk = course_ids[start : start + chunk_size]
+            if options["verify"]:
+                courses, enrollments = find_stale_progress_counters(chunk)
+                stale_courses += courses.count()
+                stale_enrollments += enrollments.count()
+            else:
+                rebuild_progress_counters(chunk)
+
+        if not options["verify"]:
+            self.stdout.write(
+                self.style.SUCCESS(f"Rebuilt counters for {len(course_ids)} courses.")
+            )
+            return
+        if stale_courses or stale_enrollments:
+            raise CommandError(
+                f"{stale_courses} stale course counters, "
+                f"{stale_enrollments} stale enrollment counters."
+            )
+        self.stdout.write(self.style.SUCCESS("All counters are up to date."))
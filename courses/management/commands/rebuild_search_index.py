@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from courses.search import rebuild_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the full-text search documents of all the courses."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size", type=int, default=1000, help="Courses indexed per query."
+        )
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        count = rebuild_index(
+            options["chunk_size"],
+            log=self.stderr.write if options["verbosity"] > 1 else None,
+        )
+        self.stdout.write(
+            f"Indexed {count} courses in {time.perf_counter() - start:.1f}s."
+        )
@@ -0,0 +1,179 @@
+"""Serving lesson media with byte ranges, validators and server offload."""
+
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.http import FileResponse, HttpResponse
+from django.utils.http import http_date, parse_http_date_safe
+
+from .cache import get_cache
+from .models import Enrollment, Lesson
+
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def get_media_access(course_pk, lesson_pk, student_pk):
+    """Return ``(media name, enrolled)`` for a lesson, or None if it has no media.
+
+    One query, cached for ``LMS_MEDIA_ACCESS_CACHE_TIMEOUT`` seconds so the
+    range requests of a video player do not repeat it. Denials are not cached,
+    a student can watch right after enrolling.
+    """
+    cache = get_cache()
+    key = f"lms:media-access:{course_pk}:{lesson_pk}:{student_pk}"
+    access = cache.get(key)
+    if access is None:
+        access = (
+            Lesson.objects.filter(pk=lesson_pk, course_id=course_pk)
+            .exclude(media="")
+            .annotate(
+                enrolled=Exists(
+                    Enrollment.objects.filter(
+                        course_id=OuterRef("course_id"), student_id=student_pk
+                    )
+                )
+            )
+            .values_list("media", "enrolled")
+            .first()
+        )
+        if access and access[1]:
+            cache.set(key, access, settings.LMS_MEDIA_ACCESS_CACHE_TIMEOUT)
+    return access
+
+
+def parse_range(header, size):
+    """Return the ``(start, end)`` byte positions of a single range header.
+
+    None means the header should be ignored (missing, malformed or several
+    ranges) and ``ValueError`` that the range cannot be satisfied.
+    """
+    match = RANGE_RE.match(header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+    start, end = match.groups()
+    if not start:
+        # suffix range: the last `end` bytes
+        start, end = max(size - int(end), 0), size - 1
+    else:
+        start, end = int(start), min(int(end) if end else size - 1, size - 1)
+    if start > end or start >= size:
+        raise ValueError
+    return start, end
+
+
+class FileRange:
+    """The ``length`` bytes of an open file from ``start``, for ``FileResponse``.
+
+    It keeps ``fileno`` and ``tell`` so WSGI servers can still send the
+    range with ``sendfile`` (bounded by the ``Content-Length`` header), but
+    has no ``seek`` or ``name``, which would make ``FileResponse`` set the
+    length of the whole file.
+    """
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def tell(self):
+        return self.file.tell()
+
+    def fileno(self):
+        return self.file.fileno()
+
+    def close(self):
+        self.file.close()
+
+
+def is_not_modified(request, etag, mtime):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or (
+            if_none_match.strip() == "*"
+        )
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since", ""))
+    return since is not None and int(mtime) <= since
+
+
+def range_is_current(request, etag, mtime):
+    """Whether a ``Range`` applies, according to ``If-Range``."""
+    if_range = request.headers.get("If-Range")
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    since = parse_http_date_safe(if_range)
+    return since is not None and int(mtime) <= since
+
+
+def serve_media(request, name, storage):
+    """Build the response for the media file ``name`` of ``storage``.
+
+    Depending on ``LMS_MEDIA_OFFLOAD`` the body is left to the web server
+    (``x-accel-redirect`` for nginx, ``x-sendfile`` for Apache/lighttpd) or
+    sent by Django through ``FileResponse``, which lets the WSGI server use
+    ``sendfile`` for whole files and ranges (see ``FileRange``).
+    """
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    offload = settings.LMS_MEDIA_OFFLOAD
+    if offload == "x-accel-redirect":
+        response = HttpResponse(content_type=content_type)
+        response["X-Accel-Redirect"] = settings.LMS_MEDIA_ACCEL_PREFIX + name
+        return response
+    path = storage.path(name)
+    if offload == "x-sendfile":
+        response = HttpResponse(content_type=content_type)
+        response["X-Sendfile"] = path
+        return response
+
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+    size, mtime = stat.st_size, stat.st_mtime
+    etag = f'"{size:x}-{stat.st_mtime_ns:x}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": http_date(mtime),
+        "Accept-Ranges": "bytes",
+    }
+
+    if is_not_modified(request, etag, mtime):
+        return HttpResponse(status=304, headers=headers)
+
+    byte_range = None
+    if range_is_current(request, etag, mtime):
+        try:
+            byte_range = parse_range(request.headers.get("Range"), size)
+        except ValueError:
+            return HttpResponse(
+                status=416, headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+    if byte_range is None:
+        response = FileResponse(open(path, "rb"), content_type=content_type)
+        for header, value in headers.items():
+            response[header] = value
+        return response
+
+    start, end = byte_range
+    length = end - start + 1
+    return FileResponse(
+        FileRange(open(path, "rb"), start, length),
+        status=206,
+        content_type=content_type,
+        headers={
+            **headers,
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(length),
+        },
+    )
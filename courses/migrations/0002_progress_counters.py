@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:10
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    Lesson = apps.get_model('courses', 'Lesson')
+    StudentProgress = apps.get_model('courses', 'StudentProgress')
+
+    lessons = (
+        Lesson.objects.filter(course_id=OuterRef('pk'))
+        .order_by().values('course_id').annotate(count=Count('pk')).values('count')
+    )
+    Course.objects.update(lesson_count=Coalesce(Subquery(lessons), 0))
+
+    progress = (
+        StudentProgress.objects.filter(
+            student_id=OuterRef('student_id'), lesson__course_id=OuterRef('course_id')
+        )
+        .order_by().values('student_id').annotate(count=Count('pk')).values('count')
+    )
+    Enrollment.objects.update(completed_lessons=Coalesce(Subquery(progress), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='lesson_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='enrollment',
+            name='completed_lessons',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
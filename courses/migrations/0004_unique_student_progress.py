@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:12
+
+from django.db import migrations, models
+from django.db.models import Count, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def remove_duplicate_progress(apps, schema_editor):
+    Enrollment = apps.get_model('courses', 'Enrollment')
+    StudentProgress = apps.get_model('courses', 'StudentProgress')
+    duplicates = list(
+        StudentProgress.objects.order_by()
+        .values('student_id', 'lesson_id')
+        .annotate(keep=Min('pk'), total=Count('pk'))
+        .filter(total__gt=1)
+    )
+    for row in duplicates:
+        StudentProgress.objects.filter(
+            student_id=row['student_id'], lesson_id=row['lesson_id']
+        ).exclude(pk=row['keep']).delete()
+    if not duplicates:
+        return
+
+    # duplicates were counted by the previous counter backfill
+    progress = (
+        StudentProgress.objects.filter(
+            student_id=OuterRef('student_id'), lesson__course_id=OuterRef('course_id')
+        )
+        .order_by().values('student_id').annotate(count=Count('pk')).values('count')
+    )
+    Enrollment.objects.filter(
+        student_id__in={row['student_id'] for row in duplicates}
+    ).update(completed_lessons=Coalesce(Subquery(progress), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0003_unique_enrollment'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_progress, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='studentprogress',
+            constraint=models.UniqueConstraint(fields=('student', 'lesson'), name='unique_student_progress'),
+        ),
+    ]
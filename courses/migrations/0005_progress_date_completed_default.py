@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0004_unique_student_progress'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='studentprogress',
+            name='date_completed',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
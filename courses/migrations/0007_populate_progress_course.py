@@ -0,0 +1,38 @@
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+from django.db.models import Max, OuterRef, Subquery
+
+CHUNK_SIZE = 10000
+
+
+def populate_progress_course(apps, schema_editor):
+    Lesson = apps.get_model('courses', 'Lesson')
+    StudentProgress = apps.get_model('courses', 'StudentProgress')
+    course_id = Subquery(
+        Lesson.objects.filter(pk=OuterRef('lesson_id')).values('course_id')[:1]
+    )
+    last = StudentProgress.objects.aggregate(last=Max('pk'))['last'] or 0
+    # one transaction per chunk of ids keeps the locks and the undo log small
+    for start in range(0, last, CHUNK_SIZE):
+        with transaction.atomic(using=schema_editor.connection.alias):
+            StudentProgress.objects.filter(
+                pk__gt=start, pk__lte=start + CHUNK_SIZE, course__isnull=True
+            ).update(course_id=course_id)
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('courses', '0006_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(populate_progress_course, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='studentprogress',
+            name='course',
+            field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, related_name='progress', to='courses.course'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0008_lesson_upload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lesson',
+            name='media_checksum',
+            field=models.CharField(blank=True, editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='media_duration',
+            field=models.FloatField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='media_page_count',
+            field=models.PositiveIntegerField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='media_size',
+            field=models.PositiveBigIntegerField(editable=False, null=True),
+        ),
+    ]
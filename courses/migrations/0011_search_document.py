@@ -0,0 +1,122 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# The full-text index of the search documents, see courses.search. On SQLite
+# an FTS5 table over the documents kept in sync by triggers (recreate them
+# if a later migration rebuilds courses_searchdocument), on PostgreSQL a GIN
+# index on their weighted tsvector.
+SQLITE_INDEX = [
+    """
+    CREATE VIRTUAL TABLE courses_searchdocument_fts USING fts5(
+        title, description, teacher, lessons,
+        content='courses_searchdocument', content_rowid='course_id',
+        tokenize='porter unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER courses_searchdocument_ai AFTER INSERT ON courses_searchdocument BEGIN
+        INSERT INTO courses_searchdocument_fts(rowid, title, description, teacher, lessons)
+        VALUES (new.course_id, new.title, new.description, new.teacher, new.lessons);
+    END
+    """,
+    """
+    CREATE TRIGGER courses_searchdocument_ad AFTER DELETE ON courses_searchdocument BEGIN
+        INSERT INTO courses_searchdocument_fts(
+            courses_searchdocument_fts, rowid, title, description, teacher, lessons
+        ) VALUES ('delete', old.course_id, old.title, old.description, old.teacher, old.lessons);
+    END
+    """,
+    """
+    CREATE TRIGGER courses_searchdocument_au AFTER UPDATE ON courses_searchdocument BEGIN
+        INSERT INTO courses_searchdocument_fts(
+            courses_searchdocument_fts, rowid, title, description, teacher, lessons
+        ) VALUES ('delete', old.course_id, old.title, old.description, old.teacher, old.lessons);
+        INSERT INTO courses_searchdocument_fts(rowid, title, description, teacher, lessons)
+        VALUES (new.course_id, new.title, new.description, new.teacher, new.lessons);
+    END
+    """,
+]
+SQLITE_DROP = [
+    "DROP TRIGGER IF EXISTS courses_searchdocument_ai",
+    "DROP TRIGGER IF EXISTS courses_searchdocument_ad",
+    "DROP TRIGGER IF EXISTS courses_searchdocument_au",
+    "DROP TABLE IF EXISTS courses_searchdocument_fts",
+]
+POSTGRESQL_INDEX = [
+    """
+    CREATE INDEX courses_searchdocument_vector_idx ON courses_searchdocument USING gin ((
+        setweight(to_tsvector('english', title), 'A')
+        || setweight(to_tsvector('english', teacher), 'B')
+        || setweight(to_tsvector('english', lessons), 'C')
+        || setweight(to_tsvector('english', description), 'D')
+    ))
+    """,
+]
+POSTGRESQL_DROP = ["DROP INDEX IF EXISTS courses_searchdocument_vector_idx"]
+
+
+def run(statements):
+    def operation(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return operation
+
+
+def populate_search_documents(apps, schema_editor):
+    Course = apps.get_model('courses', 'Course')
+    Lesson = apps.get_model('courses', 'Lesson')
+    SearchDocument = apps.get_model('courses', 'SearchDocument')
+    courses = Course.objects.values(
+        'pk', 'title', 'description', 'teacher__user__first_name',
+        'teacher__user__last_name', 'teacher__user__username',
+    )
+    lessons = {}
+    for course_id, title in Lesson.objects.order_by('id').values_list('course_id', 'title'):
+        lessons.setdefault(course_id, []).append(title)
+    SearchDocument.objects.bulk_create(
+        [
+            SearchDocument(
+                course_id=course['pk'],
+                title=course['title'],
+                description=course['description'],
+                teacher=' '.join(
+                    name for name in [
+                        course['teacher__user__first_name'],
+                        course['teacher__user__last_name'],
+                        course['teacher__user__username'],
+                    ] if name
+                ),
+                lessons='\n'.join(lessons.get(course['pk'], [])),
+            )
+            for course in courses.iterator()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0010_media_blob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchDocument',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='courses.course')),
+                ('title', models.CharField(max_length=255)),
+                ('description', models.TextField(blank=True)),
+                ('teacher', models.CharField(blank=True, max_length=255)),
+                ('lessons', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(
+            run({'sqlite': SQLITE_INDEX, 'postgresql': POSTGRESQL_INDEX}),
+            run({'sqlite': SQLITE_DROP, 'postgresql': POSTGRESQL_DROP}),
+        ),
+        migrations.RunPython(populate_search_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 16:25
+
+import courses.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('courses', '0011_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='course',
+            name='version',
+            field=models.BigIntegerField(default=courses.models.new_version, editable=False),
+        ),
+        migrations.AddField(
+            model_name='lesson',
+            name='version',
+            field=models.BigIntegerField(default=courses.models.new_version, editable=False),
+        ),
+        migrations.AddField(
+            model_name='student',
+            name='version',
+            field=models.BigIntegerField(default=courses.models.new_version, editable=False),
+        ),
+    ]
@@ -1,8 +1,38 @@
-from django.db import models
+import time
+import uuid
+
+from django.db import models, transaction
+from django.db.models import Count, F
+from django.db.models.functions import Greatest
 from django.contrib.auth.models import User
+from django.utils import timezone
+
+
+def new_version():
+    # from the clock, so a reused primary key never gets an old version back
+    return time.time_ns()
+
+
+class VersionedModel(models.Model):
+    """A model whose ``version`` changes on every save.
+
+    Keys the cached JSON of its rows (see courses.fragments); queryset
+    updates of rendered fields bump it with ``F("version") + 1``.
+    """
+
+    version = models.BigIntegerField(default=new_version, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, update_fields=None, **kwargs):
+        self.version = new_version()
+        if update_fields is not None:
+            update_fields = {*update_fields, "version"}
+        super().save(*args, update_fields=update_fields, **kwargs)
 
 
-class Student(models.Model):
+class Student(VersionedModel):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
 
     def __str__(self):
@@ -25,47 +55,197 @@ class Teacher(models.Model):
         )
 
 
-class Course(models.Model):
+class Course(VersionedModel):
     title = models.CharField(max_length=255)
     description = models.TextField(blank=True)
     teacher = models.ForeignKey(Teacher, related_name="courses", on_delete=models.CASCADE)
+    # denormalized, kept in sync by courses.signals
+    lesson_count = models.PositiveIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.title
 
 
 class Enrollment(models.Model):
+    # both foreign keys are covered by the composite indexes below
     student = models.ForeignKey(
-        Student, related_name="enrollments", on_delete=models.CASCADE
+        Student, related_name="enrollments", on_delete=models.CASCADE, db_index=False
     )
     course = models.ForeignKey(
-        Course, related_name="enrollments", on_delete=models.CASCADE
+        Course, related_name="enrollments", on_delete=models.CASCADE, db_index=False
     )
     enrollment_date = models.DateTimeField(auto_now_add=True)
+    # denormalized, kept in sync by courses.signals
+    completed_lessons = models.PositiveIntegerField(default=0, editable=False)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "course"], name="unique_enrollment"
+            )
+        ]
+        indexes = [
+            # enrolled students and students progress pages of a course
+            models.Index(fields=["course", "id"], name="enrollment_course_id_idx"),
+        ]
 
     def __str__(self):
         return f"{self.student} - {self.course}"
 
 
-class Lesson(models.Model):
+class MediaBlob(models.Model):
+    """A media file stored once under its SHA-256 and shared by lessons (see courses.blobs)."""
+
+    digest = models.CharField(max_length=64, unique=True)
+    file = models.FileField(upload_to="blobs")
+    size = models.PositiveBigIntegerField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    # last time a lesson was linked to the blob, for the garbage collection grace period
+    used_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.digest
+
+
+class Lesson(VersionedModel):
     title = models.CharField(max_length=255)
-    course = models.ForeignKey(Course, related_name="lessons", on_delete=models.CASCADE)
+    course = models.ForeignKey(
+        Course, related_name="lessons", on_delete=models.CASCADE, db_index=False
+    )
     media = models.FileField(upload_to="media", blank=True)
     media_type = models.CharField(
         max_length=10,
         blank=True,
         choices=[("video", "video"), ("audio", "audio"), ("pdf", "pdf")],
     )
+    # extracted at upload by courses.ingest, an empty checksum means pending
+    media_size = models.PositiveBigIntegerField(null=True, editable=False)
+    media_checksum = models.CharField(max_length=64, blank=True, editable=False)
+    media_duration = models.FloatField(null=True, editable=False)
+    media_page_count = models.PositiveIntegerField(null=True, editable=False)
+    blob = models.ForeignKey(
+        MediaBlob,
+        related_name="lessons",
+        on_delete=models.PROTECT,
+        null=True,
+        editable=False,
+    )
+
+    class Meta:
+        indexes = [
+            # lesson pages of a course, also covers the course foreign key
+            models.Index(fields=["course", "id"], name="lesson_course_id_idx"),
+        ]
 
     def __str__(self):
         return self.title
 
 
+class StudentProgressQuerySet(models.QuerySet):
+    def delete(self):
+        """Delete the rows and lower the ``completed_lessons`` of their enrollments.
+
+        Progress rows have no delete receivers, so the cascades of a deleted
+        lesson or student stay single DELETEs (see courses.signals); direct
+        deletes, e.g. from the admin, update the counters here with one
+        UPDATE per (student, course).
+        """
+        from .signals import invalidate_responses
+
+        with transaction.atomic():
+            completed = list(
+                self.order_by()
+                .values("student_id", "course_id")
+                .annotate(count=Count("id"))
+            )
+            deleted = super().delete()
+            for row in completed:
+                Enrollment.objects.filter(
+                    student_id=row["student_id"], course_id=row["course_id"]
+                ).update(
+                    completed_lessons=Greatest(F("completed_lessons") - row["count"], 0)
+                )
+            invalidate_responses(*{f"student:{row['student_id']}" for row in completed})
+        return deleted
+
+
 class StudentProgress(models.Model):
+    # covered by the unique (student, lesson) constraint
     student = models.ForeignKey(
-        Student, related_name="progress", on_delete=models.CASCADE
+        Student, related_name="progress", on_delete=models.CASCADE, db_index=False
     )
     lesson = models.ForeignKey(
         Lesson, related_name="progress", on_delete=models.CASCADE
     )
-    date_completed = models.DateTimeField(auto_now_add=True)
+    # denormalized from lesson.course so per-course scans need no join;
+    # covered by the (course, student, lesson) index
+    course = models.ForeignKey(
+        Course,
+        related_name="progress",
+        on_delete=models.CASCADE,
+        editable=False,
+        db_index=False,
+    )
+    # not auto_now_add so replayed write-behind events keep their own time
+    date_completed = models.DateTimeField(default=timezone.now)
+
+    objects = StudentProgressQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["student", "lesson"], name="unique_student_progress"
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=["course", "student", "lesson"],
+                name="progress_course_student_idx",
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.course_id is None:
+            self.course_id = self.lesson.course_id
+        super().save(*args, **kwargs)
+
+    def delete(self, using=None, keep_parents=False):
+        # through the queryset, which updates the enrollment counter
+        return StudentProgress.objects.using(using).filter(pk=self.pk).delete()
+
+
+class LessonUpload(models.Model):
+    """A resumable, chunked upload of a lesson media file (see courses.uploads)."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    course = models.ForeignKey(
+        Course, related_name="uploads", on_delete=models.CASCADE
+    )
+    title = models.CharField(max_length=255)
+    filename = models.CharField(max_length=255)
+    media_type = models.CharField(max_length=10)
+    size = models.PositiveBigIntegerField()
+    # optional SHA-256 of the whole file, verified on finalize
+    checksum = models.CharField(max_length=64, blank=True)
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.offset}/{self.size})"
+
+
+class SearchDocument(models.Model):
+    """The searchable text of a course, indexed by the database (see courses.search)."""
+
+    course = models.OneToOneField(
+        Course, related_name="search_document", on_delete=models.CASCADE, primary_key=True
+    )
+    title = models.CharField(max_length=255)
+    description = models.TextField(blank=True)
+    teacher = models.CharField(max_length=255, blank=True)
+    # titles of the course lessons, one per line
+    lessons = models.TextField(blank=True)
+
+    def __str__(self):
+        return self.title
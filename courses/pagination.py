@@ -0,0 +1,60 @@
+from rest_framework.pagination import Cursor, CursorPagination
+from rest_framework.request import Request
+
+
+class KeysetPagination(CursorPagination):
+    """Cursor (keyset) pagination on the primary key.
+
+    Pages are fetched with ``WHERE id > <cursor> ORDER BY id LIMIT n`` so
+    deep pages cost the same as the first one, unlike ``OFFSET`` scans.
+    """
+
+    ordering = "id"
+    page_size_query_param = "page_size"
+    max_page_size = 1000
+
+    def wants_pagination(self, request):
+        """Whether a request to an opt-in (non-list) endpoint asks for pages."""
+        return (
+            self.cursor_query_param in request.query_params
+            or self.page_size_query_param in request.query_params
+        )
+
+    def get_paginated_data(self, data, key):
+        return {
+            "next": self.get_next_link(),
+            "previous": self.get_previous_link(),
+            key: data,
+        }
+
+    async def apaginate_values(self, queryset, request):
+        """Async version of ``paginate_queryset`` for ``values()`` querysets.
+
+        Returns the rows of the page; the cursors are compatible with the
+        synchronous endpoints.
+        """
+        request = Request(request)
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+        reverse = self.cursor is not None and self.cursor.reverse
+        position = self.cursor.position if self.cursor else None
+        if position is not None:
+            lookup = "id__lt" if reverse else "id__gt"
+            queryset = queryset.filter(**{lookup: position})
+        queryset = queryset.order_by("-id" if reverse else "id")
+        rows = [row async for row in queryset[: self.page_size + 1]]
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_link = self.previous_link = None
+        if rows and (has_more or reverse):
+            self.next_link = self.encode_cursor(Cursor(0, False, str(rows[-1]["id"])))
+        if rows and (has_more if reverse else position is not None):
+            self.previous_link = self.encode_cursor(Cursor(0, True, str(rows[0]["id"])))
+        return rows
+
+    def get_async_paginated_data(self, data, key="results"):
+        return {"next": self.next_link, "previous": self.previous_link, key: data}
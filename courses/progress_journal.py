@@ -0,0 +1,116 @@
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from django.conf import settings
+
+from .helpers import save_progress_batch
+
+
+class ProgressJournal:
+    """Append-only SQLite (WAL) journal of lesson completion events.
+
+    Used by the write-behind mode of save-progress: the request only appends
+    to the journal and ``manage.py flush_progress`` moves the events into
+    ``StudentProgress``.
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=FULL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "student_id INTEGER NOT NULL, "
+                "lesson_id INTEGER NOT NULL, "
+                "completed_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS events_student ON events (student_id)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS events_lesson ON events (lesson_id)"
+            )
+            self._local.connection = connection
+        return connection
+
+    def append(self, events):
+        """Append ``(student_id, lesson_id)`` events in one transaction."""
+        now = time.time()
+        with self.connection:
+            self.connection.executemany(
+                "INSERT INTO events (student_id, lesson_id, completed_at) "
+                "VALUES (?, ?, ?)",
+                [(student, lesson, now) for student, lesson in events],
+            )
+
+    def read(self, limit):
+        return self.connection.execute(
+            "SELECT id, student_id, lesson_id, completed_at FROM events "
+            "ORDER BY id LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+    def discard(self, last_id):
+        with self.connection:
+            self.connection.execute("DELETE FROM events WHERE id <= ?", (last_id,))
+
+    def pending(self, student_id=None, lesson_ids=None):
+        """Return the ``(student_id, lesson_id)`` events not flushed yet.
+
+        Restricted to a student and/or to ``lesson_ids`` (e.g. the lessons of
+        a course) in the query, the journal can hold many events between two
+        flushes.
+        """
+        conditions, params = [], []
+        if student_id is not None:
+            conditions.append("student_id = ?")
+            params.append(student_id)
+        if lesson_ids is not None:
+            # one parameter whatever the number of lessons
+            conditions.append("lesson_id IN (SELECT value FROM json_each(?))")
+            params.append(json.dumps(list(lesson_ids)))
+        query = "SELECT student_id, lesson_id FROM events"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        return set(self.connection.execute(query, params))
+
+    def flush(self, batch_size=5000):
+        """Write journaled events to the database, oldest first.
+
+        Events are only discarded once their batch is committed, so a crash
+        replays them and the unique (student, lesson) constraint makes the
+        replay a no-op.
+        """
+        totals = {"saved": 0, "already_saved": 0, "rejected": 0}
+        while rows := self.read(batch_size):
+            completed_at = {}
+            for _, student, lesson, timestamp in reversed(rows):
+                completed_at[(student, lesson)] = datetime.fromtimestamp(
+                    timestamp, tz=timezone.utc
+                )
+            counts = save_progress_batch(completed_at.keys(), completed_at)
+            self.discard(rows[-1][0])
+            for key, value in counts.items():
+                totals[key] += value
+        return totals
+
+
+@lru_cache
+def _get_journal(path):
+    return ProgressJournal(path)
+
+
+def get_progress_journal():
+    return _get_journal(str(settings.LMS_PROGRESS_JOURNAL))
@@ -0,0 +1,50 @@
+import json
+
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.serializer_helpers import ReturnList
+
+from .fragments import Fragment
+from .serializers import FragmentListSerializer
+
+
+class FragmentJSONRenderer(JSONRenderer):
+    """JSON renderer copying the ``Fragment`` objects of the data as they are.
+
+    Dicts, lists of fragments and the lists of ``FragmentListSerializer``
+    (whose items may hold fragments) are assembled piece by piece, any
+    other value is rendered by ``JSONRenderer``. Indented (browsable API)
+    responses are rendered entirely by ``JSONRenderer``.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return self.splice(data)
+
+    def splice(self, value):
+        if isinstance(value, Fragment):
+            return value.content
+        if isinstance(value, dict):
+            return b"{%s}" % b",".join(
+                self.render_key(key) + b":" + self.splice(item) for key, item in value.items()
+            )
+        if isinstance(value, list) and value and (
+            isinstance(value[0], Fragment) or is_fragment_list(value)
+        ):
+            return b"[%s]" % b",".join(self.splice(item) for item in value)
+        if value is None:
+            return b"null"
+        return super().render(value)
+
+    def render_key(self, key):
+        return json.dumps(str(key), ensure_ascii=self.ensure_ascii).encode()
+
+
+def is_fragment_list(value):
+    return isinstance(value, ReturnList) and isinstance(
+        value.serializer, FragmentListSerializer
+    )
+
+
+def render_json(data):
+    return FragmentJSONRenderer().render(data)
@@ -0,0 +1,95 @@
+"""Routing of read-only requests to read replicas.
+
+``ReplicaRoutingMiddleware`` picks one of ``LMS_DATABASE_REPLICAS`` for the
+GET requests of the viewset actions in ``LMS_REPLICA_ACTIONS`` and
+``ReplicaRouter`` sends the reads of that request there; everything else,
+including all writes, uses the primary (``default``).
+
+Replicas lag behind the primary, so a client that wrote something (any
+successful POST/PUT/PATCH/DELETE) gets a cookie pinning its reads to the
+primary for ``LMS_REPLICA_STICKY_SECONDS``: a ``save-progress`` followed by
+a dashboard read sees the saved progress.
+"""
+
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+STICKY_COOKIE = "lms_read_primary"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# alias of the replica serving the reads of the current request
+read_database = ContextVar("read_database", default=None)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return "default"
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same data as the primary
+        databases = {"default", *settings.LMS_DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+def stream_from(content, alias):
+    # streamed bodies run their queries after the view returned
+    iterator = iter(content)
+    while True:
+        token = read_database.set(alias)
+        try:
+            chunk = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            read_database.reset(token)
+        yield chunk
+
+
+class ReplicaRoutingMiddleware:
+    def __init__(self, get_response):
+        if not settings.LMS_DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.read_database = None
+        try:
+            response = self.get_response(request)
+        finally:
+            token = getattr(request, "_read_database_token", None)
+            if token is not None:
+                read_database.reset(token)
+
+        if request.read_database and response.streaming:
+            if getattr(response, "file_to_stream", None) is None:
+                response.streaming_content = stream_from(
+                    response.streaming_content, request.read_database
+                )
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(
+                STICKY_COOKIE,
+                "1",
+                max_age=settings.LMS_REPLICA_STICKY_SECONDS,
+                httponly=True,
+                samesite="Lax",
+            )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if request.method not in ("GET", "HEAD") or STICKY_COOKIE in request.COOKIES:
+            return None
+        # HEAD requests run the action of GET
+        actions = getattr(view_func, "actions", None) or {}
+        if actions.get("get") not in settings.LMS_REPLICA_ACTIONS:
+            return None
+        request.read_database = random.choice(settings.LMS_DATABASE_REPLICAS)
+        request._read_database_token = read_database.set(request.read_database)
+        return None
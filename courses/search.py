@@ -0,0 +1,202 @@
+"""Full-text search of the course catalog.
+
+Every course has a ``SearchDocument`` with its title, description, teacher
+name and lesson titles, indexed by the database: an FTS5 table on SQLite
+and a GIN index on a weighted tsvector on PostgreSQL (see migration 0011).
+Other databases fall back to unranked substring matching.
+
+The documents are kept in sync by the model signals in ``courses.signals``:
+the courses whose text changed are reindexed once when the transaction
+commits, so saving many lessons of a course reindexes it only once.
+``rebuild_index`` (the ``rebuild_search_index`` command) rebuilds them all.
+"""
+
+import re
+import threading
+from functools import reduce
+from itertools import islice
+from operator import and_, or_
+
+from django.db import connections, router, transaction
+from django.db.models import Q
+
+from .models import Course, Lesson, SearchDocument
+
+MAX_QUERY_TERMS = 10
+POSTGRESQL_VECTOR = """
+    setweight(to_tsvector('english', d.title), 'A')
+    || setweight(to_tsvector('english', d.teacher), 'B')
+    || setweight(to_tsvector('english', d.lessons), 'C')
+    || setweight(to_tsvector('english', d.description), 'D')
+"""
+RESULT_COLUMNS = ["id", "title", "description", "teacher", "lesson_count"]
+
+_pending = threading.local()
+
+
+def teacher_name(first_name, last_name, username):
+    return " ".join(name for name in [first_name, last_name, username] if name)
+
+
+def get_terms(query):
+    return re.findall(r"\w+", query.lower())[:MAX_QUERY_TERMS]
+
+
+def build_document(course, lesson_titles):
+    return SearchDocument(
+        course_id=course["pk"],
+        title=course["title"],
+        description=course["description"],
+        teacher=teacher_name(
+            course["teacher__user__first_name"],
+            course["teacher__user__last_name"],
+            course["teacher__user__username"],
+        ),
+        lessons="\n".join(lesson_titles),
+    )
+
+
+def course_rows(courses):
+    return courses.values(
+        "pk",
+        "title",
+        "description",
+        "teacher__user__first_name",
+        "teacher__user__last_name",
+        "teacher__user__username",
+    )
+
+
+def index_course(course_id):
+    """Create, update or delete the search document of a course."""
+    course = course_rows(Course.objects.filter(pk=course_id)).first()
+    if course is None:
+        SearchDocument.objects.filter(course_id=course_id).delete()
+        return
+    titles = Lesson.objects.filter(course_id=course_id).order_by("id").values_list(
+        "title", flat=True
+    )
+    document = build_document(course, titles)
+    if not SearchDocument.objects.filter(course_id=course_id).update(
+        title=document.title,
+        description=document.description,
+        teacher=document.teacher,
+        lessons=document.lessons,
+    ):
+        document.save(force_insert=True)
+
+
+def flush_index():
+    courses = getattr(_pending, "courses", set())
+    _pending.courses = set()
+    for course_id in sorted(courses):
+        index_course(course_id)
+
+
+def schedule_index(course_id):
+    """Reindex the course when the current transaction commits.
+
+    Every call registers a flush, the first one to run reindexes all the
+    pending courses. Courses of a rolled back transaction stay pending and
+    are reindexed, uselessly but harmlessly, by the next flush.
+    """
+    if not hasattr(_pending, "courses"):
+        _pending.courses = set()
+    _pending.courses.add(course_id)
+    transaction.on_commit(flush_index)
+
+
+def rebuild_index(chunk_size=1000, log=None):
+    """Recreate the search documents of all the courses, a chunk at a time."""
+    log = log or (lambda message: None)
+    count = 0
+    with transaction.atomic():
+        SearchDocument.objects.all().delete()
+        courses = course_rows(Course.objects.order_by("pk")).iterator(chunk_size=chunk_size)
+        while chunk := list(islice(courses, chunk_size)):
+            lessons = {}
+            for course_id, title in (
+                Lesson.objects.filter(course_id__in=[course["pk"] for course in chunk])
+                .order_by("id")
+                .values_list("course_id", "title")
+            ):
+                lessons.setdefault(course_id, []).append(title)
+            SearchDocument.objects.bulk_create(
+                [build_document(course, lessons.get(course["pk"], [])) for course in chunk]
+            )
+            count += len(chunk)
+            log(f"Indexed {count} courses.")
+    return count
+
+
+def search_courses(query, limit, offset=0):
+    """The courses matching all the words of ``query``, best matches first.
+
+    The last word also matches as a prefix. Returns a list of dicts with the
+    course fields and its ``rank``, higher is better.
+    """
+    terms = get_terms(query)
+    if not terms:
+        return []
+    connection = connections[router.db_for_read(SearchDocument)]
+    if connection.vendor == "sqlite":
+        match = " ".join(f'"{term}"' for term in terms[:-1])
+        match = f'{match} "{terms[-1]}"*'.strip()
+        # ranked in the FTS table alone, only the page is joined to the courses
+        sql = """
+            SELECT c.id, c.title, c.description, c.teacher_id, c.lesson_count, m.rank
+            FROM (
+                SELECT rowid, -bm25(courses_searchdocument_fts, 10.0, 1.0, 5.0, 2.0) AS rank
+                FROM courses_searchdocument_fts
+                WHERE courses_searchdocument_fts MATCH %s
+                ORDER BY rank DESC, rowid
+                LIMIT %s OFFSET %s
+            ) m
+            JOIN courses_course c ON c.id = m.rowid
+            ORDER BY m.rank DESC, c.id
+        """
+        params = [match, limit, offset]
+    elif connection.vendor == "postgresql":
+        match = " & ".join([*terms[:-1], f"{terms[-1]}:*"])
+        sql = f"""
+            SELECT c.id, c.title, c.description, c.teacher_id, c.lesson_count,
+                ts_rank({POSTGRESQL_VECTOR}, query) AS rank
+            FROM courses_searchdocument d
+            JOIN courses_course c ON c.id = d.course_id,
+                to_tsquery('english', %s) query
+            WHERE ({POSTGRESQL_VECTOR}) @@ query
+            ORDER BY rank DESC, c.id
+            LIMIT %s OFFSET %s
+        """
+        params = [match, limit, offset]
+    else:
+        return search_courses_fallback(terms, limit, offset)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    return [
+        {**dict(zip(RESULT_COLUMNS, row[:-1])), "rank": round(row[-1], 4)} for row in rows
+    ]
+
+
+def search_courses_fallback(terms, limit, offset):
+    fields = ["title", "description", "teacher", "lessons"]
+    matches = reduce(
+        and_,
+        [
+            reduce(or_, [Q(**{f"{field}__icontains": term}) for field in fields])
+            for term in terms
+        ],
+    )
+    rows = (
+        SearchDocument.objects.filter(matches)
+        .order_by("course_id")
+        .values_list(
+            "course_id",
+            "course__title",
+            "course__description",
+            "course__teacher_id",
+            "course__lesson_count",
+        )[offset : offset + limit]
+    )
+    return [{**dict(zip(RESULT_COLUMNS, row)), "rank": None} for row in rows]
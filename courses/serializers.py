@@ -1,32 +1,143 @@
+from django.conf import settings
+from django.db import models
 from rest_framework import serializers
-from .models import Course, Lesson, StudentProgress, Student, Teacher
-from django.contrib.auth.models import User
+from .blobs import attach_media
+from .fragments import get_fragments
+from .ingest import describe_media
+from .instrumentation import SerializationTimingMixin
+from .models import Course, Lesson, LessonUpload, StudentProgress, Student, Teacher
+from jobs.queue import enqueue
 
 
-class LessonSerializer(serializers.ModelSerializer):
+class FragmentListSerializer(SerializationTimingMixin, serializers.ListSerializer):
+    """Lists rendering their items through the fragment cache (see courses.fragments).
+
+    Children whose ``cache_fragments`` is false, as they render other rows
+    than the versioned one, are serialized as usual.
+    """
+
+    def to_representation(self, data):
+        if not settings.LMS_FRAGMENT_CACHE["ENABLED"] or not getattr(
+            self.child, "cache_fragments", True
+        ):
+            return super().to_representation(data)
+        iterable = data.all() if isinstance(data, models.manager.BaseManager) else data
+        return get_fragments(self.child, list(iterable))
+
+
+def media_path(course_id, lesson_id):
+    return f"/api/courses/{course_id}/lessons/{lesson_id}/media/"
+
+
+class LessonMediaField(serializers.FileField):
+    """An uploaded file, rendered as the URL of the lesson media action.
+
+    The stored files are not served directly, the action checks that the
+    student is enrolled.
+    """
+
+    def get_attribute(self, instance):
+        return instance
+
+    def to_representation(self, lesson):
+        if not lesson.media:
+            return None
+        path = media_path(lesson.course_id, lesson.pk)
+        request = self.context.get("request")
+        return request.build_absolute_uri(path) if request is not None else path
+
+
+class LessonSerializer(SerializationTimingMixin, serializers.ModelSerializer):
     title = serializers.CharField(max_length=255, required=True)
-    media = serializers.FileField(required=True)
+    media = LessonMediaField(required=True)
 
     class Meta:
         model = Lesson
-        fields = ["id", "title", "media", "media_type"]
+        fields = [
+            "id",
+            "title",
+            "media",
+            "media_type",
+            "media_size",
+            "media_checksum",
+            "media_duration",
+            "media_page_count",
+        ]
+        read_only_fields = ["media_type"]
+        list_serializer_class = FragmentListSerializer
 
     def validate_media(self, value):
-        if value.content_type.split("/")[0] not in ["video", "audio", "pdf"]:
+        # sniffed from the file content, the client's content type is not trusted
+        fields = describe_media(value)
+        if fields is None:
             raise serializers.ValidationError("Invalid media type.")
+        self.media_fields = fields
         return value
 
     def create(self, validated_data):
         media = validated_data.pop("media")
-        validated_data["media_type"] = media.content_type.split("/")[0]
-        lesson = Lesson.objects.create(**validated_data, media=media)
+        lesson = Lesson(**validated_data, **self.media_fields)
+        attach_media(lesson, media)
+        lesson.save()
+        self.schedule_metadata_extraction(lesson)
+        return lesson
+
+    def update(self, instance, validated_data):
+        media = validated_data.pop("media", None)
+        if media is not None:
+            for field, value in self.media_fields.items():
+                setattr(instance, field, value)
+            attach_media(instance, media)
+        lesson = super().update(instance, validated_data)
+        if media is not None:
+            self.schedule_metadata_extraction(lesson)
         return lesson
 
+    def schedule_metadata_extraction(self, lesson):
+        # deferred metadata (LMS_MEDIA_METADATA_INLINE off)
+        if not lesson.media_checksum:
+            enqueue("courses.extract_media_metadata", lesson_ids=[lesson.pk])
+
+
+class CourseTeacherSerializer(serializers.ModelSerializer):
+    username = serializers.CharField(source="user.username")
+    first_name = serializers.CharField(source="user.first_name")
+    last_name = serializers.CharField(source="user.last_name")
+
+    class Meta:
+        model = Teacher
+        fields = ["id", "username", "first_name", "last_name", "bio"]
+
+
+class CourseSerializer(SerializationTimingMixin, serializers.ModelSerializer):
+    """Courses, restricted to ``fields`` and with the ``include`` extras.
+
+    ``include`` embeds the ``teacher`` instead of its id, adds the
+    ``lessons`` or the ``enrollment_count``, or adds ``lesson_count`` back
+    to a restricted field set. ``CoursesViewSet.get_queryset`` fetches
+    exactly what they need.
+    """
+
+    INCLUDES = ["teacher", "lessons", "lesson_count", "enrollment_count"]
 
-class CourseSerializer(serializers.ModelSerializer):
     class Meta:
         model = Course
-        fields = "__all__"
+        exclude = ["version"]
+        list_serializer_class = FragmentListSerializer
+
+    def __init__(self, *args, fields=None, include=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        if "teacher" in include:
+            self.fields["teacher"] = CourseTeacherSerializer(read_only=True)
+        if "lessons" in include:
+            self.fields["lessons"] = LessonSerializer(many=True, read_only=True)
+        if "enrollment_count" in include:
+            self.fields["enrollment_count"] = serializers.IntegerField(read_only=True)
+        # the fragments are versioned by the course row only
+        self.cache_fragments = not {"teacher", "lessons", "enrollment_count"} & set(include)
+        if fields is not None:
+            for name in set(self.fields) - set(fields) - set(include):
+                self.fields.pop(name)
 
 
 class StudentProgressSerializer(serializers.ModelSerializer):
@@ -36,7 +147,7 @@ class StudentProgressSerializer(serializers.ModelSerializer):
         fields = "__all__"
 
 
-class StudentSerializer(serializers.ModelSerializer):
+class StudentSerializer(SerializationTimingMixin, serializers.ModelSerializer):
     username = serializers.CharField(source="user.username")
     email = serializers.CharField(source="user.email")
     first_name = serializers.CharField(source="user.first_name")
@@ -45,9 +156,21 @@ class StudentSerializer(serializers.ModelSerializer):
     class Meta:
         model = Student
         fields = ["id", "username", "email", "first_name", "last_name"]
+        list_serializer_class = FragmentListSerializer
 
 
 class TeacherSerializer(serializers.ModelSerializer):
     class Meta:
         model = Teacher
         fields = "__all__"
+
+
+class LessonUploadSerializer(SerializationTimingMixin, serializers.ModelSerializer):
+    checksum = serializers.RegexField(
+        r"^[0-9a-fA-F]{64}$", required=False, allow_blank=True
+    )
+
+    class Meta:
+        model = LessonUpload
+        fields = ["id", "title", "filename", "media_type", "size", "checksum", "offset"]
+        read_only_fields = ["media_type", "offset"]
@@ -0,0 +1,146 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .cache import bump_version
+from .models import (
+    Course,
+    Enrollment,
+    Lesson,
+    SearchDocument,
+    Student,
+    StudentProgress,
+    Teacher,
+)
+from .search import schedule_index, teacher_name
+
+
+@receiver(post_save, sender=Lesson)
+def increment_lesson_count(sender, instance, created, **kwargs):
+    if created:
+        Course.objects.filter(pk=instance.course_id).update(
+            lesson_count=F("lesson_count") + 1, version=F("version") + 1
+        )
+
+
+@receiver(post_delete, sender=Lesson)
+def decrement_lesson_count(sender, instance, **kwargs):
+    # also runs for lessons removed by a course cascade, the update then
+    # simply matches no row
+    Course.objects.filter(pk=instance.course_id, lesson_count__gt=0).update(
+        lesson_count=F("lesson_count") - 1, version=F("version") + 1
+    )
+
+
+@receiver(post_save, sender=StudentProgress)
+def increment_completed_lessons(sender, instance, created, **kwargs):
+    if created:
+        Enrollment.objects.filter(
+            student_id=instance.student_id, course_id=instance.course_id
+        ).update(completed_lessons=F("completed_lessons") + 1)
+
+
+@receiver(post_save, sender=Enrollment)
+def count_existing_progress(sender, instance, created, **kwargs):
+    # students enrolling again keep the lessons they completed before
+    if not created:
+        return
+    completed = StudentProgress.objects.filter(
+        student_id=instance.student_id, course_id=instance.course_id
+    ).count()
+    if completed:
+        Enrollment.objects.filter(pk=instance.pk).update(completed_lessons=completed)
+        instance.completed_lessons = completed
+
+
+@receiver(pre_delete, sender=Lesson)
+def decrement_completed_lessons(sender, instance, **kwargs):
+    # StudentProgress has no delete receivers, so the progress rows of the
+    # lesson (and of deleted students, whose enrollments go with them) are
+    # removed by a single DELETE; the counters are updated here in one UPDATE.
+    # Direct deletes update them in StudentProgressQuerySet.delete.
+    progress = StudentProgress.objects.filter(lesson=instance)
+    students = list(progress.values_list("student_id", flat=True))
+    if not students:
+        return
+    Enrollment.objects.filter(
+        course_id=instance.course_id,
+        student_id__in=progress.values("student_id"),
+        completed_lessons__gt=0,
+    ).update(completed_lessons=F("completed_lessons") - 1)
+    invalidate_responses(*[f"student:{student}" for student in students])
+
+
+def invalidate_responses(*scopes):
+    # again on commit, in case a response was cached from a concurrent read
+    # of the data before the commit
+    bump_version(*scopes)
+    transaction.on_commit(lambda: bump_version(*scopes))
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def invalidate_course_responses(sender, instance, **kwargs):
+    invalidate_responses("catalog", f"course:{instance.pk}")
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def invalidate_lesson_responses(sender, instance, signal, created=False, **kwargs):
+    scopes = [f"course:{instance.course_id}", "catalog:lessons"]
+    if created or signal is post_delete:
+        # the catalog shows the lesson_count
+        scopes.append("catalog")
+    invalidate_responses(*scopes)
+
+
+@receiver(post_save, sender=Teacher)
+@receiver(post_delete, sender=Teacher)
+def invalidate_teacher_responses(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    courses = Course.objects.filter(teacher_id=instance.pk).values_list("pk", flat=True)
+    invalidate_responses("catalog", *[f"course:{pk}" for pk in courses])
+
+
+@receiver(post_save, sender=StudentProgress)
+@receiver(post_save, sender=Enrollment)
+@receiver(post_delete, sender=Enrollment)
+def invalidate_student_responses(sender, instance, **kwargs):
+    invalidate_responses(f"student:{instance.student_id}")
+
+
+@receiver(post_save, sender=Course)
+@receiver(post_delete, sender=Course)
+def index_course(sender, instance, **kwargs):
+    schedule_index(instance.pk)
+
+
+@receiver(post_save, sender=Lesson)
+@receiver(post_delete, sender=Lesson)
+def index_lesson_course(sender, instance, created=False, update_fields=None, **kwargs):
+    # media and metadata updates do not change the indexed title
+    if update_fields is not None and "title" not in update_fields:
+        return
+    schedule_index(instance.course_id)
+
+
+@receiver(post_save, sender=User)
+def index_teacher_name(sender, instance, created, update_fields=None, **kwargs):
+    names = {"first_name", "last_name", "username"}
+    if created or (update_fields is not None and not names & set(update_fields)):
+        return
+    SearchDocument.objects.filter(course__teacher__user=instance).update(
+        teacher=teacher_name(instance.first_name, instance.last_name, instance.username)
+    )
+
+
+@receiver(post_save, sender=User)
+def bump_student_version(sender, instance, created, update_fields=None, **kwargs):
+    # students are rendered with their user's names and email
+    names = {"username", "email", "first_name", "last_name"}
+    if created or (update_fields is not None and not names & set(update_fields)):
+        return
+    Student.objects.filter(user=instance).update(version=F("version") + 1)
@@ -0,0 +1,115 @@
+"""Background jobs of the courses app (see jobs/queue.py)."""
+
+import os
+
+from django.db import connection, transaction
+
+from jobs.queue import JobFailed, file_result, get_result_path, task
+
+from .blobs import deduplicate_lesson_media
+from .exports import FILE_FORMATS, export_progress
+from .helpers import rebuild_progress_counters
+from .ingest import update_media_metadata
+from .models import Course, Enrollment, Lesson, StudentProgress
+from .signals import invalidate_responses
+
+DELETE_CHUNK_SIZE = 5000
+
+
+def delete_rows(model, ids):
+    """Delete the ``ids`` rows of ``model`` with one ``DELETE``.
+
+    No signals are sent and nothing is cascaded, the rows referencing them
+    must be deleted first.
+    """
+    table = connection.ops.quote_name(model._meta.db_table)
+    column = connection.ops.quote_name(model._meta.pk.column)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE {column} IN ({placeholders})", ids)
+        return cursor.rowcount
+
+
+@task("courses.delete_course")
+def delete_course(job, course_id, chunk_size=DELETE_CHUNK_SIZE):
+    """Delete a course, its progress rows, enrollments and lessons a chunk at a time.
+
+    The chunks are deleted without the per row delete signals (and the
+    counter updates and cache invalidations they make, useless for rows of a
+    deleted course); the course itself is deleted normally at the end.
+    """
+    course = Course.objects.filter(pk=course_id).first()
+    if course is None:
+        return {"deleted": False}
+    students = list(course.enrollments.values_list("student_id", flat=True))
+    rows = [
+        StudentProgress.objects.filter(course_id=course_id),
+        Enrollment.objects.filter(course_id=course_id),
+        Lesson.objects.filter(course_id=course_id),
+    ]
+    total = sum(queryset.count() for queryset in rows) + 1
+    done = 0
+    job.report_progress(done, total)
+    for queryset in rows:
+        while ids := list(queryset.values_list("pk", flat=True)[:chunk_size]):
+            if queryset.model is StudentProgress:
+                # the base manager skips StudentProgressQuerySet.delete and
+                # its counter updates; without delete signals it is one DELETE
+                done += StudentProgress._base_manager.filter(pk__in=ids).delete()[0]
+            else:
+                done += delete_rows(queryset.model, ids)
+            job.report_progress(done, total)
+    with transaction.atomic():
+        course.delete()
+        invalidate_responses("catalog:lessons", *[f"student:{pk}" for pk in students])
+    return {"deleted": True}
+
+
+@task("courses.export_progress")
+def export_progress_file(job, course_id, kind, file_format):
+    """Write the ``kind`` progress report of a course to the job result file."""
+    course = Course.objects.filter(pk=course_id).first()
+    if course is None:
+        raise JobFailed("Course not found.")
+    content_type, extension = FILE_FORMATS[file_format]
+    path = get_result_path(job, extension)
+    partial = path.with_name(f"{path.name}.part")
+    job.report_progress(0, course.enrollments.count())
+    with open(partial, "wb") as file:
+        for data in export_progress(kind, file_format, [course], progress=job.report_progress):
+            file.write(data)
+    os.replace(partial, path)
+    return file_result(path, f"course-{course.pk}-{kind}.{extension}", content_type)
+
+
+@task("courses.extract_media_metadata")
+def extract_media_metadata(job, lesson_ids=None, include_extracted=False):
+    """Extract the media metadata of the lessons (all of them by default) and deduplicate it."""
+    lessons = Lesson.objects.exclude(media="").order_by("pk")
+    if lesson_ids is not None:
+        lessons = lessons.filter(pk__in=lesson_ids)
+    if not include_extracted:
+        lessons = lessons.filter(media_checksum="")
+    lessons = list(lessons)
+    missing = []
+    for done, lesson in enumerate(lessons, start=1):
+        try:
+            deduplicate_lesson_media(update_media_metadata(lesson))
+        except FileNotFoundError:
+            missing.append(lesson.pk)
+        job.report_progress(done, len(lessons))
+    return {"extracted": len(lessons) - len(missing), "missing": missing}
+
+
+@task("courses.rebuild_progress_counters")
+def rebuild_progress_counters_task(job, course_ids=None, chunk_size=500):
+    """Rebuild the lesson and progress counters of the courses (all of them by default)."""
+    ids = Course.objects.order_by("pk").values_list("pk", flat=True)
+    if course_ids is not None:
+        ids = ids.filter(pk__in=course_ids)
+    ids = list(ids)
+    for start in range(0, len(ids), chunk_size):
+        chunk = ids[start : start + chunk_size]
+        rebuild_progress_counters(chunk)
+        job.report_progress(start + len(chunk), len(ids))
+    return {"courses": len(ids)}
@@ -0,0 +1,440 @@
+"""Query-count and latency budgets for every API endpoint.
+
+Each endpoint is exercised against datasets of several sizes and must issue
+the same number of queries at every size, within its budget. Set
+``LMS_PERF_SCALES`` (default ``10,1000``; e.g. ``10,1000,100000``) to change
+the dataset sizes, ``LMS_PERF_REPEAT`` for the number of timed requests and
+``LMS_PERF_REPORT`` to a path to write the measurements as JSON.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APITestCase
+
+from benchmarks.workload import percentile
+from courses.helpers import rebuild_progress_counters
+from courses.models import (
+    Course,
+    Enrollment,
+    Lesson,
+    MediaBlob,
+    Student,
+    StudentProgress,
+    Teacher,
+)
+from courses.uploads import create_upload, write_chunk
+from jobs.models import Job
+from jobs.queue import file_result, get_result_path
+
+SCALES = [int(scale) for scale in os.environ.get("LMS_PERF_SCALES", "10,1000").split(",")]
+REPEAT = int(os.environ.get("LMS_PERF_REPEAT", "5"))
+REPORT = os.environ.get("LMS_PERF_REPORT")
+
+# maximum number of queries per request, independent of the dataset size
+QUERY_BUDGETS = {
+    "api-root": 0,
+    "courses-list": 1,
+    # the teacher is joined, the lessons are prefetched
+    "courses-list-include": 2,
+    "courses-create": 2,
+    "courses-retrieve": 1,
+    "courses-retrieve-include": 2,
+    "courses-update": 4,
+    "courses-partial-update": 3,
+    # the course, the pending deletion job and its insert; the deletion
+    # itself runs in the job
+    "courses-destroy": 3,
+    "courses-enroll": 2,
+    "courses-bulk-enroll": 5,
+    # lessons and enrollments copied with an INSERT ... SELECT each
+    "courses-clone": 8,
+    "courses-enrolled-students": 2,
+    "courses-enrolled-students-paginated": 2,
+    "courses-analytics": 4,
+    "courses-export-progress": 2,
+    # one progress query per chunk of 5000 students
+    "courses-export-progress-matrix": 4,
+    "courses-export-progress-job": 2,
+    "courses-students-progress": 2,
+    "courses-students-progress-student": 3,
+    "lessons-list": 2,
+    "lessons-create": 5,
+    "lessons-bulk-import": 8,
+    "lessons-retrieve": 2,
+    "lessons-update": 5,
+    "lessons-partial-update": 3,
+    # the progress of the lesson (completed by every student) is deleted in
+    # one DELETE and the enrollment counters updated in one UPDATE
+    "lessons-destroy": 7,
+    "lessons-media": 1,
+    "lessons-save-progress": 3,
+    "progress-batch": 4,
+    "students-dashboard": 2,
+    "metrics": 0,
+    "jobs-retrieve": 1,
+    "jobs-download": 1,
+    "uploads-create": 2,
+    "uploads-retrieve": 1,
+    "uploads-chunk": 3,
+    "uploads-finalize": 9,
+    "uploads-destroy": 2,
+    "async-courses-list": 1,
+    "async-courses-retrieve": 1,
+    "async-lessons-list": 2,
+    "async-courses-enrolled-students": 2,
+    "async-courses-students-progress": 2,
+    "async-courses-students-progress-student": 3,
+}
+
+
+def media_file():
+    # media is classified by content, so this starts like an MP4 file
+    content = b"\x00\x00\x00\x14ftypisom\x00\x00\x02\x00isom" + b"\x00" * 1024
+    return SimpleUploadedFile("lesson.mp4", content, content_type="video/mp4")
+
+
+async def collect(content):
+    return b"".join([chunk async for chunk in content])
+
+
+class EndpointBudgetTests(APITestCase):
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        # budgets are about the database work, not cache hits
+        media_settings = override_settings(
+            MEDIA_ROOT=media_root,
+            LMS_UPLOAD_DIR=os.path.join(media_root, "uploads"),
+            LMS_RESPONSE_CACHE={**settings.LMS_RESPONSE_CACHE, "ENABLED": False},
+            LMS_JOBS={**settings.LMS_JOBS, "RESULT_DIR": os.path.join(media_root, "jobs")},
+        )
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+    def seed(self, scale):
+        teacher = Teacher.objects.create(
+            user=User.objects.create(username="teacher"), bio="Teacher bio"
+        )
+        Course.objects.bulk_create(
+            [Course(title=f"Course {i}", teacher=teacher) for i in range(scale)]
+        )
+        self.course = Course.objects.create(title="Course", teacher=teacher)
+        self.lessons = Lesson.objects.bulk_create(
+            [
+                Lesson(title=f"Lesson {i}", course=self.course, media_type="video")
+                for i in range(scale)
+            ]
+        )
+        users = User.objects.bulk_create(
+            [User(username=f"student{i}") for i in range(scale + 1)]
+        )
+        self.students = Student.objects.bulk_create([Student(user=user) for user in users])
+        # the last student is left out of the course for the enroll endpoints
+        self.outsider = self.students.pop()
+        Enrollment.objects.bulk_create(
+            [Enrollment(course=self.course, student=student) for student in self.students]
+        )
+        StudentProgress.objects.bulk_create(
+            [
+                StudentProgress(student=student, lesson=lesson, course=self.course)
+                for student, lesson in zip(self.students, self.lessons[1:])
+            ]
+        )
+        rebuild_progress_counters([self.course.id])
+        self.teacher = teacher
+
+    def endpoints(self):
+        """(name, request[, prepare]) for every route in lms/urls.py.
+
+        ``prepare`` creates the objects a request consumes (outside of the
+        measurement) and its result is passed to ``request``.
+        """
+        course_url = f"/api/courses/{self.course.id}/"
+        lessons_url = f"{course_url}lessons/"
+        lesson_url = f"{lessons_url}{self.lessons[0].id}/"
+        course_data = {"title": "Course", "description": "", "teacher": self.teacher.id}
+        student = self.students[0].id
+
+        def new_course():
+            return Course.objects.create(title="Disposable", teacher=self.teacher)
+
+        def new_lesson():
+            # completed by every student
+            lesson = Lesson.objects.create(title="Disposable", course=self.course)
+            StudentProgress.objects.bulk_create(
+                [
+                    StudentProgress(student=student, lesson=lesson, course=self.course)
+                    for student in self.students
+                ]
+            )
+            return lesson
+
+        def new_media_lesson():
+            lesson = Lesson(title="Disposable", course=self.course, media_type="video")
+            lesson.media.save("lesson.mp4", media_file())
+            return lesson
+
+        def new_upload(complete=False):
+            upload = create_upload(self.course, "Lesson", "lesson.mp4", 1024)
+            if complete:
+                write_chunk(upload, 0, io.BytesIO(media_file().read()[:1024]), 1024)
+            return f"{lessons_url}uploads/{upload.pk}/"
+
+        upload_url = new_upload()
+        # stored media for the bulk imports, used by a lesson of another course
+        digest = "0" * 64
+        blob = MediaBlob.objects.create(digest=digest, file=f"blobs/00/{digest}.mp4", size=1024)
+        Lesson.objects.create(
+            title="Stored",
+            course=new_course(),
+            blob=blob,
+            media=blob.file.name,
+            media_type="video",
+            media_size=1024,
+            media_checksum=digest,
+        )
+
+        # a finished export job
+        job = Job.objects.create(task="courses.export_progress", status=Job.SUCCEEDED)
+        path = get_result_path(job, "csv")
+        path.write_bytes(b"course_id\n")
+        job.result = file_result(path, "export.csv", "text/csv")
+        job.save()
+
+        client = self.client
+        return [
+            ("api-root", lambda: client.get("/api/")),
+            ("courses-list", lambda: client.get("/api/courses/")),
+            (
+                "courses-list-include",
+                lambda: client.get(
+                    "/api/courses/?fields=id,title&include=teacher,lessons,enrollment_count"
+                ),
+            ),
+            ("courses-create", lambda: client.post("/api/courses/", course_data)),
+            ("courses-retrieve", lambda: client.get(course_url)),
+            (
+                "courses-retrieve-include",
+                lambda: client.get(f"{course_url}?include=teacher,lessons,enrollment_count"),
+            ),
+            ("courses-update", lambda: client.put(course_url, course_data)),
+            ("courses-partial-update", lambda: client.patch(course_url, {"title": "T"})),
+            (
+                "courses-destroy",
+                lambda course: client.delete(f"/api/courses/{course.id}/"),
+                new_course,
+            ),
+            (
+                "courses-enroll",
+                lambda: client.post(
+                    f"{course_url}enroll/", {"student": self.outsider.id}
+                ),
+            ),
+            (
+                "courses-bulk-enroll",
+                lambda: client.post(
+                    f"{course_url}bulk-enroll/",
+                    {"students": [self.outsider.id, student]},
+                    format="json",
+                ),
+            ),
+            (
+                "courses-clone",
+                lambda: client.post(f"{course_url}clone/", {"enrollments": True}, format="json"),
+            ),
+            (
+                "courses-enrolled-students",
+                lambda: client.get(f"{course_url}enrolled-students/"),
+            ),
+            (
+                "courses-enrolled-students-paginated",
+                lambda: client.get(f"{course_url}enrolled-students/?page_size=50"),
+            ),
+            ("courses-analytics", lambda: client.get(f"{course_url}analytics/")),
+            (
+                "courses-export-progress",
+                lambda: client.get(f"{course_url}export-progress/"),
+            ),
+            (
+                "courses-export-progress-matrix",
+                lambda: client.get(
+                    f"{course_url}export-progress/?kind=matrix&file_format=columnar"
+                ),
+            ),
+            (
+                "courses-export-progress-job",
+                lambda: client.post(f"{course_url}export-progress/?kind=matrix"),
+            ),
+            (
+                "courses-students-progress",
+                lambda: client.get(f"{course_url}students-progress/"),
+            ),
+            (
+                "courses-students-progress-student",
+                lambda: client.get(f"{course_url}students-progress/?student={student}"),
+            ),
+            ("lessons-list", lambda: client.get(lessons_url)),
+            (
+                "lessons-create",
+                lambda: client.post(
+                    lessons_url,
+                    {"title": "Lesson", "media": media_file()},
+                    format="multipart",
+                ),
+            ),
+            (
+                "lessons-bulk-import",
+                lambda: client.post(
+                    f"{lessons_url}bulk-import/",
+                    {"lessons": [{"title": "Lesson", "media_checksum": digest}] * 2},
+                    format="json",
+                ),
+            ),
+            ("lessons-retrieve", lambda: client.get(lesson_url)),
+            (
+                "lessons-update",
+                lambda: client.put(
+                    lesson_url,
+                    {"title": "Lesson", "media": media_file()},
+                    format="multipart",
+                ),
+            ),
+            ("lessons-partial-update", lambda: client.patch(lesson_url, {"title": "L"})),
+            (
+                "lessons-destroy",
+                lambda lesson: client.delete(f"{lessons_url}{lesson.id}/"),
+                new_lesson,
+            ),
+            (
+                "lessons-media",
+                lambda lesson: client.get(
+                    f"{lessons_url}{lesson.id}/media/?student={student}",
+                    HTTP_RANGE="bytes=0-3",
+                ),
+                new_media_lesson,
+            ),
+            (
+                "lessons-save-progress",
+                lambda: client.post(
+                    f"{lessons_url}{self.lessons[0].id}/save-progress/",
+                    {"student": student},
+                ),
+            ),
+            (
+                "progress-batch",
+                lambda: client.post(
+                    "/api/progress/batch/",
+                    {
+                        "events": [
+                            {"student": student, "lesson": lesson.id}
+                            for lesson in self.lessons[:2]
+                        ]
+                    },
+                    format="json",
+                ),
+            ),
+            ("students-dashboard", lambda: client.get(f"/api/students/{student}/dashboard/")),
+            ("metrics", lambda: client.get("/api/metrics/")),
+            ("jobs-retrieve", lambda: client.get(f"/api/jobs/{job.pk}/")),
+            ("jobs-download", lambda: client.get(f"/api/jobs/{job.pk}/download/")),
+            (
+                "uploads-create",
+                lambda: client.post(
+                    f"{lessons_url}uploads/",
+                    {"title": "Lesson", "filename": "lesson.mp4", "size": 1024},
+                ),
+            ),
+            ("uploads-retrieve", lambda: client.get(upload_url)),
+            (
+                "uploads-chunk",
+                lambda url: client.patch(
+                    url,
+                    b"0" * 1024,
+                    content_type="application/offset+octet-stream",
+                    HTTP_UPLOAD_OFFSET="0",
+                ),
+                new_upload,
+            ),
+            (
+                "uploads-finalize",
+                lambda url: client.post(f"{url}finalize/"),
+                lambda: new_upload(complete=True),
+            ),
+            ("uploads-destroy", lambda url: client.delete(url), new_upload),
+            ("async-courses-list", lambda: client.get("/api/async/courses/")),
+            ("async-courses-retrieve", lambda: client.get(f"/api/async{course_url[4:]}")),
+            ("async-lessons-list", lambda: client.get(f"/api/async{lessons_url[4:]}")),
+            (
+                "async-courses-enrolled-students",
+                lambda: client.get(f"/api/async{course_url[4:]}enrolled-students/"),
+            ),
+            (
+                "async-courses-students-progress",
+                lambda: client.get(f"/api/async{course_url[4:]}students-progress/"),
+            ),
+            (
+                "async-courses-students-progress-student",
+                lambda: client.get(
+                    f"/api/async{course_url[4:]}students-progress/?student={student}"
+                ),
+            ),
+        ]
+
+    def measure(self, request, prepare=None):
+        """Issue ``request`` and return (query count, seconds)."""
+        args = [prepare()] if prepare else []
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            response = request(*args)
+            if response.streaming and response.is_async:
+                content = async_to_sync(collect)(response.streaming_content)
+            elif response.streaming:
+                content = b"".join(response.streaming_content)
+            else:
+                content = response.content
+            elapsed = time.perf_counter() - start
+        self.assertLess(response.status_code, 400, content)
+        return len(queries), elapsed
+
+    def test_query_budgets(self):
+        report = {}
+        for scale in SCALES:
+            with transaction.atomic():
+                self.seed(scale)
+                for name, *request in self.endpoints():
+                    # the first call warms up, later ones repeat it on the
+                    # same (or freshly prepared) objects
+                    self.measure(*request)
+                    measurements = [self.measure(*request) for _ in range(REPEAT)]
+                    timings = [elapsed * 1000 for _, elapsed in measurements]
+                    report.setdefault(name, {})[scale] = {
+                        "queries": measurements[-1][0],
+                        "p50_ms": round(percentile(timings, 50), 3),
+                        "p95_ms": round(percentile(timings, 95), 3),
+                        "p99_ms": round(percentile(timings, 99), 3),
+                    }
+                transaction.set_rollback(True)
+
+        if REPORT:
+            with open(REPORT, "w") as file:
+                json.dump({"scales": SCALES, "endpoints": report}, file, indent=2)
+
+        self.assertEqual(set(report), set(QUERY_BUDGETS))
+        for name, results in report.items():
+            with self.subTest(endpoint=name):
+                counts = {scale: result["queries"] for scale, result in results.items()}
+                self.assertEqual(len(set(counts.values())), 1, counts)
+                self.assertLessEqual(max(counts.values()), QUERY_BUDGETS[name], counts)
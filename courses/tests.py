@@ -1,3 +1,5 @@
+import json
+
 from rest_framework import status
 from rest_framework.test import APITestCase
 from django.contrib.auth.models import User
@@ -24,7 +26,9 @@ class CourseTests(APITestCase):
         self.assertEqual(response.data["teacher"], self.teacher.id)
 
 
-from courses.models import Student
+from unittest import mock
+from django.db.models import QuerySet
+from courses.models import Enrollment, Student
 
 
 class EnrollmentTests(APITestCase):
@@ -57,6 +61,26 @@ class EnrollmentTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_200_OK)
         self.assertEqual(response.data["message"], "Already enrolled.")
 
+    def test_concurrent_enrollment(self):
+        self.course.enrollments.create(student=self.student)
+        get = QuerySet.get
+        lookups = []
+
+        def get_before_enrollment(queryset, *args, **kwargs):
+            # another request enrolls the student between the lookup and the insert
+            if queryset.model is Enrollment and not lookups:
+                lookups.append(kwargs)
+                raise Enrollment.DoesNotExist
+            return get(queryset, *args, **kwargs)
+
+        url = f"/api/courses/{self.course.id}/enroll/"
+        with mock.patch.object(QuerySet, "get", get_before_enrollment):
+            response = self.client.post(url, {"student": self.student.id}, format="json")
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["message"], "Already enrolled.")
+        self.assertEqual(self.course.enrollments.count(), 1)
+
 
 class EnrolledStudentsTests(APITestCase):
 
@@ -74,18 +98,51 @@ class EnrolledStudentsTests(APITestCase):
         )
         self.course.enrollments.create(student=self.student)
 
-    def test_enrolled_students(self):
+    def get_enrolled_students(self):
         url = f"/api/courses/{self.course.id}/enrolled-students/"
         response = self.client.get(url)
         self.assertEqual(response.status_code, status.HTTP_200_OK)
-        self.assertEqual(len(response.data["enrolled_students"]), 1)
-        self.assertEqual(response.data["enrolled_students"][0]["id"], self.student.id)
+        return json.loads(b"".join(response.streaming_content))["enrolled_students"]
+
+    def test_enrolled_students(self):
+        students = self.get_enrolled_students()
+        self.assertEqual(len(students), 1)
+        self.assertEqual(students[0]["id"], self.student.id)
+        self.assertEqual(students[0]["username"], "student")
+
+    def test_enrolled_students_query_count(self):
+        with self.assertNumQueries(2):
+            self.get_enrolled_students()
+        users = User.objects.bulk_create(
+            [User(username=f"student{i}") for i in range(50)]
+        )
+        students = Student.objects.bulk_create([Student(user=user) for user in users])
+        for student in students:
+            self.course.enrollments.create(student=student)
+        with self.assertNumQueries(2):
+            self.assertEqual(len(self.get_enrolled_students()), 51)
 
 
 from django.core.files.uploadedfile import SimpleUploadedFile
+import struct
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.test import override_settings
+from courses.ingest import sniff_media_type
 from courses.models import Lesson
 
 
+def mp4_bytes(seconds=2, padding=0):
+    """A minimal MP4 file: an ``ftyp`` box and a ``moov`` box with a ``mvhd``."""
+    ftyp = b"\x00\x00\x00\x14ftypisom\x00\x00\x02\x00isom"
+    mvhd = b"mvhd" + bytes(4) + struct.pack(">IIII", 0, 0, 1000, seconds * 1000)
+    mvhd = struct.pack(">I", len(mvhd) + 4) + mvhd
+    moov = struct.pack(">I", len(mvhd) + 8) + b"moov" + mvhd
+    free = struct.pack(">I", padding + 8) + b"free" + bytes(padding)
+    return ftyp + moov + free
+
+
 class LessonTests(APITestCase):
 
     def setUp(self):
@@ -100,10 +157,15 @@ class LessonTests(APITestCase):
         self.course = Course.objects.create(
             title="Test Course", description="Course description", teacher=self.teacher
         )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(MEDIA_ROOT=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
 
     def test_create_lesson(self):
         file = SimpleUploadedFile(
-            "test_video.mp4", b"file_content", content_type="video/mp4"
+            "test_video.mp4", mp4_bytes(), content_type="video/mp4"
         )
         data = {
             "title": "New Lesson",
@@ -218,3 +280,1872 @@ class EnrollInNonExistentCourseTests(APITestCase):
         response = self.client.post(url, data, format="json")
         self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
         self.assertEqual(response.data["detail"], "Course not found.")
+
+
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+
+class ProgressCountersTests(APITestCase):
+
+    def setUp(self):
+        self.student_user = User.objects.create_user(
+            username="student", password="password"
+        )
+        self.student = Student.objects.create(user=self.student_user)
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.lessons = [
+            Lesson.objects.create(
+                title=f"Lesson {i}",
+                course=self.course,
+                media_type="video",
+                media="test_video.mp4",
+            )
+            for i in range(4)
+        ]
+        self.enrollment = self.course.enrollments.create(student=self.student)
+
+    def save_progress(self, lesson):
+        url = f"/api/courses/{self.course.id}/lessons/{lesson.id}/save-progress/"
+        return self.client.post(url, {"student": self.student.id}, format="json")
+
+    def test_deleting_progress_updates_the_counter(self):
+        for lesson in self.lessons[:3]:
+            self.save_progress(lesson)
+        StudentProgress.objects.get(lesson=self.lessons[0]).delete()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons, 2)
+        self.student.progress.all().delete()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.enrollment.completed_lessons, 0)
+
+    def test_counters_follow_progress_and_lessons(self):
+        self.save_progress(self.lessons[0])
+        self.save_progress(self.lessons[0])
+        self.save_progress(self.lessons[1])
+        self.course.refresh_from_db()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 4)
+        self.assertEqual(self.enrollment.completed_lessons, 2)
+
+        url = f"/api/courses/{self.course.id}/lessons/{self.lessons[1].id}/"
+        self.client.delete(url)
+        self.course.refresh_from_db()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 3)
+        self.assertEqual(self.enrollment.completed_lessons, 1)
+
+    def test_enrolling_again_keeps_completed_lessons(self):
+        self.save_progress(self.lessons[0])
+        self.save_progress(self.lessons[1])
+        self.enrollment.delete()
+        response = self.client.post(
+            f"/api/courses/{self.course.id}/enroll/", {"student": self.student.id}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        enrollment = Enrollment.objects.get(student=self.student, course=self.course)
+        self.assertEqual(enrollment.completed_lessons, 2)
+
+        enrollment.delete()
+        self.client.post(
+            f"/api/courses/{self.course.id}/bulk-enroll/",
+            {"students": [self.student.id]},
+            format="json",
+        )
+        enrollment = Enrollment.objects.get(student=self.student, course=self.course)
+        self.assertEqual(enrollment.completed_lessons, 2)
+        call_command("rebuild_progress_counters", "--verify", stdout=StringIO())
+
+    def test_deleting_a_lesson_updates_all_its_students(self):
+        students = [self.student] + [
+            Student.objects.create(
+                user=User.objects.create_user(username=f"student{i}", password="password")
+            )
+            for i in range(3)
+        ]
+        for student in students[1:]:
+            self.course.enrollments.create(student=student)
+        for student in students:
+            StudentProgress.objects.create(student=student, lesson=self.lessons[0])
+            StudentProgress.objects.create(student=student, lesson=self.lessons[1])
+        self.lessons[0].delete()
+        self.assertEqual(
+            list(Enrollment.objects.values_list("completed_lessons", flat=True)), [1] * 4
+        )
+        call_command("rebuild_progress_counters", "--verify", stdout=StringIO())
+
+        # the deleted students' progress goes with their enrollments
+        students[1].user.delete()
+        self.assertEqual(StudentProgress.objects.count(), 3)
+        call_command("rebuild_progress_counters", "--verify", stdout=StringIO())
+
+    def test_students_progress_reads_counters(self):
+        self.save_progress(self.lessons[0])
+        url = f"/api/courses/{self.course.id}/students-progress/"
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(
+            response.data["students_progress"],
+            [{"student": "student", "progress": "25.00%"}],
+        )
+
+    def test_rebuild_command_repairs_counters(self):
+        self.save_progress(self.lessons[0])
+        Enrollment.objects.update(completed_lessons=3)
+        Course.objects.update(lesson_count=0)
+        with self.assertRaises(CommandError):
+            call_command("rebuild_progress_counters", "--verify", stdout=StringIO())
+
+        call_command("rebuild_progress_counters", stdout=StringIO())
+        call_command("rebuild_progress_counters", "--verify", stdout=StringIO())
+        self.course.refresh_from_db()
+        self.enrollment.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 4)
+        self.assertEqual(self.enrollment.completed_lessons, 1)
+
+
+class BulkEnrollTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        users = User.objects.bulk_create(
+            [User(username=f"student{i}") for i in range(5)]
+        )
+        self.students = Student.objects.bulk_create(
+            [Student(user=user) for user in users]
+        )
+        self.course.enrollments.create(student=self.students[0])
+        self.url = f"/api/courses/{self.course.id}/bulk-enroll/"
+
+    def test_bulk_enroll_list(self):
+        ids = [student.id for student in self.students] + [self.students[1].id, 999]
+        response = self.client.post(self.url, {"students": ids}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, {"created": 4, "already_enrolled": 1, "unknown": 1}
+        )
+        self.assertEqual(self.course.enrollments.count(), 5)
+
+    def test_bulk_enroll_csv(self):
+        rows = "student\n" + "\n".join(str(student.id) for student in self.students)
+        file = SimpleUploadedFile("students.csv", rows.encode(), content_type="text/csv")
+        response = self.client.post(self.url, {"file": file}, format="multipart")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, {"created": 4, "already_enrolled": 1, "unknown": 0}
+        )
+
+    def test_bulk_enroll_query_count(self):
+        users = User.objects.bulk_create(
+            [User(username=f"bulk{i}") for i in range(300)]
+        )
+        students = Student.objects.bulk_create([Student(user=user) for user in users])
+        ids = [student.id for student in students]
+        with self.assertNumQueries(8):
+            response = self.client.post(self.url, {"students": ids}, format="json")
+        self.assertEqual(response.data["created"], 300)
+
+
+class ProgressBatchTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.other_course = Course.objects.create(
+            title="Other Course", description="Course description", teacher=self.teacher
+        )
+        self.lessons = [
+            Lesson.objects.create(
+                title=f"Lesson {i}",
+                course=self.course,
+                media_type="video",
+                media="test_video.mp4",
+            )
+            for i in range(3)
+        ]
+        self.other_lesson = Lesson.objects.create(
+            title="Other Lesson",
+            course=self.other_course,
+            media_type="video",
+            media="test_video.mp4",
+        )
+        users = User.objects.bulk_create(
+            [User(username=f"student{i}") for i in range(2)]
+        )
+        self.students = Student.objects.bulk_create(
+            [Student(user=user) for user in users]
+        )
+        for student in self.students:
+            self.course.enrollments.create(student=student)
+        self.lessons[0].progress.create(student=self.students[0])
+
+    def test_save_progress_batch(self):
+        events = [
+            {"student": student.id, "lesson": lesson.id}
+            for student in self.students
+            for lesson in self.lessons + [self.other_lesson]
+        ]
+        events.append(events[0])
+        response = self.client.post(
+            "/api/progress/batch/", {"events": events}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(
+            response.data, {"saved": 5, "already_saved": 1, "rejected": 2}
+        )
+        self.assertEqual(
+            list(
+                self.course.enrollments.order_by("student_id").values_list(
+                    "completed_lessons", flat=True
+                )
+            ),
+            [3, 3],
+        )
+
+    def test_save_progress_batch_invalid(self):
+        response = self.client.post(
+            "/api/progress/batch/", {"events": [{"student": 1}]}, format="json"
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+from pathlib import Path
+from courses.models import StudentProgress
+from courses.progress_journal import get_progress_journal
+
+
+class WriteBehindProgressTests(APITestCase):
+
+    def setUp(self):
+        self.student_user = User.objects.create_user(
+            username="student", password="password"
+        )
+        self.student = Student.objects.create(user=self.student_user)
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.lessons = [
+            Lesson.objects.create(
+                title=f"Lesson {i}",
+                course=self.course,
+                media_type="video",
+                media="test_video.mp4",
+            )
+            for i in range(2)
+        ]
+        self.course.enrollments.create(student=self.student)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(
+            LMS_PROGRESS_WRITE_BEHIND=True,
+            LMS_PROGRESS_JOURNAL=Path(tmp.name) / "journal.sqlite3",
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def save_progress(self, lesson):
+        url = f"/api/courses/{self.course.id}/lessons/{lesson.id}/save-progress/"
+        return self.client.post(url, {"student": self.student.id}, format="json")
+
+    def test_progress_is_queued_then_flushed(self):
+        with self.assertNumQueries(0):
+            response = self.save_progress(self.lessons[0])
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertFalse(StudentProgress.objects.exists())
+
+        url = f"/api/courses/{self.course.id}/students-progress/?student={self.student.id}"
+        response = self.client.get(url)
+        self.assertEqual(response.data["students_progress"][0]["progress"], "50.00%")
+
+        call_command("flush_progress", stdout=StringIO())
+        self.assertEqual(StudentProgress.objects.count(), 1)
+        self.assertEqual(self.course.enrollments.get().completed_lessons, 1)
+        response = self.client.get(url)
+        self.assertEqual(response.data["students_progress"][0]["progress"], "50.00%")
+
+    def test_flush_replay_is_idempotent(self):
+        self.save_progress(self.lessons[0])
+        call_command("flush_progress", stdout=StringIO())
+        self.save_progress(self.lessons[0])
+        self.save_progress(self.lessons[1])
+        out = StringIO()
+        call_command("flush_progress", stdout=out)
+        self.assertIn("saved: 1, already saved: 1", out.getvalue())
+        self.assertEqual(StudentProgress.objects.count(), 2)
+
+    def test_pending_events_are_filtered_in_the_journal(self):
+        journal = get_progress_journal()
+        journal.append([(self.student.id, self.lessons[0].id), (self.student.id, 0), (0, 0)])
+        self.assertEqual(len(journal.pending()), 3)
+        self.assertEqual(
+            journal.pending(lesson_ids=[lesson.id for lesson in self.lessons]),
+            {(self.student.id, self.lessons[0].id)},
+        )
+        self.assertEqual(journal.pending(0, [0]), {(0, 0)})
+        url = f"/api/courses/{self.course.id}/students-progress/"
+        response = self.client.get(url)
+        self.assertEqual(response.data["students_progress"][0]["progress"], "50.00%")
+        response = self.client.get(f"/api/async/courses/{self.course.id}/students-progress/")
+        self.assertEqual(response.json()["students_progress"][0]["progress"], "50.00%")
+
+
+class KeysetPaginationTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.courses = Course.objects.bulk_create(
+            [Course(title=f"Course {i}", teacher=self.teacher) for i in range(5)]
+        )
+        users = User.objects.bulk_create(
+            [User(username=f"student{i}") for i in range(5)]
+        )
+        students = Student.objects.bulk_create([Student(user=user) for user in users])
+        self.course = self.courses[0]
+        for student in students:
+            self.course.enrollments.create(student=student)
+
+    def collect(self, url, key):
+        items = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            items += response.data[key]
+            url = response.data["next"]
+        return items
+
+    def test_courses_cursor_pages(self):
+        courses = self.collect("/api/courses/?page_size=2", "results")
+        self.assertEqual(
+            [course["id"] for course in courses], [course.id for course in self.courses]
+        )
+
+    def test_enrolled_students_cursor_pages(self):
+        url = f"/api/courses/{self.course.id}/enrolled-students/?page_size=2"
+        response = self.client.get(url)
+        self.assertEqual(len(response.data["enrolled_students"]), 2)
+        students = self.collect(url, "enrolled_students")
+        self.assertEqual(len(students), 5)
+
+    def test_students_progress_cursor_pages(self):
+        url = f"/api/courses/{self.course.id}/students-progress/?page_size=3"
+        progress = self.collect(url, "students_progress")
+        self.assertEqual(
+            [item["student"] for item in progress],
+            [f"student{i}" for i in range(5)],
+        )
+
+
+from courses.instrumentation import registry
+
+
+@override_settings(
+    LMS_INSTRUMENTATION={"ENABLED": True, "SAMPLE_RATE": 1.0, "SLOW_QUERY_MS": 0}
+)
+class InstrumentationTests(APITestCase):
+
+    def setUp(self):
+        registry.clear()
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+
+    def test_server_timing_and_metrics(self):
+        with self.assertLogs("courses.instrumentation", "WARNING") as logs:
+            response = self.client.get(
+                f"/api/courses/{self.course.id}/students-progress/"
+            )
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+        self.assertIn("courses/views.py", logs.output[0])
+
+        response = self.client.get("/api/metrics/")
+        metrics = response.content.decode()
+        self.assertIn(
+            'lms_request_queries_count{view="CoursesViewSet.students_progress"} 1',
+            metrics,
+        )
+        self.assertIn(
+            'lms_request_queries_bucket{view="CoursesViewSet.students_progress",le="2"} 1',
+            metrics,
+        )
+
+    def test_serialization_time(self):
+        with self.assertLogs("courses.instrumentation", "WARNING"):
+            response = self.client.get(f"/api/courses/{self.course.id}/")
+        timing = dict(
+            entry.split(";")[:2] for entry in response["Server-Timing"].split(", ")
+        )
+        self.assertGreater(float(timing["serialize"].removeprefix("dur=")), 0)
+        metrics = self.client.get("/api/metrics/").content.decode()
+        self.assertIn(
+            'lms_request_serialize_seconds_count{view="CoursesViewSet.retrieve"} 1',
+            metrics,
+        )
+
+
+import threading
+import time
+from django.core.cache import cache
+from courses.cache import get_or_compute
+
+
+class ResponseCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.url = f"/api/courses/{self.course.id}/lessons/"
+
+    def test_lessons_list_is_cached_and_invalidated(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data["results"], [])
+
+        Lesson.objects.create(title="Test Lesson", course=self.course)
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["results"][0]["title"], "Test Lesson")
+
+    def test_catalog_lesson_count_is_invalidated(self):
+        self.assertEqual(self.client.get("/api/courses/").data["results"][0]["lesson_count"], 0)
+        lesson = Lesson.objects.create(title="Test Lesson", course=self.course)
+        self.assertEqual(self.client.get("/api/courses/").data["results"][0]["lesson_count"], 1)
+        lesson.delete()
+        self.assertEqual(self.client.get("/api/courses/").data["results"][0]["lesson_count"], 0)
+
+    def test_etag_not_modified(self):
+        response = self.client.get("/api/courses/")
+        etag = response["ETag"]
+        response = self.client.get("/api/courses/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+        self.course.title = "Renamed"
+        self.course.save()
+        response = self.client.get("/api/courses/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["results"][0]["title"], "Renamed")
+
+    def test_waiters_take_over_a_released_lock(self):
+        # the lock holder failed, or its response was not cacheable
+        cache.add("lms:response:key:lock", 1)
+        threading.Timer(0.1, cache.delete, ["lms:response:key:lock"]).start()
+        start = time.monotonic()
+        self.assertEqual(get_or_compute("lms:response:key", lambda: "value"), "value")
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertIsNone(cache.get("lms:response:key:lock"))
+
+    def test_concurrent_misses_wait_for_lock_holder(self):
+        cache.add("lms:response:key:lock", 1)
+        threading.Timer(0.1, cache.set, ["lms:response:key", "value"]).start()
+
+        def compute():
+            raise AssertionError("computed twice")
+
+        self.assertEqual(get_or_compute("lms:response:key", compute), "value")
+
+
+import re
+import unittest
+from django.db import connection
+from django.db.models import Count
+
+
+class IndexUsageTests(APITestCase):
+    """The hot lookups must be index scans, not table scans."""
+
+    def setUp(self):
+        if connection.vendor == "postgresql":
+            # tiny test tables would otherwise always be scanned sequentially
+            with connection.cursor() as cursor:
+                cursor.execute("SET enable_seqscan = off")
+        elif connection.vendor != "sqlite":
+            raise unittest.SkipTest("EXPLAIN checks support SQLite and PostgreSQL.")
+
+    def assertUsesIndex(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == "sqlite":
+            table_scans = re.findall(r"SCAN courses_\w+$", plan, re.MULTILINE)
+            self.assertFalse(table_scans, plan)
+            self.assertIn("INDEX", plan)
+        else:
+            self.assertNotIn("Seq Scan", plan)
+
+    def test_hot_queries_use_indexes(self):
+        self.assertUsesIndex(Enrollment.objects.filter(course_id=1, student_id=1))
+        self.assertUsesIndex(Enrollment.objects.filter(course_id=1).order_by("id"))
+        self.assertUsesIndex(Lesson.objects.filter(course_id=1).order_by("id"))
+        self.assertUsesIndex(StudentProgress.objects.filter(student_id=1, lesson_id=1))
+        self.assertUsesIndex(
+            StudentProgress.objects.filter(course_id=1)
+            .values("student_id")
+            .annotate(count=Count("pk"))
+        )
+        self.assertUsesIndex(StudentProgress.objects.filter(lesson_id=1))
+
+
+import hashlib
+from datetime import timedelta
+from django.conf import settings
+from django.utils import timezone
+from courses.models import LessonUpload, MediaBlob
+from asgiref.sync import sync_to_async
+import csv
+from courses import analytics
+from courses.exports import read_columnar
+
+
+class ChunkedUploadTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(
+            MEDIA_ROOT=Path(tmp.name) / "media", LMS_UPLOAD_DIR=Path(tmp.name) / "uploads"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = mp4_bytes(padding=10000)
+        self.url = f"/api/courses/{self.course.id}/lessons/uploads/"
+
+    def initiate(self, **data):
+        data = {"title": "Lecture", "filename": "lecture.mp4", "size": len(self.content), **data}
+        response = self.client.post(self.url, data, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        return f"{self.url}{response.data['id']}/"
+
+    def send(self, url, offset, chunk, **headers):
+        return self.client.patch(
+            url,
+            chunk,
+            content_type="application/offset+octet-stream",
+            HTTP_UPLOAD_OFFSET=str(offset),
+            **headers,
+        )
+
+    def test_chunked_upload(self):
+        url = self.initiate(checksum=hashlib.sha256(self.content).hexdigest())
+        response = self.send(url, 0, self.content[:4000])
+        self.assertEqual(response.data["offset"], 4000)
+        # a retried or out of order chunk is refused with the current offset
+        response = self.send(url, 0, self.content[:4000])
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.get(url).data["offset"], 4000)
+        response = self.send(
+            url,
+            4000,
+            self.content[4000:],
+            HTTP_UPLOAD_CHECKSUM=hashlib.sha256(self.content[4000:]).hexdigest(),
+        )
+        self.assertEqual(response.data["offset"], len(self.content))
+        self.assertFalse(Lesson.objects.exists())
+
+        response = self.client.post(f"{url}finalize/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        lesson = Lesson.objects.get()
+        self.assertEqual(lesson.media_type, "video")
+        self.assertEqual(lesson.media.read(), self.content)
+        self.assertFalse(LessonUpload.objects.exists())
+
+    def test_corrupted_chunk_and_checksum_mismatch(self):
+        url = self.initiate(checksum="0" * 64)
+        response = self.send(url, 0, self.content, HTTP_UPLOAD_CHECKSUM="0" * 64)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url).data["offset"], 0)
+        self.send(url, 0, self.content)
+        response = self.client.post(f"{url}finalize/")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Lesson.objects.exists())
+
+    def test_cleanup_abandoned_uploads(self):
+        self.initiate()
+        LessonUpload.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        call_command("cleanup_uploads", stdout=StringIO())
+        self.assertFalse(LessonUpload.objects.exists())
+        self.assertEqual(list((settings.LMS_UPLOAD_DIR).glob("*.part")), [])
+
+
+from django.http import FileResponse
+
+
+class LessonMediaTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.student_user = User.objects.create_user(
+            username="student", password="password"
+        )
+        self.student = Student.objects.create(user=self.student_user)
+        Enrollment.objects.create(student=self.student, course=self.course)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(MEDIA_ROOT=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        cache.clear()
+        self.content = bytes(range(256)) * 100
+        self.lesson = Lesson(title="Lecture", course=self.course, media_type="video")
+        self.lesson.media.save("lecture.mp4", ContentFile(self.content))
+        self.url = (
+            f"/api/courses/{self.course.id}/lessons/{self.lesson.id}/media/"
+            f"?student={self.student.id}"
+        )
+
+    def test_full_response(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), self.content)
+        self.assertEqual(response["Content-Type"], "video/mp4")
+        self.assertEqual(response["Accept-Ranges"], "bytes")
+        self.assertEqual(response["Content-Length"], str(len(self.content)))
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=100-199")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+        self.assertEqual(b"".join(response.streaming_content), self.content[100:200])
+        self.assertEqual(response["Content-Range"], f"bytes 100-199/{len(self.content)}")
+        self.assertEqual(response["Content-Length"], "100")
+        # sent as a file, WSGI servers can use sendfile
+        self.assertIsInstance(response, FileResponse)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=-50")
+        self.assertEqual(b"".join(response.streaming_content), self.content[-50:])
+        response = self.client.get(self.url, HTTP_RANGE=f"bytes={len(self.content)}-")
+        self.assertEqual(
+            response.status_code, status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+        )
+
+    def test_conditional_requests(self):
+        etag = self.client.get(self.url)["ETag"]
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        # a stale If-Range gets the whole file instead of the range
+        response = self.client.get(
+            self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE='"stale"'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        response = self.client.get(self.url, HTTP_RANGE="bytes=0-9", HTTP_IF_RANGE=etag)
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    def test_enrollment_is_required(self):
+        other = Student.objects.create(
+            user=User.objects.create_user(username="other", password="password")
+        )
+        url = f"/api/courses/{self.course.id}/lessons/{self.lesson.id}/media/"
+        self.assertEqual(
+            self.client.get(f"{url}?student={other.id}").status_code,
+            status.HTTP_403_FORBIDDEN,
+        )
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(
+            f"/api/courses/{self.course.id}/lessons/0/media/?student={self.student.id}"
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_lessons_link_to_the_media_action(self):
+        media_url = f"http://testserver/api/courses/{self.course.id}/lessons/{self.lesson.id}/media/"
+        response = self.client.get(f"/api/courses/{self.course.id}/lessons/{self.lesson.id}/")
+        self.assertEqual(response.data["media"], media_url)
+        response = self.client.get(f"/api/courses/{self.course.id}/?include=lessons")
+        self.assertEqual(response.data["lessons"][0]["media"], media_url)
+        response = self.client.get(f"/api/async/courses/{self.course.id}/lessons/")
+        self.assertEqual(json.loads(response.content)["results"][0]["media"], media_url)
+        # the stored files are not served directly
+        response = self.client.get(f"/media/{self.lesson.media.name}")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_access_check_is_cached(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(response.status_code, status.HTTP_206_PARTIAL_CONTENT)
+
+    @override_settings(LMS_MEDIA_OFFLOAD="x-accel-redirect")
+    def test_offload(self):
+        response = self.client.get(self.url)
+        self.assertEqual(
+            response["X-Accel-Redirect"], f"/protected-media/{self.lesson.media.name}"
+        )
+        self.assertEqual(response.content, b"")
+        with override_settings(LMS_MEDIA_OFFLOAD="x-sendfile"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Sendfile"], self.lesson.media.path)
+
+
+class MediaIngestTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings = override_settings(MEDIA_ROOT=tmp.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.url = f"/api/courses/{self.course.id}/lessons/"
+
+    def test_sniff_media_type(self):
+        samples = {
+            mp4_bytes(): "video",
+            b"\x00\x00\x00\x1cftypM4A \x00\x00\x00\x00": "audio",
+            b"\x1a\x45\xdf\xa3\x9f\x42\x86\x81\x01webm": "video",
+            b"OggS\x00\x02" + bytes(22) + b"\x01vorbis": "audio",
+            b"RIFF\x24\x00\x00\x00WAVEfmt ": "audio",
+            b"RIFF\x24\x00\x00\x00AVI LIST": "video",
+            b"ID3\x04\x00\x00": "audio",
+            b"\xff\xfb\x90\x64": "audio",
+            b"fLaC\x00\x00\x00\x22": "audio",
+            b"%PDF-1.7\n": "pdf",
+            b"file_content": None,
+            b"<html>": None,
+        }
+        for head, media_type in samples.items():
+            with self.subTest(head=head[:12]):
+                self.assertEqual(sniff_media_type(head), media_type)
+
+    def post(self, name, content, content_type):
+        file = SimpleUploadedFile(name, content, content_type=content_type)
+        return self.client.post(
+            self.url, {"title": "Lesson", "media": file}, format="multipart"
+        )
+
+    def test_pdf_lesson(self):
+        pages = b"".join(
+            b"%d 0 obj << /Type /Page /Parent 2 0 R >> endobj\n" % (i + 3)
+            for i in range(3)
+        )
+        content = b"%PDF-1.4\n2 0 obj << /Type /Pages /Count 3 >> endobj\n" + pages
+        response = self.post("notes.pdf", content, "application/pdf")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["media_type"], "pdf")
+        self.assertEqual(response.data["media_page_count"], 3)
+        self.assertEqual(response.data["media_size"], len(content))
+        self.assertEqual(
+            response.data["media_checksum"], hashlib.sha256(content).hexdigest()
+        )
+
+    def test_durations(self):
+        response = self.post("lecture.mp4", mp4_bytes(seconds=90), "video/mp4")
+        self.assertEqual(response.data["media_type"], "video")
+        self.assertEqual(response.data["media_duration"], 90)
+        # 1 second of 8 kHz mono 8-bit audio
+        wav = (
+            b"RIFF" + struct.pack("<I", 36 + 8000) + b"WAVE"
+            + b"fmt " + struct.pack("<IHHIIHH", 16, 1, 1, 8000, 8000, 1, 8)
+            + b"data" + struct.pack("<I", 8000) + bytes(8000)
+        )
+        response = self.post("podcast.wav", wav, "audio/wav")
+        self.assertEqual(response.data["media_type"], "audio")
+        self.assertEqual(response.data["media_duration"], 1)
+
+    def test_content_type_is_not_trusted(self):
+        response = self.post("lecture.mp4", b"<html></html>", "video/mp4")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.post("lecture.bin", mp4_bytes(), "application/octet-stream")
+        self.assertEqual(response.data["media_type"], "video")
+
+    @override_settings(LMS_MEDIA_METADATA_INLINE=False)
+    def test_deferred_extraction(self):
+        response = self.post("lecture.mp4", mp4_bytes(seconds=5), "video/mp4")
+        lesson = Lesson.objects.get(pk=response.data["id"])
+        self.assertEqual(lesson.media_checksum, "")
+        self.assertEqual(lesson.media_size, len(mp4_bytes()))
+        call_command("extract_media_metadata", stdout=StringIO())
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.media_checksum, hashlib.sha256(mp4_bytes(seconds=5)).hexdigest())
+        self.assertEqual(lesson.media_duration, 5)
+
+
+class MediaBlobTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.other_course = Course.objects.create(
+            title="Other Course", description="Course description", teacher=self.teacher
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = Path(tmp.name) / "media"
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, LMS_UPLOAD_DIR=Path(tmp.name) / "uploads"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = mp4_bytes(seconds=30, padding=5000)
+
+    def post(self, course, name="intro.mp4"):
+        file = SimpleUploadedFile(name, self.content, content_type="video/mp4")
+        return self.client.post(
+            f"/api/courses/{course.id}/lessons/",
+            {"title": "Intro", "media": file},
+            format="multipart",
+        )
+
+    def stored_files(self):
+        return [path for path in self.media_root.rglob("*") if path.is_file()]
+
+    def test_same_content_is_stored_once(self):
+        self.post(self.course)
+        self.post(self.other_course, name="copy.MP4")
+        first, second = Lesson.objects.order_by("pk")
+        self.assertEqual(first.blob_id, second.blob_id)
+        self.assertEqual(first.media.name, second.media.name)
+        digest = hashlib.sha256(self.content).hexdigest()
+        self.assertEqual(first.media.name, f"blobs/{digest[:2]}/{digest}.mp4")
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertEqual(
+            MediaBlob.objects.annotate(references=Count("lessons")).get().references, 2
+        )
+
+    def test_known_upload_completes_on_initiate(self):
+        self.post(self.course)
+        url = f"/api/courses/{self.other_course.id}/lessons/uploads/"
+        response = self.client.post(
+            url,
+            {
+                "title": "Intro",
+                "filename": "intro.mp4",
+                "size": len(self.content),
+                "checksum": hashlib.sha256(self.content).hexdigest(),
+            },
+            format="json",
+        )
+        self.assertEqual(response.data["offset"], len(self.content))
+        response = self.client.post(f"{url}{response.data['id']}/finalize/")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["media_duration"], 30)
+        self.assertEqual(Lesson.objects.values("blob").distinct().count(), 1)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_collect_unreferenced_blobs(self):
+        self.post(self.course)
+        self.post(self.other_course)
+        Lesson.objects.filter(course=self.course).delete()
+        call_command("collect_media_blobs", "--grace-hours", "0", stdout=StringIO())
+        self.assertEqual(MediaBlob.objects.count(), 1)
+
+        Lesson.objects.all().delete()
+        call_command("collect_media_blobs", stdout=StringIO())
+        # still within the grace period
+        self.assertEqual(MediaBlob.objects.count(), 1)
+        out = StringIO()
+        call_command("collect_media_blobs", "--grace-hours", "0", stdout=out)
+        self.assertIn("Deleted 1 unreferenced blobs", out.getvalue())
+        self.assertFalse(MediaBlob.objects.exists())
+        self.assertEqual(self.stored_files(), [])
+
+    def test_deferred_lessons_are_deduplicated(self):
+        self.post(self.course)
+        with override_settings(LMS_MEDIA_METADATA_INLINE=False):
+            self.post(self.other_course, name="copy.mp4")
+        self.assertEqual(len(self.stored_files()), 2)
+        call_command("extract_media_metadata", stdout=StringIO())
+        self.assertEqual(Lesson.objects.values("blob").distinct().count(), 1)
+        self.assertEqual(len(self.stored_files()), 1)
+
+
+class AsyncViewsTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        Course.objects.create(title="Other Course", teacher=self.teacher)
+        self.lessons = [
+            Lesson.objects.create(title=f"Lesson {i}", course=self.course, media_type="video")
+            for i in range(3)
+        ]
+        self.students = []
+        for i in range(5):
+            user = User.objects.create_user(username=f"student{i}", password="password")
+            student = Student.objects.create(user=user)
+            Enrollment.objects.create(student=student, course=self.course)
+            self.students.append(student)
+        StudentProgress.objects.create(student=self.students[0], lesson=self.lessons[0])
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        if response.streaming:
+            return response.status_code, json.loads(b"".join(response.streaming_content))
+        return response.status_code, response.json()
+
+    async def aget_json(self, url):
+        response = await self.async_client.get(url)
+        if response.streaming:
+            content = b"".join([chunk async for chunk in response.streaming_content])
+            return response.status_code, json.loads(content)
+        return response.status_code, response.json()
+
+    async def test_same_responses_as_sync_views(self):
+        course = self.course.id
+        paths = [
+            "courses/",
+            "courses/?page_size=1",
+            f"courses/{course}/",
+            "courses/0/",
+            f"courses/{course}/lessons/",
+            f"courses/{course}/lessons/?page_size=2",
+            "courses/0/lessons/",
+            f"courses/{course}/enrolled-students/",
+            f"courses/{course}/enrolled-students/?page_size=2",
+            "courses/0/enrolled-students/",
+            f"courses/{course}/students-progress/",
+            f"courses/{course}/students-progress/?page_size=2",
+            f"courses/{course}/students-progress/?student={self.students[0].id}",
+            f"courses/{course}/students-progress/?student=0",
+        ]
+        for path in paths:
+            with self.subTest(path=path):
+                expected = await sync_to_async(self.get_json)(f"/api/{path}")
+                status_code, data = await self.aget_json(f"/api/async/{path}")
+                # pagination links point to the async endpoints
+                data = json.loads(json.dumps(data).replace("/api/async/", "/api/"))
+                self.assertEqual((status_code, data), expected)
+
+    async def test_cursors_are_shared_with_sync_views(self):
+        _, page = await self.aget_json(f"/api/async/courses/{self.course.id}/lessons/?page_size=2")
+        self.assertEqual(len(page["results"]), 2)
+        _, last = await self.aget_json(page["next"])
+        self.assertEqual([lesson["id"] for lesson in last["results"]], [self.lessons[2].id])
+        self.assertIsNone(last["next"])
+        _, previous = await self.aget_json(last["previous"])
+        self.assertEqual(previous["results"], page["results"])
+        sync_next = page["next"].replace("/api/async/", "/api/")
+        _, sync_last = await sync_to_async(self.get_json)(sync_next)
+        self.assertEqual(sync_last["results"], last["results"])
+
+    async def test_same_pages_as_sync_views(self):
+        for path, key in [
+            (f"courses/{self.course.id}/enrolled-students/?page_size=2", "enrolled_students"),
+            (f"courses/{self.course.id}/students-progress/?page_size=2", "students_progress"),
+        ]:
+            with self.subTest(path=path):
+                sync_url, async_url = f"/api/{path}", f"/api/async/{path}"
+                pages = 0
+                while sync_url:
+                    _, expected = await sync_to_async(self.get_json)(sync_url)
+                    status_code, data = await self.aget_json(async_url)
+                    self.assertEqual(status_code, status.HTTP_200_OK)
+                    self.assertEqual(len(data[key]), min(2, 5 - 2 * pages))
+                    data = json.loads(json.dumps(data).replace("/api/async/", "/api/"))
+                    self.assertEqual(data, expected)
+                    sync_url = expected["next"]
+                    async_url = sync_url and sync_url.replace("/api/", "/api/async/")
+                    pages += 1
+                self.assertEqual(pages, 3)
+
+
+class ExportProgressTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.lessons = [
+            Lesson.objects.create(title=f"Lesson {i}", course=self.course, media_type="video")
+            for i in range(4)
+        ]
+        self.students = []
+        for i in range(5):
+            user = User.objects.create_user(username=f"student{i}", password="password")
+            student = Student.objects.create(user=user)
+            Enrollment.objects.create(student=student, course=self.course)
+            self.students.append(student)
+        for student, lesson in [(0, 0), (0, 1), (0, 2), (2, 3)]:
+            StudentProgress.objects.create(
+                student=self.students[student], lesson=self.lessons[lesson]
+            )
+        self.url = f"/api/courses/{self.course.id}/export-progress/"
+
+    def get_csv(self, query):
+        response = self.client.get(f"{self.url}?{query}")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        content = b"".join(response.streaming_content).decode()
+        return list(csv.reader(StringIO(content)))
+
+    def test_summary_csv(self):
+        rows = self.get_csv("kind=summary")
+        self.assertEqual(
+            rows[0],
+            ["course_id", "student_id", "username", "completed_lessons", "lesson_count", "progress"],
+        )
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(
+            rows[1],
+            [str(self.course.id), str(self.students[0].id), "student0", "3", "4", "75.0"],
+        )
+
+    def test_matrix_csv(self):
+        rows = self.get_csv("kind=matrix")
+        self.assertEqual(
+            rows[0],
+            ["student_id", "username", *[f"lesson_{lesson.id}" for lesson in self.lessons]],
+        )
+        self.assertEqual(rows[1][2:], ["1", "1", "1", "0"])
+        self.assertEqual(rows[2][2:], ["0", "0", "0", "0"])
+        self.assertEqual(rows[3][2:], ["0", "0", "0", "1"])
+
+    def test_columnar_matches_csv(self):
+        for kind in ["summary", "matrix"]:
+            with self.subTest(kind=kind):
+                header, *rows = self.get_csv(f"kind={kind}")
+                with tempfile.NamedTemporaryFile() as file:
+                    call_command(
+                        "export_progress",
+                        "--course", str(self.course.id),
+                        "--kind", kind,
+                        "--file-format", "columnar",
+                        "--chunk-size", "2",
+                        "--output", file.name,
+                        stderr=StringIO(),
+                    )
+                    data = read_columnar(file)
+                self.assertEqual(list(data), header)
+                columns = [[str(value) for value in values] for values in data.values()]
+                self.assertEqual([list(row) for row in zip(*columns)], rows)
+
+    def test_invalid_parameters(self):
+        response = self.client.get(f"{self.url}?kind=everything")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"{self.url}?file_format=xlsx")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        with self.assertRaises(CommandError):
+            call_command("export_progress", "--kind", "matrix", stderr=StringIO())
+
+
+@unittest.skipUnless(analytics.np, "NumPy is not installed")
+class CourseAnalyticsTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.lessons = [
+            Lesson.objects.create(title=f"Lesson {i}", course=self.course, media_type="video")
+            for i in range(4)
+        ]
+        self.students = []
+        for i in range(4):
+            user = User.objects.create_user(username=f"student{i}", password="password")
+            student = Student.objects.create(user=user)
+            Enrollment.objects.create(student=student, course=self.course)
+            self.students.append(student)
+        enrolled = Enrollment.objects.get(student=self.students[0]).enrollment_date
+        # student 0 finishes in 2 days, student 1 in 4 days, student 2 stops after 2 lessons
+        for student, lessons, days in [(0, 4, 2), (1, 4, 4), (2, 2, 1)]:
+            for lesson in self.lessons[:lessons]:
+                StudentProgress.objects.create(
+                    student=self.students[student],
+                    lesson=lesson,
+                    date_completed=enrolled + timedelta(days=days),
+                )
+        self.url = f"/api/courses/{self.course.id}/analytics/"
+
+    def test_analytics(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        data = response.data
+        self.assertEqual(data["students"], 4)
+        self.assertEqual(data["completions"], 10)
+        self.assertEqual(data["finished"], 2)
+        self.assertEqual(data["completion"]["mean"], 62.5)
+        distribution = {bucket["from"]: bucket["students"] for bucket in data["distribution"]}
+        self.assertEqual(distribution[0.0], 1)
+        self.assertEqual(distribution[50.0], 1)
+        self.assertEqual(distribution[90.0], 2)
+        self.assertEqual(
+            [(lesson["completed"], lesson["drop_off"]) for lesson in data["funnel"]],
+            [(3, 0.25), (3, 0.0), (2, 0.3333), (2, 0.0)],
+        )
+        self.assertAlmostEqual(
+            data["time_to_complete_seconds"]["median"], 3 * 86400, delta=2
+        )
+
+    def test_ignores_students_no_longer_enrolled(self):
+        Enrollment.objects.filter(student=self.students[1]).delete()
+        data = self.client.get(self.url).data
+        self.assertEqual(data["students"], 3)
+        self.assertEqual(data["completions"], 6)
+
+    def test_empty_course(self):
+        course = Course.objects.create(title="Empty", teacher=self.teacher)
+        data = self.client.get(f"/api/courses/{course.id}/analytics/").data
+        self.assertEqual(data["students"], 0)
+        self.assertIsNone(data["completion"])
+        self.assertEqual(data["funnel"], [])
+
+
+class StudentDashboardTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.courses = [
+            Course.objects.create(title=f"Course {i}", teacher=self.teacher) for i in range(3)
+        ]
+        self.lessons = [
+            Lesson.objects.create(title=f"Lesson {i}", course=self.courses[0], media_type="video")
+            for i in range(4)
+        ]
+        self.student_user = User.objects.create_user(username="student", password="password")
+        self.student = Student.objects.create(user=self.student_user)
+        for course in self.courses[:2]:
+            Enrollment.objects.create(student=self.student, course=course)
+        StudentProgress.objects.create(student=self.student, lesson=self.lessons[0])
+        self.url = f"/api/students/{self.student.id}/dashboard/"
+
+    def test_dashboard(self):
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        courses = response.data["courses"]
+        self.assertEqual([course["course"] for course in courses], [c.id for c in self.courses[:2]])
+        self.assertEqual(courses[0]["lesson_count"], 4)
+        self.assertEqual(courses[0]["completed_lessons"], 1)
+        self.assertEqual(courses[0]["progress"], "25.00%")
+        self.assertIsNotNone(courses[0]["last_activity"])
+        self.assertEqual(courses[1]["progress"], "0%")
+        self.assertIsNone(courses[1]["last_activity"])
+
+    def test_cached_and_invalidated_on_save_progress(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+        self.client.post(
+            f"/api/courses/{self.courses[0].id}/lessons/{self.lessons[1].id}/save-progress/",
+            {"student": self.student.id},
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["courses"][0]["completed_lessons"], 2)
+
+        self.client.post(
+            "/api/progress/batch/",
+            {"events": [{"student": self.student.id, "lesson": self.lessons[2].id}]},
+            format="json",
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data["courses"][0]["completed_lessons"], 3)
+
+    def test_invalidated_on_enroll(self):
+        self.client.get(self.url)
+        self.client.post(
+            f"/api/courses/{self.courses[2].id}/enroll/", {"student": self.student.id}
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.data["courses"]), 3)
+
+    @override_settings(LMS_DASHBOARD_CACHE_TIMEOUT=0)
+    def test_cache_disabled(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+
+    def test_unknown_student(self):
+        response = self.client.get("/api/students/999/dashboard/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+from django.db import connections
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from courses.routers import STICKY_COOKIE
+
+
+@override_settings(LMS_DATABASE_REPLICAS=["replica"])
+class ReplicaRoutingTests(TransactionTestCase):
+    databases = {"default", "replica"}
+
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Test Course", description="Course description", teacher=self.teacher
+        )
+        self.lesson = Lesson.objects.create(
+            title="Test Lesson", course=self.course, media_type="video"
+        )
+        self.student_user = User.objects.create_user(username="student", password="password")
+        self.student = Student.objects.create(user=self.student_user)
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+    def get_queries(self, request):
+        with CaptureQueriesContext(connections["default"]) as primary:
+            with CaptureQueriesContext(connections["replica"]) as replica:
+                response = request()
+                if response.streaming:
+                    b"".join(response.streaming_content)
+        return response, len(primary), len(replica)
+
+    def test_read_actions_use_the_replica(self):
+        for url in [
+            f"/api/courses/{self.course.id}/enrolled-students/",
+            f"/api/courses/{self.course.id}/students-progress/",
+        ]:
+            response, primary, replica = self.get_queries(lambda: self.client.get(url))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertEqual(primary, 0, url)
+            self.assertGreater(replica, 0, url)
+
+    def test_cached_responses_are_computed_on_the_primary(self):
+        # a lagging replica would store old data under the new scope version
+        urls = [f"/api/courses/{self.course.id}/", f"/api/students/{self.student.id}/dashboard/"]
+        for url in urls:
+            response, primary, replica = self.get_queries(lambda: self.client.get(url))
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertGreater(primary, 0, url)
+            self.assertEqual(replica, 0, url)
+            response, primary, replica = self.get_queries(lambda: self.client.get(url))
+            self.assertEqual((primary, replica), (0, 0), url)
+
+        with override_settings(
+            LMS_RESPONSE_CACHE={**settings.LMS_RESPONSE_CACHE, "ENABLED": False}
+        ):
+            for url in urls:
+                response, primary, replica = self.get_queries(lambda: self.client.get(url))
+                self.assertEqual(primary, 0, url)
+                self.assertGreater(replica, 0, url)
+
+    def test_writes_use_the_primary_and_pin_the_client(self):
+        url = f"/api/courses/{self.course.id}/lessons/{self.lesson.id}/save-progress/"
+        response, primary, replica = self.get_queries(
+            lambda: self.client.post(url, {"student": self.student.id})
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+
+        response, primary, replica = self.get_queries(
+            lambda: self.client.get(f"/api/students/{self.student.id}/dashboard/")
+        )
+        self.assertEqual(response.data["courses"][0]["completed_lessons"], 1)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+    def test_other_actions_use_the_primary(self):
+        url = f"/api/courses/{self.course.id}/lessons/{self.lesson.id}/media/"
+        response, primary, replica = self.get_queries(
+            lambda: self.client.get(f"{url}?student={self.student.id}")
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
+
+
+from courses.models import SearchDocument
+
+
+class CourseSearchTests(APITestCase):
+
+    def setUp(self):
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password", first_name="Ada", last_name="Lovelace"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.python = Course.objects.create(
+                title="Python Programming", description="Learn to code", teacher=self.teacher
+            )
+            self.cooking = Course.objects.create(
+                title="Italian Cooking", description="Pasta and python-free recipes",
+                teacher=self.teacher,
+            )
+            Lesson.objects.create(title="Generators and iterators", course=self.python)
+            Lesson.objects.create(title="Fresh pasta", course=self.cooking)
+        self.url = "/api/courses/search/"
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {"q": query, **params})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [result["id"] for result in response.data["results"]]
+
+    def test_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search("python"), [self.python.id, self.cooking.id])
+        self.assertEqual(self.search("generator"), [self.python.id])
+        self.assertEqual(self.search("lovelace pasta"), [self.cooking.id])
+        self.assertEqual(self.search("pyth"), [self.python.id, self.cooking.id])
+        self.assertEqual(self.search("quantum"), [])
+
+    def test_index_follows_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cooking.title = "Italian Quantum Cooking"
+            self.cooking.save()
+            Lesson.objects.create(title="Risotto", course=self.python)
+        self.assertEqual(self.search("quantum"), [self.cooking.id])
+        self.assertEqual(self.search("risotto"), [self.python.id])
+
+        self.teacher_user.last_name = "Byron"
+        self.teacher_user.save()
+        self.assertEqual(len(self.search("byron")), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.cooking.delete()
+        self.assertEqual(self.search("quantum"), [])
+
+    def test_pagination(self):
+        response = self.client.get(self.url, {"q": "python", "page_size": 1})
+        self.assertEqual(len(response.data["results"]), 1)
+        self.assertIsNone(response.data["previous"])
+        response = self.client.get(response.data["next"])
+        self.assertEqual(response.data["results"][0]["id"], self.cooking.id)
+        self.assertIsNone(response.data["next"])
+        self.assertIsNotNone(response.data["previous"])
+
+    def test_requires_query(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(self.url, {"q": "python", "page": "0"})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_rebuild_search_index(self):
+        SearchDocument.objects.all().delete()
+        self.assertEqual(self.search("python"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search("python"), [self.python.id, self.cooking.id])
+
+
+class CourseFieldsTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(
+            username="teacher", password="password", first_name="Ada"
+        )
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.courses = [
+            Course.objects.create(title=f"Course {i}", teacher=self.teacher) for i in range(3)
+        ]
+        for course in self.courses:
+            for i in range(2):
+                Lesson.objects.create(title=f"Lesson {i}", course=course, media_type="video")
+        self.student_user = User.objects.create_user(username="student", password="password")
+        self.student = Student.objects.create(user=self.student_user)
+        Enrollment.objects.create(student=self.student, course=self.courses[0])
+
+    def test_default_payload(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/courses/")
+        self.assertEqual(
+            set(response.data["results"][0]),
+            {"id", "title", "description", "teacher", "lesson_count"},
+        )
+        self.assertEqual(response.data["results"][0]["teacher"], self.teacher.id)
+
+    def test_sparse_fields(self):
+        response = self.client.get("/api/courses/?fields=id,title")
+        self.assertEqual(set(response.data["results"][0]), {"id", "title"})
+        response = self.client.get("/api/courses/?fields=id&include=lesson_count")
+        self.assertEqual(response.data["results"][0], {"id": self.courses[0].id, "lesson_count": 2})
+
+    def test_include(self):
+        url = "/api/courses/?fields=id&include=teacher,lessons,enrollment_count"
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        course = response.data["results"][0]
+        self.assertEqual(course["teacher"]["username"], "teacher")
+        self.assertEqual(course["teacher"]["first_name"], "Ada")
+        self.assertEqual([lesson["title"] for lesson in course["lessons"]], ["Lesson 0", "Lesson 1"])
+        self.assertEqual(course["enrollment_count"], 1)
+        self.assertEqual(response.data["results"][1]["enrollment_count"], 0)
+
+        response = self.client.get(
+            f"/api/courses/{self.courses[0].id}/?include=teacher,enrollment_count"
+        )
+        self.assertEqual(response.data["teacher"]["bio"], "Teacher bio")
+        self.assertEqual(response.data["enrollment_count"], 1)
+
+    def test_included_lessons_follow_changes(self):
+        url = "/api/courses/?include=lessons"
+        self.client.get(url)
+        Lesson.objects.create(title="Lesson 2", course=self.courses[0], media_type="video")
+        response = self.client.get(url)
+        self.assertEqual(len(response.data["results"][0]["lessons"]), 3)
+
+        url = "/api/courses/?include=enrollment_count"
+        self.client.get(url)
+        Enrollment.objects.create(student=self.student, course=self.courses[1])
+        response = self.client.get(url)
+        self.assertEqual(response.data["results"][1]["enrollment_count"], 1)
+
+    def test_unknown_names(self):
+        response = self.client.get("/api/courses/?fields=id,secret")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/courses/?include=students")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get("/api/courses/?fields=")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        response = self.client.get(f"/api/courses/{self.courses[0].id}/?fields=,")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+from rest_framework.renderers import JSONRenderer
+from courses.fragments import Fragment, LocalCache, local_cache
+from courses.renderers import render_json
+from courses.serializers import LessonSerializer
+
+
+class FragmentCacheTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        local_cache.clear()
+        self.teacher_user = User.objects.create_user(username="teacher", password="password")
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(title="Course", teacher=self.teacher)
+        self.lessons = [
+            Lesson.objects.create(title=f"Lesson {i}", course=self.course, media_type="video")
+            for i in range(3)
+        ]
+        self.student_user = User.objects.create_user(
+            username="student", password="password", email="student@example.com"
+        )
+        self.student = Student.objects.create(user=self.student_user)
+        Enrollment.objects.create(student=self.student, course=self.course)
+
+    def get(self, url):
+        # without the response cache, every request renders the list
+        with self.settings(
+            LMS_RESPONSE_CACHE={**settings.LMS_RESPONSE_CACHE, "ENABLED": False}
+        ):
+            return self.client.get(url)
+
+    def test_fragments_match_serializers(self):
+        urls = [
+            "/api/courses/",
+            "/api/courses/?fields=id,title",
+            "/api/courses/?include=lessons",
+            f"/api/courses/{self.course.id}/?include=lessons",
+            f"/api/courses/{self.course.id}/lessons/",
+            f"/api/courses/{self.course.id}/enrolled-students/?page_size=10",
+        ]
+        expected = {}
+        with self.settings(
+            LMS_FRAGMENT_CACHE={**settings.LMS_FRAGMENT_CACHE, "ENABLED": False}
+        ):
+            for url in urls:
+                expected[url] = self.get(url).content
+        for url in urls:
+            # rendered, then read from the cache
+            self.assertEqual(self.get(url).content, expected[url], url)
+            self.assertEqual(self.get(url).content, expected[url], url)
+
+    def test_cached_fragments_are_not_serialized_again(self):
+        url = f"/api/courses/{self.course.id}/lessons/"
+        self.get(url)
+        with mock.patch.object(
+            LessonSerializer, "to_representation", side_effect=AssertionError
+        ):
+            response = self.get(url)
+        self.assertEqual(response.data["results"][0]["title"], "Lesson 0")
+
+        # from the shared cache once the process tier is empty
+        local_cache.clear()
+        with mock.patch.object(
+            LessonSerializer, "to_representation", side_effect=AssertionError
+        ):
+            self.get(url)
+
+    def test_saves_render_new_fragments(self):
+        self.get("/api/courses/")
+        self.course.refresh_from_db()
+        version = self.course.version
+        Lesson.objects.create(title="Lesson 3", course=self.course, media_type="video")
+        self.course.refresh_from_db()
+        self.assertNotEqual(self.course.version, version)
+        self.assertEqual(self.get("/api/courses/").data["results"][0]["lesson_count"], 4)
+
+        self.lessons[0].title = "Renamed"
+        self.lessons[0].save(update_fields=["title"])
+        response = self.get(f"/api/courses/{self.course.id}/lessons/")
+        self.assertEqual(response.data["results"][0]["title"], "Renamed")
+
+        url = f"/api/courses/{self.course.id}/enrolled-students/?page_size=10"
+        self.get(url)
+        self.student_user.email = "new@example.com"
+        self.student_user.save()
+        response = self.get(url)
+        self.assertEqual(response.data["enrolled_students"][0]["email"], "new@example.com")
+
+    def test_rendering(self):
+        data = {
+            "next": None,
+            "results": [Fragment(b'{"id":1,"title":"\xc3\xa9"}'), Fragment(b'{"id":2}')],
+            "nested": {"items": [1, "two"]},
+        }
+        self.assertEqual(
+            render_json(data),
+            JSONRenderer().render(
+                {"next": None, "results": [{"id": 1, "title": "é"}, {"id": 2}],
+                 "nested": {"items": [1, "two"]}}
+            ),
+        )
+        self.assertEqual(data["results"][0], {"id": 1, "title": "é"})
+
+    def test_local_cache_is_bounded(self):
+        local = LocalCache(2)
+        local.set_many({"a": b"1", "b": b"2"})
+        local.get_many(["a"])
+        local.set_many({"c": b"3"})
+        self.assertEqual(local.get_many(["a", "b", "c"]), {"a": b"1", "c": b"3"})
+
+
+from courses.helpers import LESSON_COPY_FIELDS
+from courses.search import search_courses
+
+
+class CourseCloneTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(username="teacher", password="password")
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.other_teacher = Teacher.objects.create(
+            user=User.objects.create_user(username="other", password="password"), bio=""
+        )
+        self.course = Course.objects.create(
+            title="Python 101", description="Course description", teacher=self.teacher
+        )
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.media_root = Path(tmp.name) / "media"
+        settings = override_settings(
+            MEDIA_ROOT=self.media_root, LMS_UPLOAD_DIR=Path(tmp.name) / "uploads"
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.content = mp4_bytes(seconds=30, padding=5000)
+        self.digest = hashlib.sha256(self.content).hexdigest()
+        for title in ["Intro", "Variables"]:
+            file = SimpleUploadedFile("intro.mp4", self.content, content_type="video/mp4")
+            self.client.post(
+                f"/api/courses/{self.course.id}/lessons/",
+                {"title": title, "media": file},
+                format="multipart",
+            )
+        self.students = [
+            Student.objects.create(
+                user=User.objects.create_user(username=f"student{i}", password="password")
+            )
+            for i in range(2)
+        ]
+        for student in self.students:
+            Enrollment.objects.create(student=student, course=self.course)
+        lesson = self.course.lessons.first()
+        StudentProgress.objects.create(student=self.students[0], lesson=lesson)
+
+    def stored_files(self):
+        return [path for path in self.media_root.rglob("*") if path.is_file()]
+
+    def test_clone(self):
+        url = f"/api/courses/{self.course.id}/clone/"
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(url, {"title": "Python 101 (2027)"}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data["title"], "Python 101 (2027)")
+        self.assertEqual(response.data["teacher"], self.teacher.id)
+        self.assertEqual(response.data["lesson_count"], 2)
+
+        clone = Course.objects.get(pk=response.data["id"])
+        self.assertEqual(clone.description, "Course description")
+        self.assertEqual(clone.lesson_count, 2)
+        original = list(self.course.lessons.order_by("id").values_list(*LESSON_COPY_FIELDS))
+        copied = list(clone.lessons.order_by("id").values_list(*LESSON_COPY_FIELDS))
+        self.assertEqual(copied, original)
+        # the media is shared, not copied
+        self.assertEqual(len(self.stored_files()), 1)
+        self.assertFalse(clone.enrollments.exists())
+        self.assertEqual(
+            search_courses("variables 2027", 10)[0]["id"], clone.id
+        )
+
+        response = self.client.get(f"/api/courses/{clone.id}/lessons/")
+        self.assertEqual(
+            [lesson["title"] for lesson in response.data["results"]], ["Intro", "Variables"]
+        )
+
+    def test_clone_enrollments(self):
+        self.client.get(f"/api/students/{self.students[0].id}/dashboard/")
+        response = self.client.post(
+            f"/api/courses/{self.course.id}/clone/",
+            {"teacher": self.other_teacher.id, "enrollments": True},
+            format="json",
+        )
+        clone = Course.objects.get(pk=response.data["id"])
+        self.assertEqual(clone.title, "Python 101")
+        self.assertEqual(clone.teacher, self.other_teacher)
+        self.assertEqual(
+            sorted(clone.enrollments.values_list("student_id", "completed_lessons")),
+            [(student.id, 0) for student in self.students],
+        )
+        self.assertFalse(StudentProgress.objects.filter(course=clone).exists())
+        response = self.client.get(f"/api/students/{self.students[0].id}/dashboard/")
+        self.assertEqual(len(response.data["courses"]), 2)
+
+    def test_clone_queries_do_not_depend_on_the_course_size(self):
+        url = f"/api/courses/{self.course.id}/clone/"
+        with CaptureQueriesContext(connection) as small:
+            self.client.post(url, {"enrollments": True}, format="json")
+        Lesson.objects.bulk_create(
+            [Lesson(title=f"Lesson {i}", course=self.course) for i in range(500)]
+        )
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.post(url, {"enrollments": True}, format="json")
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(Lesson.objects.filter(course_id=response.data["id"]).count(), 502)
+
+    def test_clone_errors(self):
+        response = self.client.post("/api/courses/999/clone/", {}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        url = f"/api/courses/{self.course.id}/clone/"
+        for data in [{"teacher": 999}, {"teacher": "x"}, {"title": ""}, {"enrollments": "yes"}]:
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+
+    def test_bulk_import(self):
+        other = Course.objects.create(title="Other", teacher=self.teacher)
+        url = f"/api/courses/{other.id}/lessons/"
+        self.client.get(url)
+        lessons = [{"title": f"Part {i}", "media_checksum": self.digest} for i in range(3)]
+        response = self.client.post(f"{url}bulk-import/", {"lessons": lessons}, format="json")
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(len(response.data["lessons"]), 3)
+        self.assertEqual(response.data["lessons"][0]["media_duration"], 30)
+
+        blob = MediaBlob.objects.get()
+        self.assertEqual(
+            set(other.lessons.values_list("blob", "media_type", "media_checksum")),
+            {(blob.id, "video", self.digest)},
+        )
+        other.refresh_from_db()
+        self.assertEqual(other.lesson_count, 3)
+        self.assertEqual(len(self.client.get(url).data["results"]), 3)
+        self.assertEqual(len(self.stored_files()), 1)
+
+    def test_bulk_import_errors(self):
+        url = f"/api/courses/{self.course.id}/lessons/bulk-import/"
+        for data in [
+            {},
+            {"lessons": []},
+            {"lessons": [{"title": "Intro"}]},
+            {"lessons": [{"title": "", "media_checksum": self.digest}]},
+            {"lessons": [{"title": "Intro", "media_checksum": "0" * 64}]},
+        ]:
+            response = self.client.post(url, data, format="json")
+            self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST, data)
+        response = self.client.post(
+            "/api/courses/999/lessons/bulk-import/",
+            {"lessons": [{"title": "Intro", "media_checksum": self.digest}]},
+            format="json",
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(self.course.lessons.count(), 2)
+
+
+from jobs.models import Job
+from django.db.models.signals import post_delete
+from jobs.queue import claim_job, enqueue, run_job
+
+
+class BackgroundJobTests(APITestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.teacher_user = User.objects.create_user(username="teacher", password="password")
+        self.teacher = Teacher.objects.create(user=self.teacher_user, bio="Teacher bio")
+        self.course = Course.objects.create(
+            title="Python 101", description="Course description", teacher=self.teacher
+        )
+        self.lessons = [
+            Lesson.objects.create(title=f"Lesson {i}", course=self.course, media_type="video")
+            for i in range(3)
+        ]
+        self.students = []
+        for i in range(4):
+            user = User.objects.create_user(username=f"student{i}", password="password")
+            student = Student.objects.create(user=user)
+            Enrollment.objects.create(student=student, course=self.course)
+            StudentProgress.objects.create(student=student, lesson=self.lessons[i % 3])
+            self.students.append(student)
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        jobs_settings = override_settings(
+            MEDIA_ROOT=Path(tmp.name) / "media",
+            LMS_JOBS={**settings.LMS_JOBS, "RESULT_DIR": Path(tmp.name) / "results"},
+        )
+        jobs_settings.enable()
+        self.addCleanup(jobs_settings.disable)
+
+    def run_jobs(self):
+        while job := claim_job("test"):
+            run_job(job)
+
+    def test_destroy_runs_in_background(self):
+        url = f"/api/courses/{self.course.id}/"
+        response = self.client.delete(url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["task"], "courses.delete_course")
+        self.assertEqual(response.data["status"], Job.QUEUED)
+        job_url = f"http://testserver/api/jobs/{response.data['id']}/"
+        self.assertEqual(response["Location"], job_url)
+        # still there until a worker runs the job, which is queued once
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.delete(url).data["id"], response.data["id"])
+
+        dashboard = f"/api/students/{self.students[0].id}/dashboard/"
+        self.assertEqual(len(self.client.get(dashboard).data["courses"]), 1)
+        self.run_jobs()
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Lesson.objects.exists())
+        self.assertFalse(Enrollment.objects.exists())
+        self.assertFalse(StudentProgress.objects.exists())
+        self.assertEqual(self.client.get(dashboard).data["courses"], [])
+        job = self.client.get(job_url).data
+        self.assertEqual(job["status"], Job.SUCCEEDED)
+        self.assertEqual(job["progress"], job["progress_total"])
+        self.assertEqual(job["progress_total"], 3 + 4 + 4 + 1)
+
+    def test_destroy_deletes_chunks_without_signals(self):
+        deleted = []
+
+        def record(sender, instance, **kwargs):
+            deleted.append(instance)
+
+        for model in (Enrollment, Lesson):
+            post_delete.connect(record, sender=model)
+            self.addCleanup(post_delete.disconnect, record, sender=model)
+        job = enqueue("courses.delete_course", course_id=self.course.id, chunk_size=2)
+        self.run_jobs()
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(deleted, [])
+        self.assertFalse(Course.objects.filter(pk=self.course.id).exists())
+        self.assertFalse(Lesson.objects.exists())
+        self.assertFalse(Enrollment.objects.exists())
+        self.assertFalse(StudentProgress.objects.exists())
+
+    def test_destroy_unknown_course(self):
+        response = self.client.delete("/api/courses/999/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Job.objects.exists())
+
+    def test_export_in_background(self):
+        url = f"/api/courses/{self.course.id}/export-progress/?kind=matrix&file_format=columnar"
+        expected = b"".join(self.client.get(url).streaming_content)
+        response = self.client.post(url)
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data["task"], "courses.export_progress")
+        self.run_jobs()
+        job = self.client.get(f"/api/jobs/{response.data['id']}/").data
+        self.assertEqual(job["status"], Job.SUCCEEDED)
+        self.assertEqual((job["progress"], job["progress_total"]), (4, 4))
+        download = self.client.get(f"/api/jobs/{response.data['id']}/download/")
+        self.assertEqual(download.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(download.streaming_content), expected)
+        self.assertIn(
+            f'filename="course-{self.course.id}-matrix.lmsc"', download["Content-Disposition"]
+        )
+        response = self.client.post(f"{url[:-8]}nope")
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    @override_settings(LMS_MEDIA_METADATA_INLINE=False)
+    def test_deferred_metadata_is_extracted_by_a_job(self):
+        file = SimpleUploadedFile("lecture.mp4", mp4_bytes(seconds=5), content_type="video/mp4")
+        response = self.client.post(
+            f"/api/courses/{self.course.id}/lessons/",
+            {"title": "Lecture", "media": file},
+            format="multipart",
+        )
+        lesson = Lesson.objects.get(pk=response.data["id"])
+        self.assertEqual(lesson.media_checksum, "")
+        job = Job.objects.get(task="courses.extract_media_metadata")
+        self.assertEqual(job.args, {"lesson_ids": [lesson.pk]})
+        self.run_jobs()
+        lesson.refresh_from_db()
+        self.assertEqual(lesson.media_checksum, hashlib.sha256(mp4_bytes(seconds=5)).hexdigest())
+        self.assertEqual(lesson.media_duration, 5)
+        self.assertIsNotNone(lesson.blob)
+
+    def test_rebuild_counters_in_background(self):
+        Course.objects.update(lesson_count=0)
+        Enrollment.objects.update(completed_lessons=0)
+        call_command("rebuild_progress_counters", "--background", stdout=StringIO())
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 0)
+        self.run_jobs()
+        self.course.refresh_from_db()
+        self.assertEqual(self.course.lesson_count, 3)
+        call_command("rebuild_progress_counters", "--verify", stdout=StringIO())
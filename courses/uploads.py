@@ -0,0 +1,189 @@
+"""Resumable, chunked uploads of lesson media.
+
+A client initiates an upload with the file name and size, sends the file in
+chunks at increasing offsets (resuming from the offset the server reports
+after a failure) and finalizes it, which moves the file to the media
+storage and creates the ``Lesson``. Chunks are streamed to a part file in
+``LMS_UPLOAD_DIR`` so memory use does not depend on the chunk or file size.
+"""
+
+import fcntl
+import hashlib
+import mimetypes
+import os
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException, ValidationError
+
+from .blobs import blob_metadata, find_blob, link_blob, store_blob
+from .ingest import extract_metadata, read_head, sniff_media_type
+from .models import Lesson, LessonUpload
+
+BLOCK_SIZE = 64 * 1024
+
+
+class UploadConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "Chunk offset does not match the upload offset."
+
+
+def get_part_path(upload):
+    return Path(settings.LMS_UPLOAD_DIR) / f"{upload.pk}.part"
+
+
+def guess_media_type(filename):
+    content_type = mimetypes.guess_type(filename)[0] or ""
+    if content_type == "application/pdf":
+        return "pdf"
+    kind = content_type.split("/")[0]
+    return kind if kind in ["video", "audio"] else None
+
+
+def create_upload(course, title, filename, size, checksum=""):
+    media_type = guess_media_type(filename)
+    if not media_type:
+        raise ValidationError("Invalid media type.")
+    if size > settings.LMS_UPLOAD_MAX_SIZE:
+        raise ValidationError("File is too large.")
+    checksum = checksum.lower()
+    # a known content is complete right away, finalize links the existing blob
+    known = bool(checksum) and find_blob(checksum, size) is not None
+    upload = LessonUpload.objects.create(
+        course=course,
+        title=title,
+        filename=os.path.basename(filename),
+        media_type=media_type,
+        size=size,
+        checksum=checksum,
+        offset=size if known else 0,
+    )
+    part_path = get_part_path(upload)
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    part_path.touch()
+    return upload
+
+
+@contextmanager
+def locked_part(upload):
+    """Open the part file holding an exclusive lock, with a fresh upload row.
+
+    The lock serializes the chunk writes and the finalization of an upload
+    across threads and processes sharing ``LMS_UPLOAD_DIR``.
+    """
+    try:
+        part = open(get_part_path(upload), "r+b")
+    except FileNotFoundError:
+        raise ValidationError("Upload is finalized or expired.")
+    with part:
+        fcntl.flock(part, fcntl.LOCK_EX)
+        try:
+            upload.refresh_from_db()
+        except LessonUpload.DoesNotExist:
+            raise ValidationError("Upload is finalized or expired.")
+        yield part
+
+
+def write_chunk(upload, offset, stream, length, checksum=None):
+    """Append ``length`` bytes read from ``stream`` at ``offset``.
+
+    ``checksum`` is the optional SHA-256 of the chunk; on a mismatch the
+    chunk is discarded and the client can resend it.
+    """
+    if length > settings.LMS_UPLOAD_MAX_CHUNK_SIZE:
+        raise ValidationError("Chunk is too large.")
+    with locked_part(upload) as part:
+        if offset != upload.offset:
+            raise UploadConflict(
+                f"Expected offset {upload.offset}, got {offset}."
+            )
+        if offset + length > upload.size:
+            raise ValidationError("Chunk exceeds the upload size.")
+        part.seek(offset)
+        part.truncate()
+        digest = hashlib.sha256()
+        remaining = length
+        while remaining:
+            block = stream.read(min(BLOCK_SIZE, remaining))
+            if not block:
+                break
+            part.write(block)
+            digest.update(block)
+            remaining -= len(block)
+        if remaining or (checksum and checksum.lower() != digest.hexdigest()):
+            part.truncate(offset)
+            raise ValidationError("Incomplete or corrupted chunk.")
+        part.flush()
+        os.fsync(part.fileno())
+        upload.offset = offset + length
+        upload.save(update_fields=["offset", "updated_at"])
+    return upload
+
+
+def finalize_upload(upload):
+    """Verify and classify the complete file, store it as lesson media and create the lesson."""
+    with locked_part(upload) as part:
+        if upload.offset != upload.size:
+            raise ValidationError(
+                f"Upload is incomplete ({upload.offset} of {upload.size} bytes)."
+            )
+        blob = None
+        if upload.size and not os.fstat(part.fileno()).st_size:
+            # completed on initiate because its content was already known
+            blob = find_blob(upload.checksum, upload.size)
+            if blob is None:
+                upload.offset = 0
+                upload.save(update_fields=["offset", "updated_at"])
+                raise UploadConflict("Known content was deleted, resend the file.")
+        if blob is not None:
+            metadata = blob_metadata(blob)
+        else:
+            media_type = sniff_media_type(read_head(part))
+            if media_type is None:
+                raise ValidationError("Invalid media type.")
+            # the whole file is read for the checksum anyway
+            metadata = {"media_type": media_type, **extract_metadata(part, media_type)}
+            if upload.checksum and upload.checksum != metadata["media_checksum"]:
+                raise ValidationError("Checksum mismatch.")
+        with transaction.atomic():
+            if blob is None:
+                blob = store_blob(
+                    File(part), metadata["media_checksum"], upload.size, upload.filename
+                )
+            lesson = Lesson(title=upload.title, course_id=upload.course_id, **metadata)
+            link_blob(lesson, blob)
+            lesson.save()
+            part_path = get_part_path(upload)
+            upload.delete()
+        part_path.unlink()
+    return lesson
+
+
+def discard_upload(upload):
+    get_part_path(upload).unlink(missing_ok=True)
+    upload.delete()
+
+
+def cleanup_uploads(max_age):
+    """Delete the uploads (and orphan part files) idle for longer than ``max_age``."""
+    cutoff = timezone.now() - max_age
+    uploads = list(LessonUpload.objects.filter(updated_at__lt=cutoff))
+    for upload in uploads:
+        discard_upload(upload)
+    # part files of uploads removed with their course
+    upload_dir = Path(settings.LMS_UPLOAD_DIR)
+    if upload_dir.exists():
+        live = {
+            str(pk) for pk in LessonUpload.objects.values_list("pk", flat=True)
+        }
+        for path in upload_dir.glob("*.part"):
+            stale = path.stat().st_mtime < cutoff.timestamp()
+            if stale and path.stem not in live:
+                path.unlink(missing_ok=True)
+    return len(uploads)
+
@@ -1,19 +1,119 @@
-from rest_framework import viewsets
-from .models import Course, Lesson, Student
+import csv
+import io
+from functools import cached_property
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from rest_framework import status, viewsets
+from .models import Course, Enrollment, Lesson, LessonUpload, Student, Teacher
 from .serializers import (
     CourseSerializer,
     LessonSerializer,
+    LessonUploadSerializer,
     StudentSerializer,
 )
-from rest_framework.exceptions import ValidationError, NotFound
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .helpers import get_course_students_progress
+from rest_framework.utils.urls import replace_query_param
+from .helpers import (
+    bulk_enroll_students,
+    clone_course,
+    get_course_progress_rows,
+    get_course_queryset,
+    get_course_students_progress,
+    get_student_dashboard,
+    import_lessons,
+    save_progress_batch,
+    stream_json_list,
+)
+from .cache import cached_response
+from .analytics import course_analytics
+from .blobs import find_blobs_media
+from .exports import FILE_FORMATS, KINDS, export_progress
+from .media import get_media_access, serve_media
+from .progress_journal import get_progress_journal
+from .search import search_courses
+from .uploads import create_upload, discard_upload, finalize_upload, write_chunk
+from jobs.queue import enqueue
+from jobs.views import accepted
+
+
+def read_student_ids_csv(file):
+    """Yield student ids from the first column of an uploaded CSV file."""
+    rows = csv.reader(io.TextIOWrapper(file, encoding="utf-8-sig"))
+    for line, row in enumerate(rows, start=1):
+        if not row or not row[0].strip():
+            continue
+        try:
+            yield int(row[0])
+        except ValueError:
+            if line == 1:
+                continue  # header
+            raise ValidationError(f"Invalid student id on line {line}.")
+
+
+def split_param(value):
+    return [name.strip() for name in value.split(",") if name.strip()]
+
+
+def check_names(param, names, available):
+    unknown = sorted(set(names) - set(available))
+    if unknown:
+        raise ValidationError(
+            f"Unknown {param}: {', '.join(unknown)}. Available: {', '.join(available)}."
+        )
 
 
 class CoursesViewSet(viewsets.ModelViewSet):
-    queryset = Course.objects.all().prefetch_related("lessons")
+    queryset = Course.objects.all()
     serializer_class = CourseSerializer
+    stream_chunk_size = 2000
+
+    @cached_property
+    def field_selection(self):
+        """The ``fields`` and ``include`` query parameters of list and retrieve."""
+        params = self.request.query_params
+        if self.action not in ("list", "retrieve"):
+            return None, []
+        fields = split_param(params["fields"]) if "fields" in params else None
+        include = split_param(params.get("include", ""))
+        if fields == []:
+            raise ValidationError("fields must name at least one field.")
+        if fields:
+            check_names("fields", fields, list(CourseSerializer().fields))
+        check_names("include", include, CourseSerializer.INCLUDES)
+        return fields, include
+
+    def get_cache_scopes(self, scopes):
+        _, include = self.field_selection
+        if "enrollment_count" in include:
+            # changes with every enrollment, not cached
+            return None
+        if "lessons" in include and self.action == "list":
+            scopes = [*scopes, "catalog:lessons"]
+        return scopes
+
+    def get_queryset(self):
+        return get_course_queryset(*self.field_selection)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, include = self.field_selection
+        return super().get_serializer(*args, fields=fields, include=include, **kwargs)
+
+    @cached_response(lambda view: view.get_cache_scopes(["catalog"]))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response(lambda view: view.get_cache_scopes([f"course:{view.kwargs['pk']}"]))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def destroy(self, request, *args, **kwargs):
+        """delete the course, its lessons, enrollments and progress in a background job"""
+        course = self.get_object()
+        job = enqueue("courses.delete_course", unique=True, course_id=course.pk)
+        return accepted(request, job)
 
     # enroll action
     @action(detail=True, methods=["POST"], url_path="enroll")
@@ -25,22 +125,166 @@ class CoursesViewSet(viewsets.ModelViewSet):
         student = request.data.get("student")
         if not student:
             raise ValidationError("student is required.")
-        if course.enrollments.filter(student_id=student).exists():
+        # get_or_create retries the lookup when a concurrent request enrolled first
+        _, created = course.enrollments.get_or_create(student_id=student)
+        if not created:
             return Response({"message": "Already enrolled."})
-        course.enrollments.create(student_id=student)
         return Response({"message": "Enrolled successfully."})
 
+    @action(detail=True, methods=["POST"], url_path="bulk-enroll")
+    def bulk_enroll(self, request, pk=None):
+        try:
+            course = Course.objects.get(pk=pk)
+        except Course.DoesNotExist:
+            raise NotFound("Course not found.")
+        file = request.FILES.get("file")
+        if file:
+            student_ids = read_student_ids_csv(file)
+        else:
+            student_ids = request.data.get("students")
+            if not isinstance(student_ids, list):
+                raise ValidationError("students list or CSV file is required.")
+            try:
+                student_ids = [int(student) for student in student_ids]
+            except (TypeError, ValueError):
+                raise ValidationError("students must be a list of ids.")
+        return Response(bulk_enroll_students(course, student_ids))
+
+    @action(detail=True, methods=["POST"], url_path="clone")
+    def clone(self, request, pk=None):
+        """copy the course and its lessons for a new term, optionally with its enrollments"""
+        try:
+            course = Course.objects.get(pk=pk)
+        except Course.DoesNotExist:
+            raise NotFound("Course not found.")
+        title = request.data.get("title")
+        if title is not None and not (isinstance(title, str) and 0 < len(title) <= 255):
+            raise ValidationError("title must be a non-empty string of at most 255 characters.")
+        teacher = request.data.get("teacher")
+        if teacher is not None:
+            try:
+                teacher = int(teacher)
+            except (TypeError, ValueError):
+                raise ValidationError("teacher must be an id.")
+            if not Teacher.objects.filter(pk=teacher).exists():
+                raise ValidationError("Teacher not found.")
+        enrollments = request.data.get("enrollments", False)
+        if enrollments not in (True, False, "true", "false"):
+            raise ValidationError("enrollments must be a boolean.")
+        clone = clone_course(
+            course, title, teacher, copy_enrollments=enrollments in (True, "true")
+        )
+        return Response(CourseSerializer(clone).data, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=["GET"], url_path="enrolled-students")
     def enrolled_students(self, request, pk=None):
+        try:
+            course = Course.objects.only("pk").get(pk=pk)
+        except Course.DoesNotExist:
+            raise NotFound("Course not found.")
+        if self.paginator.wants_pagination(request):
+            enrollments = self.paginator.paginate_queryset(
+                course.enrollments.select_related("student__user").only(
+                    "course",
+                    "student__version",
+                    "student__user__username",
+                    "student__user__email",
+                    "student__user__first_name",
+                    "student__user__last_name",
+                ),
+                request,
+                view=self,
+            )
+            students_data = StudentSerializer(
+                [enrollment.student for enrollment in enrollments], many=True
+            ).data
+            return Response(
+                self.paginator.get_paginated_data(students_data, "enrolled_students")
+            )
+        fields = ["id", "username", "email", "first_name", "last_name"]
+        rows = (
+            course.enrollments.order_by("id")
+            .values_list(
+                "student_id",
+                "student__user__username",
+                "student__user__email",
+                "student__user__first_name",
+                "student__user__last_name",
+            )
+            .iterator(chunk_size=self.stream_chunk_size)
+        )
+        students = (dict(zip(fields, row)) for row in rows)
+        return StreamingHttpResponse(
+            stream_json_list("enrolled_students", students, self.stream_chunk_size),
+            content_type="application/json",
+        )
+
+    @action(detail=False, methods=["GET"], url_path="search")
+    def search(self, request):
+        """ranked full-text search over course titles, descriptions, teacher names and lesson titles"""
+        query = request.query_params.get("q", "").strip()
+        if not query:
+            raise ValidationError("q is required.")
+        try:
+            page = int(request.query_params.get("page", 1))
+        except ValueError:
+            page = 0
+        if page < 1:
+            raise ValidationError("page must be a positive integer.")
+        page_size = self.paginator.get_page_size(request)
+        results = search_courses(query, page_size + 1, (page - 1) * page_size)
+        url = request.build_absolute_uri()
+        return Response(
+            {
+                "next": (
+                    replace_query_param(url, "page", page + 1)
+                    if len(results) > page_size
+                    else None
+                ),
+                "previous": replace_query_param(url, "page", page - 1) if page > 1 else None,
+                "results": results[:page_size],
+            }
+        )
+
+    @action(detail=True, methods=["GET"], url_path="analytics")
+    def analytics(self, request, pk=None):
+        """completion distribution, per lesson funnel and time to complete for the course dashboard"""
+        try:
+            course = Course.objects.only("pk").get(pk=pk)
+        except Course.DoesNotExist:
+            raise NotFound("Course not found.")
+        return Response(course_analytics(course))
+
+    @action(detail=True, methods=["GET", "POST"], url_path="export-progress")
+    def export_progress(self, request, pk=None):
+        """stream the progress summary or the student x lesson matrix of the course as a file, or write it in a background job on POST"""
+        kind = request.query_params.get("kind", "summary")
+        file_format = request.query_params.get("file_format", "csv")
+        if kind not in KINDS:
+            raise ValidationError(f"kind must be one of {', '.join(KINDS)}.")
+        if file_format not in FILE_FORMATS:
+            raise ValidationError(f"file_format must be one of {', '.join(FILE_FORMATS)}.")
         try:
             course = Course.objects.get(pk=pk)
         except Course.DoesNotExist:
             raise NotFound("Course not found.")
-        enrolled_students = course.enrollments.values_list("student_id", flat=True)
-        student_ids = list(enrolled_students)
-        students = Student.objects.filter(id__in=student_ids)
-        students_data = StudentSerializer(students, many=True).data
-        return Response({"enrolled_students": students_data})
+        if request.method == "POST":
+            job = enqueue(
+                "courses.export_progress",
+                priority=10,
+                course_id=course.pk,
+                kind=kind,
+                file_format=file_format,
+            )
+            return accepted(request, job)
+        content_type, extension = FILE_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            export_progress(kind, file_format, [course]), content_type=content_type
+        )
+        response["Content-Disposition"] = (
+            f'attachment; filename="course-{course.pk}-{kind}.{extension}"'
+        )
+        return response
 
     # get students progress
     @action(detail=True, methods=["GET"], url_path="students-progress")
@@ -55,12 +299,29 @@ class CoursesViewSet(viewsets.ModelViewSet):
             if not student:
                 raise NotFound("Student not found.")
 
-        students_data = get_course_students_progress(course, student)
+        pending = None
+        if settings.LMS_PROGRESS_WRITE_BEHIND:
+            pending = get_progress_journal().pending(
+                student.pk if student else None,
+                course.lessons.values_list("pk", flat=True),
+            )
+        if self.paginator.wants_pagination(request):
+            rows = self.paginator.paginate_queryset(
+                get_course_progress_rows(course, student), request, view=self
+            )
+            students_data = get_course_students_progress(
+                course, student, pending, rows=rows
+            )
+            return Response(
+                self.paginator.get_paginated_data(students_data, "students_progress")
+            )
+        students_data = get_course_students_progress(course, student, pending)
         return Response({"students_progress": students_data})
 
 
 class LessonsViewSet(viewsets.ModelViewSet):
     serializer_class = LessonSerializer
+    max_import_size = 1000
 
     def get_queryset(self):
         course_id = self.kwargs.get("course_pk")
@@ -68,6 +329,10 @@ class LessonsViewSet(viewsets.ModelViewSet):
             raise ValidationError("Course not found.")
         return Lesson.objects.filter(course_id=course_id)
 
+    @cached_response(lambda view: [f"course:{view.kwargs['course_pk']}"])
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context["course_pk"] = self.kwargs.get("course_pk")
@@ -81,9 +346,41 @@ class LessonsViewSet(viewsets.ModelViewSet):
             raise NotFound("Course not found.")
         serializer.save(course=course)
 
+    def bulk_import(self, request, course_pk=None):
+        """create many lessons at once from media already stored on the server, referenced by its SHA-256"""
+        lessons = request.data.get("lessons")
+        if not isinstance(lessons, list) or not lessons:
+            raise ValidationError("lessons list is required.")
+        if len(lessons) > self.max_import_size:
+            raise ValidationError(
+                f"An import can hold at most {self.max_import_size} lessons."
+            )
+        try:
+            lessons = [
+                (lesson["title"].strip(), lesson["media_checksum"].lower())
+                for lesson in lessons
+            ]
+        except (KeyError, TypeError, AttributeError):
+            raise ValidationError("Each lesson needs a title and a media_checksum.")
+        if not all(0 < len(title) <= 255 for title, _ in lessons):
+            raise ValidationError("Lesson titles must have 1 to 255 characters.")
+        if not Course.objects.filter(pk=course_pk).exists():
+            raise NotFound("Course not found.")
+        media = find_blobs_media({checksum for _, checksum in lessons})
+        unknown = sorted({checksum for _, checksum in lessons} - media.keys())
+        if unknown:
+            raise ValidationError(f"Unknown media_checksum: {', '.join(unknown)}.")
+        created = import_lessons(
+            course_pk, [{"title": title, **media[checksum]} for title, checksum in lessons]
+        )
+        serializer = self.get_serializer(created, many=True)
+        return Response({"lessons": serializer.data}, status=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=["POST"], url_path="save-progress")
     def save_progress(self, request, course_pk=None, lesson_pk=None):
         """this could be run manually by students or automatically by FE when they complete a lesson to save their progress"""
+        if settings.LMS_PROGRESS_WRITE_BEHIND:
+            return self.queue_progress(request, lesson_pk)
         try:
             lesson = Lesson.objects.get(pk=lesson_pk)
         except Lesson.DoesNotExist:
@@ -91,9 +388,129 @@ class LessonsViewSet(viewsets.ModelViewSet):
         student = request.data.get("student")
         if not student:
             raise ValidationError("student is required.")
-        if not lesson.course.enrollments.filter(student_id=student).exists():
+        if not Enrollment.objects.filter(
+            course_id=lesson.course_id, student_id=student
+        ).exists():
             raise ValidationError("Student is not enrolled in the course.")
-        if lesson.progress.filter(student_id=student).exists():
+        _, created = lesson.progress.get_or_create(student_id=student)
+        if not created:
             return Response({"message": "Progress already saved."})
-        lesson.progress.create(student_id=student)
         return Response({"message": "Progress saved successfully."})
+
+    @action(detail=True, methods=["GET"], url_path="media")
+    def media(self, request, course_pk=None, pk=None):
+        """stream the lesson media to an enrolled student, supports Range requests for seeking"""
+        student = request.query_params.get("student")
+        if not student:
+            raise ValidationError("student is required.")
+        access = get_media_access(course_pk, pk, student)
+        if access is None:
+            raise NotFound("Lesson media not found.")
+        name, enrolled = access
+        if not enrolled:
+            raise PermissionDenied("Student is not enrolled in the course.")
+        return serve_media(request, name, Lesson._meta.get_field("media").storage)
+
+    def queue_progress(self, request, lesson_pk):
+        # write-behind: validated against enrollments by `manage.py flush_progress`
+        try:
+            student = int(request.data.get("student"))
+        except (TypeError, ValueError):
+            raise ValidationError("student is required.")
+        get_progress_journal().append([(student, int(lesson_pk))])
+        return Response({"message": "Progress queued."}, status=status.HTTP_202_ACCEPTED)
+
+
+def dashboard_cache_timeout():
+    # cached dashboards would hide the completions still in the journal
+    if settings.LMS_PROGRESS_WRITE_BEHIND:
+        return 0
+    return settings.LMS_DASHBOARD_CACHE_TIMEOUT
+
+
+class StudentsViewSet(viewsets.ViewSet):
+    @action(detail=True, methods=["GET"], url_path="dashboard")
+    @cached_response(lambda view: [f"student:{view.kwargs['pk']}"], dashboard_cache_timeout)
+    def dashboard(self, request, pk=None):
+        """progress of a student in all their courses, replaces a students-progress request per course"""
+        student = Student.objects.filter(pk=pk).first()
+        if not student:
+            raise NotFound("Student not found.")
+        pending = None
+        if settings.LMS_PROGRESS_WRITE_BEHIND:
+            pending = get_progress_journal().pending(student.pk)
+        return Response(
+            {"student": student.pk, "courses": get_student_dashboard(student, pending)}
+        )
+
+
+class ProgressViewSet(viewsets.ViewSet):
+    max_batch_size = 5000
+
+    @action(detail=False, methods=["POST"], url_path="batch")
+    def batch(self, request):
+        """save many lesson completion events buffered by the FE in one request"""
+        events = request.data.get("events")
+        if not isinstance(events, list):
+            raise ValidationError("events list is required.")
+        if len(events) > self.max_batch_size:
+            raise ValidationError(
+                f"A batch can hold at most {self.max_batch_size} events."
+            )
+        try:
+            events = [(int(event["student"]), int(event["lesson"])) for event in events]
+        except (KeyError, TypeError, ValueError):
+            raise ValidationError("Each event needs a student and a lesson id.")
+        if settings.LMS_PROGRESS_WRITE_BEHIND:
+            get_progress_journal().append(events)
+            return Response({"queued": len(events)}, status=status.HTTP_202_ACCEPTED)
+        return Response(save_progress_batch(events))
+
+
+class LessonUploadsViewSet(viewsets.ViewSet):
+    """resumable chunked upload of a lesson media file, the lesson is created on finalize"""
+
+    def get_upload(self, course_pk, pk):
+        try:
+            return LessonUpload.objects.get(pk=pk, course_id=course_pk)
+        except LessonUpload.DoesNotExist:
+            raise NotFound("Upload not found.")
+
+    def create(self, request, course_pk=None):
+        try:
+            course = Course.objects.get(pk=course_pk)
+        except Course.DoesNotExist:
+            raise NotFound("Course not found.")
+        serializer = LessonUploadSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        upload = create_upload(course, **serializer.validated_data)
+        return Response(
+            LessonUploadSerializer(upload).data, status=status.HTTP_201_CREATED
+        )
+
+    def retrieve(self, request, course_pk=None, pk=None):
+        return Response(LessonUploadSerializer(self.get_upload(course_pk, pk)).data)
+
+    def upload_chunk(self, request, course_pk=None, pk=None):
+        """PATCH the raw chunk bytes with an Upload-Offset (and optional Upload-Checksum) header"""
+        upload = self.get_upload(course_pk, pk)
+        try:
+            offset = int(request.headers["Upload-Offset"])
+            length = int(request.headers["Content-Length"])
+        except (KeyError, ValueError):
+            raise ValidationError("Upload-Offset and Content-Length are required.")
+        write_chunk(
+            upload, offset, request.stream, length, request.headers.get("Upload-Checksum")
+        )
+        return Response(LessonUploadSerializer(upload).data)
+
+    def finalize(self, request, course_pk=None, pk=None):
+        lesson = finalize_upload(self.get_upload(course_pk, pk))
+        return Response(
+            LessonSerializer(lesson, context={"request": request}).data,
+            status=status.HTTP_201_CREATED,
+        )
+
+    def destroy(self, request, course_pk=None, pk=None):
+        discard_upload(self.get_upload(course_pk, pk))
+        return Response(status=status.HTTP_204_NO_CONTENT)
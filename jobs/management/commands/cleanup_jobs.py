@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from jobs.queue import cleanup_jobs
+
+
+class Command(BaseCommand):
+    help = "Delete finished background jobs and their result files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--max-age-hours", type=float, default=24 * 7,
+            help="Delete jobs finished longer ago than this.",
+        )
+
+    def handle(self, *args, **options):
+        count = cleanup_jobs(timedelta(hours=options["max_age_hours"]))
+        self.stdout.write(self.style.SUCCESS(f"Deleted {count} finished jobs."))
@@ -0,0 +1,33 @@
+import multiprocessing
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from jobs.worker import run_workers, stop_on_signals, work, worker_name
+
+
+class Command(BaseCommand):
+    help = "Run the queued background jobs in a pool of worker processes."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes", type=int, default=settings.LMS_JOBS["PROCESSES"],
+            help="Number of worker processes; 1 runs the jobs in this process.",
+        )
+        parser.add_argument(
+            "--burst", action="store_true",
+            help="Exit once no job is ready instead of waiting for new ones.",
+        )
+
+    def handle(self, *args, **options):
+        processes = options["processes"]
+        if processes < 1:
+            raise CommandError("--processes must be positive.")
+        stop = multiprocessing.Event()
+        stop_on_signals(stop)
+        self.stdout.write(f"Running jobs in {processes} processes.")
+        if processes == 1:
+            work(worker_name(0), stop, options["burst"])
+        else:
+            run_workers(processes, stop, options["burst"])
+        self.stdout.write(self.style.SUCCESS("Workers stopped."))
@@ -0,0 +1,191 @@
+"""A job queue stored in the database.
+
+Tasks are functions registered under a name with ``@task(name)``; they are
+called with the running ``Job`` (to report progress) and the keyword
+arguments given to ``enqueue``, which must be JSON serializable, and their
+return value is stored as the job result. A job enqueued inside a
+transaction only becomes visible to the workers when it commits.
+
+Workers claim the queued job with the highest priority (oldest first) with
+a conditional ``UPDATE``, so each job is claimed by one worker on any
+database without row locks. A failed job is retried after
+``RETRY_DELAY * 2 ** (attempts - 1)`` seconds until ``max_attempts``; tasks
+raise ``JobFailed`` to fail without retrying. Running jobs whose worker was
+not heard of for ``STALE_TIMEOUT`` seconds (killed or crashed) are retried
+as well, tasks are therefore expected to be safe to run again. While a task
+runs, a thread refreshes the heartbeat every ``HEARTBEAT_INTERVAL`` seconds,
+so long steps between progress reports do not make the job stale.
+"""
+
+import logging
+import threading
+import traceback
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+UNFINISHED = [Job.QUEUED, Job.RUNNING]
+
+
+class JobFailed(Exception):
+    """Raised by a task to fail its job without retrying it."""
+
+
+def task(name):
+    def register(func):
+        TASKS[name] = func
+        return func
+
+    return register
+
+
+def enqueue(name, priority=0, max_attempts=None, unique=False, **args):
+    """Queue the ``name`` task with ``args``.
+
+    With ``unique``, a queued or running job of the same task and arguments
+    is returned instead of queueing another one.
+    """
+    if name not in TASKS:
+        raise KeyError(f"Unknown task {name!r}.")
+    if unique:
+        job = Job.objects.filter(task=name, args=args, status__in=UNFINISHED).first()
+        if job is not None:
+            return job
+    return Job.objects.create(
+        task=name,
+        args=args,
+        priority=priority,
+        max_attempts=max_attempts or settings.LMS_JOBS["MAX_ATTEMPTS"],
+    )
+
+
+def get_result_path(job, extension):
+    """Where a task stores the file it produces (see ``file_result``)."""
+    result_dir = Path(settings.LMS_JOBS["RESULT_DIR"])
+    result_dir.mkdir(parents=True, exist_ok=True)
+    return result_dir / f"job-{job.pk}.{extension}"
+
+
+def file_result(path, filename, content_type):
+    """The result of a task producing a file, served at /api/jobs/<id>/download/."""
+    return {"file": Path(path).name, "filename": filename, "content_type": content_type}
+
+
+def claim_job(worker):
+    """Mark the next ready job as running by ``worker`` and return it, or None."""
+    now = timezone.now()
+    ready = (
+        Job.objects.filter(status=Job.QUEUED, run_after__lte=now)
+        .order_by("-priority", "id")
+        .values_list("pk", flat=True)
+    )
+    # another worker may claim a job between the select and the update
+    for pk in ready[:10]:
+        claimed = Job.objects.filter(pk=pk, status=Job.QUEUED).update(
+            status=Job.RUNNING,
+            worker=worker,
+            attempts=F("attempts") + 1,
+            started_at=now,
+            heartbeat_at=now,
+        )
+        if claimed:
+            return Job.objects.get(pk=pk)
+    return None
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=settings.LMS_JOBS["RETRY_DELAY"] * 2 ** (attempts - 1))
+
+
+@contextmanager
+def heartbeat(job):
+    """Refresh the heartbeat of the running ``job`` from a thread while the block runs."""
+    stop = threading.Event()
+    interval = settings.LMS_JOBS["HEARTBEAT_INTERVAL"]
+    running = Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker)
+
+    def beat():
+        try:
+            while not stop.wait(interval):
+                try:
+                    running.update(heartbeat_at=timezone.now())
+                except Exception:
+                    logger.exception("Heartbeat of job %s failed.", job.pk)
+        finally:
+            # the connections opened by this thread
+            connections.close_all()
+
+    thread = threading.Thread(target=beat, name=f"job-{job.pk}-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+
+
+def run_job(job):
+    """Run a claimed job and record its result, or its error and next attempt."""
+    running = Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker)
+    try:
+        func = TASKS.get(job.task)
+        if func is None:
+            raise JobFailed(f"Unknown task {job.task!r}.")
+        with heartbeat(job):
+            result = func(job, **job.args)
+    except Exception as error:
+        logger.exception("Job %s (%s) failed.", job.pk, job.task)
+        retry = not isinstance(error, JobFailed) and job.attempts < job.max_attempts
+        if retry:
+            running.update(
+                status=Job.QUEUED,
+                error=traceback.format_exc(),
+                run_after=timezone.now() + retry_delay(job.attempts),
+            )
+        else:
+            running.update(
+                status=Job.FAILED, error=traceback.format_exc(), finished_at=timezone.now()
+            )
+    else:
+        updates = {"status": Job.SUCCEEDED, "result": result, "finished_at": timezone.now()}
+        if job.progress_total is not None:
+            updates["progress"] = job.progress_total
+        running.update(**updates)
+
+
+def requeue_stale_jobs():
+    """Retry (or fail, after their last attempt) the running jobs of lost workers."""
+    cutoff = timezone.now() - timedelta(seconds=settings.LMS_JOBS["STALE_TIMEOUT"])
+    stale = Job.objects.filter(status=Job.RUNNING, heartbeat_at__lt=cutoff)
+    error = "The worker running the job stopped responding."
+    failed = stale.filter(attempts__gte=F("max_attempts")).update(
+        status=Job.FAILED, error=error, finished_at=timezone.now()
+    )
+    requeued = stale.filter(attempts__lt=F("max_attempts")).update(
+        status=Job.QUEUED, error=error, run_after=timezone.now()
+    )
+    return requeued + failed
+
+
+def cleanup_jobs(max_age):
+    """Delete the jobs finished more than ``max_age`` ago and their result files."""
+    cutoff = timezone.now() - max_age
+    finished = Job.objects.filter(
+        status__in=[Job.SUCCEEDED, Job.FAILED], finished_at__lt=cutoff
+    )
+    result_dir = Path(settings.LMS_JOBS["RESULT_DIR"])
+    for result in finished.exclude(result__isnull=True).values_list("result", flat=True):
+        if isinstance(result, dict) and "file" in result:
+            (result_dir / result["file"]).unlink(missing_ok=True)
+    count, _ = finished.delete()
+    return count
@@ -0,0 +1,22 @@
+from rest_framework import serializers
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Job
+        fields = [
+            "id",
+            "task",
+            "status",
+            "priority",
+            "attempts",
+            "max_attempts",
+            "progress",
+            "progress_total",
+            "result",
+            "error",
+            "created_at",
+            "started_at",
+            "finished_at",
+        ]
@@ -0,0 +1,235 @@
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APITestCase
+
+from jobs.models import Job
+from jobs.queue import (
+    JobFailed,
+    claim_job,
+    cleanup_jobs,
+    enqueue,
+    file_result,
+    get_result_path,
+    requeue_stale_jobs,
+    run_job,
+    task,
+)
+
+calls = []
+
+
+@task("tests.record")
+def record(job, value, total=2):
+    calls.append(value)
+    job.report_progress(1, total)
+    return {"value": value}
+
+
+@task("tests.flaky")
+def flaky(job, failures):
+    calls.append(job.attempts)
+    if job.attempts <= failures:
+        raise RuntimeError("Try again.")
+    return job.attempts
+
+
+@task("tests.broken")
+def broken(job):
+    raise JobFailed("Bad arguments.")
+
+
+@task("tests.file")
+def write_file(job, content):
+    path = get_result_path(job, "txt")
+    path.write_text(content)
+    return file_result(path, "report.txt", "text/plain")
+
+
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        jobs_settings = override_settings(
+            LMS_JOBS={**settings.LMS_JOBS, "RESULT_DIR": Path(tmp.name), "RETRY_DELAY": 10}
+        )
+        jobs_settings.enable()
+        self.addCleanup(jobs_settings.disable)
+
+    def run_next(self):
+        job = claim_job("test")
+        run_job(job)
+        job.refresh_from_db()
+        return job
+
+    def run_failing(self):
+        with self.assertLogs("jobs.queue", "ERROR"):
+            return self.run_next()
+
+    def test_unknown_task(self):
+        with self.assertRaises(KeyError):
+            enqueue("tests.missing")
+
+    def test_priority_then_age(self):
+        low = enqueue("tests.record", value=1)
+        high = enqueue("tests.record", priority=5, value=2)
+        later = enqueue("tests.record", value=3)
+        self.assertEqual(
+            [claim_job("test").pk for _ in range(3)], [high.pk, low.pk, later.pk]
+        )
+        self.assertIsNone(claim_job("test"))
+
+    def test_job_is_claimed_once(self):
+        job = enqueue("tests.record", value=1)
+        claimed = claim_job("first")
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.status, Job.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertEqual(claimed.worker, "first")
+        self.assertIsNone(claim_job("second"))
+
+    def test_result_and_progress(self):
+        enqueue("tests.record", value=7, total=4)
+        job = self.run_next()
+        self.assertEqual(calls, [7])
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, {"value": 7})
+        self.assertEqual((job.progress, job.progress_total), (4, 4))
+        self.assertIsNotNone(job.finished_at)
+
+    def test_retries_with_backoff(self):
+        enqueue("tests.flaky", max_attempts=3, failures=1)
+        job = self.run_failing()
+        self.assertEqual(job.status, Job.QUEUED)
+        self.assertIn("Try again.", job.error)
+        self.assertGreater(job.run_after, timezone.now() + timedelta(seconds=5))
+        # not ready before its retry delay
+        self.assertIsNone(claim_job("test"))
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        job = self.run_next()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.result, 2)
+        self.assertEqual(calls, [1, 2])
+
+    def test_fails_after_max_attempts(self):
+        enqueue("tests.flaky", max_attempts=2, failures=5)
+        self.run_failing()
+        Job.objects.update(run_after=timezone.now())
+        job = self.run_failing()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 2)
+
+    def test_job_failed_is_not_retried(self):
+        enqueue("tests.broken")
+        job = self.run_failing()
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn("Bad arguments.", job.error)
+
+    def test_unique(self):
+        job = enqueue("tests.record", unique=True, value=1)
+        self.assertEqual(enqueue("tests.record", unique=True, value=1).pk, job.pk)
+        self.assertNotEqual(enqueue("tests.record", unique=True, value=2).pk, job.pk)
+        self.run_next()
+        self.assertNotEqual(enqueue("tests.record", unique=True, value=1).pk, job.pk)
+
+    def test_stale_jobs_are_retried(self):
+        retried = enqueue("tests.record", value=1)
+        failed = enqueue("tests.record", max_attempts=1, value=2)
+        claim_job("lost")
+        claim_job("lost")
+        timeout = timedelta(seconds=settings.LMS_JOBS["STALE_TIMEOUT"] + 1)
+        Job.objects.update(heartbeat_at=timezone.now() - timeout)
+        self.assertEqual(requeue_stale_jobs(), 2)
+        retried.refresh_from_db()
+        failed.refresh_from_db()
+        self.assertEqual(retried.status, Job.QUEUED)
+        self.assertEqual(failed.status, Job.FAILED)
+
+    def test_run_workers_burst(self):
+        for value in range(3):
+            enqueue("tests.record", value=value)
+        enqueue("tests.broken")
+        with self.assertLogs("jobs.queue", "ERROR"):
+            call_command("run_workers", "--processes", "1", "--burst", stdout=StringIO())
+        self.assertEqual(sorted(calls), [0, 1, 2])
+        self.assertEqual(Job.objects.filter(status=Job.SUCCEEDED).count(), 3)
+        self.assertEqual(Job.objects.filter(status=Job.FAILED).count(), 1)
+
+    def test_cleanup_jobs(self):
+        enqueue("tests.file", content="report")
+        job = self.run_next()
+        path = Path(settings.LMS_JOBS["RESULT_DIR"]) / job.result["file"]
+        self.assertTrue(path.exists())
+        queued = enqueue("tests.record", value=1)
+        self.assertEqual(cleanup_jobs(timedelta(hours=1)), 0)
+        Job.objects.filter(pk=job.pk).update(finished_at=timezone.now() - timedelta(hours=2))
+        self.assertEqual(cleanup_jobs(timedelta(hours=1)), 1)
+        self.assertFalse(path.exists())
+        self.assertEqual(list(Job.objects.values_list("pk", flat=True)), [queued.pk])
+
+
+@task("tests.slow")
+def slow(job, seconds):
+    # no progress reported while it runs
+    time.sleep(seconds)
+
+
+@override_settings(LMS_JOBS={**settings.LMS_JOBS, "HEARTBEAT_INTERVAL": 0.05})
+class JobHeartbeatTests(TransactionTestCase):
+
+    def test_heartbeat_while_running(self):
+        enqueue("tests.slow", seconds=0.3)
+        job = claim_job("test")
+        run_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.SUCCEEDED)
+        self.assertEqual(job.progress, 0)
+        self.assertGreater(job.heartbeat_at, job.started_at + timedelta(seconds=0.1))
+
+
+class JobApiTests(APITestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        jobs_settings = override_settings(
+            LMS_JOBS={**settings.LMS_JOBS, "RESULT_DIR": Path(tmp.name)}
+        )
+        jobs_settings.enable()
+        self.addCleanup(jobs_settings.disable)
+
+    def test_status(self):
+        job = enqueue("tests.record", value=1)
+        response = self.client.get(f"/api/jobs/{job.pk}/")
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data["status"], Job.QUEUED)
+        self.assertEqual(response.data["task"], "tests.record")
+        run_job(claim_job("test"))
+        response = self.client.get(f"/api/jobs/{job.pk}/")
+        self.assertEqual(response.data["status"], Job.SUCCEEDED)
+        self.assertEqual(response.data["progress"], 2)
+        self.assertEqual(response.data["result"], {"value": 1})
+        response = self.client.get(f"/api/jobs/{job.pk + 1}/")
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_download(self):
+        job = enqueue("tests.file", content="report")
+        url = f"/api/jobs/{job.pk}/download/"
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_404_NOT_FOUND)
+        run_job(claim_job("test"))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(b"".join(response.streaming_content), b"report")
+        self.assertIn('filename="report.txt"', response["Content-Disposition"])
@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.http import FileResponse
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
+
+from .models import Job
+from .serializers import JobSerializer
+
+
+def accepted(request, job):
+    """The 202 response of a view handing its work to ``job``."""
+    url = reverse("jobs-detail", args=[job.pk], request=request)
+    return Response(
+        JobSerializer(job).data, status=status.HTTP_202_ACCEPTED, headers={"Location": url}
+    )
+
+
+class JobsViewSet(mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    queryset = Job.objects.all()
+    serializer_class = JobSerializer
+
+    @action(detail=True, methods=["GET"], url_path="download")
+    def download(self, request, pk=None):
+        """the file produced by the job"""
+        job = self.get_object()
+        if job.status != Job.SUCCEEDED or "file" not in (job.result or {}):
+            raise NotFound("The job has no file.")
+        path = Path(settings.LMS_JOBS["RESULT_DIR"]) / job.result["file"]
+        if not path.exists():
+            raise NotFound("The file of the job was deleted.")
+        return FileResponse(
+            path.open("rb"),
+            as_attachment=True,
+            filename=job.result["filename"],
+            content_type=job.result["content_type"],
+        )
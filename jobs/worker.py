@@ -0,0 +1,81 @@
+"""Worker processes running the queued jobs (see ``manage.py run_workers``)."""
+
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import time
+
+import django
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+from .queue import claim_job, requeue_stale_jobs, run_job
+
+logger = logging.getLogger(__name__)
+
+
+def work(name, stop, burst=False):
+    """Run jobs until ``stop`` is set, or until no job is ready with ``burst``."""
+    poll_interval = settings.LMS_JOBS["POLL_INTERVAL"]
+    while not stop.is_set():
+        close_old_connections()
+        job = claim_job(name)
+        if job is None:
+            if requeue_stale_jobs():
+                continue
+            if burst:
+                return
+            stop.wait(poll_interval)
+            continue
+        logger.info("%s running job %s (%s).", name, job.pk, job.task)
+        run_job(job)
+
+
+def worker_name(index):
+    return f"{socket.gethostname()}:{os.getpid()}:{index}"
+
+
+def stop_on_signals(stop):
+    # the running job is finished before exiting
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(signum, lambda *args: stop.set())
+
+
+def worker_process(index, stop, burst):
+    django.setup()
+    stop_on_signals(stop)
+    work(worker_name(index), stop, burst)
+
+
+def run_workers(processes, stop, burst=False):
+    """Run ``processes`` worker processes until ``stop`` is set, restarting the ones that die.
+
+    ``stop`` is a ``multiprocessing.Event``.
+    """
+    context = multiprocessing.get_context()
+    # connections must not be shared with the children
+    connections.close_all()
+    workers = {}
+
+    def start(index):
+        process = context.Process(
+            target=worker_process, args=(index, stop, burst), name=f"lms-worker-{index}"
+        )
+        process.start()
+        workers[index] = process
+
+    for index in range(processes):
+        start(index)
+    while workers:
+        for index, process in list(workers.items()):
+            if process.is_alive():
+                continue
+            del workers[index]
+            if process.exitcode and not stop.is_set():
+                logger.warning(
+                    "Worker %s exited with %s, restarting it.", index, process.exitcode
+                )
+                start(index)
+        time.sleep(0.2)
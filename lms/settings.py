@@ -38,6 +38,8 @@ INSTALLED_APPS = [
     "django.contrib.messages",
     "django.contrib.staticfiles",
     "courses",
+    "benchmarks",
+    "jobs",
 ]
 
 MIDDLEWARE = [
@@ -48,6 +50,8 @@ MIDDLEWARE = [
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
+    "courses.instrumentation.InstrumentationMiddleware",
+    "courses.routers.ReplicaRoutingMiddleware",
 ]
 
 ROOT_URLCONF = "lms.urls"
@@ -74,13 +78,49 @@ WSGI_APPLICATION = "lms.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# Connections are kept open for CONN_MAX_AGE seconds instead of one per
+# request. On PostgreSQL a connection pool can be used instead (Django 5.1+,
+# psycopg[pool]): "OPTIONS": {"pool": {"min_size": 2, "max_size": 10}} with
+# CONN_MAX_AGE = 0.
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
-    }
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
+        # the web server and the job workers write concurrently: transactions
+        # wait for the write lock up front instead of failing with "database
+        # is locked" when upgrading to it
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+    },
+    # local stand-in for a read replica: a copy of db.sqlite3, only used once
+    # listed in LMS_DATABASE_REPLICAS
+    "replica": {
+        "ENGINE": "django.db.backends.sqlite3",
+        "NAME": BASE_DIR / "replica.sqlite3",
+        "CONN_MAX_AGE": 60,
+        "CONN_HEALTH_CHECKS": True,
+        "TEST": {"MIRROR": "default"},
+    },
 }
 
+# Read replicas (see courses/routers.py): the GET requests of the viewset
+# actions in LMS_REPLICA_ACTIONS read from one of LMS_DATABASE_REPLICAS,
+# except for clients that wrote in the last LMS_REPLICA_STICKY_SECONDS.
+DATABASE_ROUTERS = ["courses.routers.ReplicaRouter"]
+LMS_DATABASE_REPLICAS = []
+LMS_REPLICA_ACTIONS = [
+    "list",
+    "retrieve",
+    "search",
+    "enrolled_students",
+    "students_progress",
+    "dashboard",
+    "analytics",
+    "export_progress",
+]
+LMS_REPLICA_STICKY_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -126,6 +166,94 @@ MEDIA_ROOT = BASE_DIR / "media"
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 REST_FRAMEWORK = {
-    "DEFAULT_PAGINATION_CLASS": "rest_framework.pagination.LimitOffsetPagination",
+    "DEFAULT_PAGINATION_CLASS": "courses.pagination.KeysetPagination",
     "PAGE_SIZE": 100,
+    "DEFAULT_RENDERER_CLASSES": [
+        "courses.renderers.FragmentJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+}
+
+# Write-behind mode for progress saving: save-progress only appends completion
+# events to a local SQLite journal and `manage.py flush_progress` writes them
+# to the database. Students progress reads merge the pending events.
+LMS_PROGRESS_WRITE_BEHIND = False
+LMS_PROGRESS_JOURNAL = BASE_DIR / "progress_journal.sqlite3"
+
+# Per-request query/latency instrumentation (Server-Timing headers, the
+# Prometheus histograms at /api/metrics/ and the slow query log).
+LMS_INSTRUMENTATION = {
+    "ENABLED": False,
+    # fraction of the requests that are instrumented
+    "SAMPLE_RATE": 1.0,
+    "SLOW_QUERY_MS": 100,
+}
+
+# Any cache backend works, e.g. for a cache shared by the workers of a host:
+# {"BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+#  "LOCATION": BASE_DIR / "cache"}
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Response cache for the course catalog, course details and lesson lists,
+# invalidated by model signals (see courses/cache.py).
+LMS_RESPONSE_CACHE = {
+    "ENABLED": True,
+    "ALIAS": "default",
+    "TIMEOUT": 300,
+    # seconds concurrent misses wait for the request recomputing a response
+    "LOCK_TIMEOUT": 10,
+}
+
+# Rendered JSON of the courses, lessons and students of list responses,
+# keyed by their row version (see courses/fragments.py): LOCAL_SIZE fragments
+# are kept in each process in front of the ALIAS cache.
+LMS_FRAGMENT_CACHE = {
+    "ENABLED": True,
+    "ALIAS": "default",
+    "TIMEOUT": 3600,
+    "LOCAL_SIZE": 10000,
+}
+
+# Lifetime of the cached student dashboards (/api/students/<id>/dashboard/),
+# invalidated when the student completes a lesson or (un)enrolls; course
+# renames and new lessons show up after at most this long. 0 disables it.
+LMS_DASHBOARD_CACHE_TIMEOUT = 30
+
+# Resumable chunked lesson uploads: part files are assembled in LMS_UPLOAD_DIR
+# and abandoned ones removed by `manage.py cleanup_uploads`.
+LMS_UPLOAD_DIR = BASE_DIR / "uploads"
+LMS_UPLOAD_MAX_SIZE = 10 * 1024**3
+LMS_UPLOAD_MAX_CHUNK_SIZE = 64 * 1024**2
+
+# Lesson media serving (/api/courses/<id>/lessons/<id>/media/): None streams
+# files from Django, "x-accel-redirect" (nginx, internal location at
+# LMS_MEDIA_ACCEL_PREFIX mapped to MEDIA_ROOT) or "x-sendfile" hand the
+# transfer to the web server.
+LMS_MEDIA_OFFLOAD = None
+LMS_MEDIA_ACCEL_PREFIX = "/protected-media/"
+LMS_MEDIA_ACCESS_CACHE_TIMEOUT = 60
+
+# Extract lesson media metadata (checksum, duration, page count) while the
+# upload request runs; when False only the type and size are set and a
+# background job (or the extract_media_metadata command) fills in the rest.
+LMS_MEDIA_METADATA_INLINE = True
+
+# Background jobs (see jobs/queue.py), run by `manage.py run_workers` in
+# PROCESSES worker processes polling the job table every POLL_INTERVAL
+# seconds. Failed jobs are retried after RETRY_DELAY, 2 * RETRY_DELAY, ...
+# seconds up to MAX_ATTEMPTS runs. Workers refresh the heartbeat of their
+# running job every HEARTBEAT_INTERVAL seconds, jobs without one for
+# STALE_TIMEOUT seconds are retried too. Exports are written to RESULT_DIR.
+LMS_JOBS = {
+    "PROCESSES": 2,
+    "POLL_INTERVAL": 1,
+    "MAX_ATTEMPTS": 3,
+    "RETRY_DELAY": 10,
+    "STALE_TIMEOUT": 600,
+    "HEARTBEAT_INTERVAL": 60,
+    "RESULT_DIR": BASE_DIR / "job_results",
 }
@@ -17,20 +17,35 @@ Including another URLconf
 
 from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
-from courses.views import CoursesViewSet, LessonsViewSet
+from courses import async_views
+from courses.instrumentation import metrics
+from jobs.views import JobsViewSet
+from courses.views import (
+    CoursesViewSet,
+    LessonsViewSet,
+    LessonUploadsViewSet,
+    ProgressViewSet,
+    StudentsViewSet,
+)
 from rest_framework import routers
 
 router = routers.DefaultRouter()
 
 router.register("courses", CoursesViewSet)
+router.register("progress", ProgressViewSet, basename="progress")
+router.register("students", StudentsViewSet, basename="students")
+router.register("jobs", JobsViewSet, basename="jobs")
 api_urls = [
     path("", include(router.urls)),
+    path("metrics/", metrics),
     path(
         "courses/<int:course_pk>/lessons/",
         LessonsViewSet.as_view({"get": "list", "post": "create"}),
     ),
+    path(
+        "courses/<int:course_pk>/lessons/bulk-import/",
+        LessonsViewSet.as_view({"post": "bulk_import"}),
+    ),
     path(
         "courses/<int:course_pk>/lessons/<int:pk>/",
         LessonsViewSet.as_view(
@@ -42,15 +57,39 @@ api_urls = [
             }
         ),
     ),
+    path(
+        "courses/<int:course_pk>/lessons/<int:pk>/media/",
+        LessonsViewSet.as_view({"get": "media"}),
+    ),
     path(
         "courses/<int:course_pk>/lessons/<int:lesson_pk>/save-progress/",
         LessonsViewSet.as_view({"post": "save_progress"}),
     ),
+    path(
+        "courses/<int:course_pk>/lessons/uploads/",
+        LessonUploadsViewSet.as_view({"post": "create"}),
+    ),
+    path(
+        "courses/<int:course_pk>/lessons/uploads/<uuid:pk>/",
+        LessonUploadsViewSet.as_view(
+            {"get": "retrieve", "patch": "upload_chunk", "delete": "destroy"}
+        ),
+    ),
+    path(
+        "courses/<int:course_pk>/lessons/uploads/<uuid:pk>/finalize/",
+        LessonUploadsViewSet.as_view({"post": "finalize"}),
+    ),
+]
+async_urls = [
+    path("courses/", async_views.course_list),
+    path("courses/<int:pk>/", async_views.course_detail),
+    path("courses/<int:course_pk>/lessons/", async_views.lesson_list),
+    path("courses/<int:pk>/enrolled-students/", async_views.enrolled_students),
+    path("courses/<int:pk>/students-progress/", async_views.students_progress),
 ]
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("api/async/", include(async_urls)),
     path("api/", include(api_urls)),
 ]
 
-
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)